@@ -0,0 +1,90 @@
+"""
+Per-update overhead of resolving handler arguments.
+Compares the compiled resolution plans with resolving through `inspect.signature` on every call,
+as it was done before the plans were introduced. The handlers of the bots are resolved with `resolve_async`,
+with a fresh cache of the `update` scope per update, so it's measured too.
+
+Run from the repository root:
+    python -m benchmarks.bench_resolve_args
+"""
+import asyncio
+import inspect
+import time
+import timeit
+
+from swiftbots import DependencyScope, depends
+from swiftbots.functions import (
+    DEPENDENCY_CACHES_KEY,
+    DependencyCache,
+    compile_resolution_plan,
+    is_dependable_param,
+    resolve_function_args,
+)
+
+
+def legacy_resolve_function_args(function, given_data: dict) -> dict:
+    sig = inspect.signature(function)
+    args = {}
+    for param in sig.parameters.values():
+        name = param.name
+        if is_dependable_param(param):
+            dep_func = param.default.dependency
+            dep_args = legacy_resolve_function_args(dep_func, given_data)
+            args[name] = dep_func(**dep_args)
+        elif name not in given_data:
+            raise AssertionError(f"Can't use parameter {param}")
+        else:
+            args[name] = given_data[name]
+    return args
+
+
+def get_config(name: str):
+    return {'bot': name}
+
+
+def get_repository(logger, config: dict = depends(get_config)):
+    return logger, config
+
+
+async def handler(message: str, chat, sender: int, repository=depends(get_repository), config=depends(get_config)):
+    ...
+
+
+async def measure_resolve_async(given_data: dict, number: int) -> float:
+    """Seconds per update. Every update gets its own cache of the `update` scope, as in the bots"""
+    plan = compile_resolution_plan(handler)
+    bot_cache = DependencyCache()
+    best = float('inf')
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(number):
+            update_cache = DependencyCache()
+            data = dict(given_data)
+            data[DEPENDENCY_CACHES_KEY] = {
+                DependencyScope.UPDATE: update_cache,
+                DependencyScope.BOT: bot_cache,
+                DependencyScope.APP: bot_cache,
+            }
+            await plan.resolve_async(data)
+            await update_cache.aclose()
+        best = min(best, time.perf_counter() - started)
+    return best / number
+
+
+def main(number: int = 100_000) -> None:
+    given_data = {
+        'name': 'bench', 'logger': None, 'message': 'add note', 'chat': None, 'sender': 1,
+        'raw_message': 'add note', 'arguments': 'note', 'args': 'note', 'command': 'add',
+    }
+    assert legacy_resolve_function_args(handler, given_data).keys() == resolve_function_args(handler, given_data).keys()
+
+    for title, function in (('inspect.signature per call', legacy_resolve_function_args),
+                            ('compiled resolution plan', resolve_function_args)):
+        best = min(timeit.repeat(lambda f=function: f(handler, given_data), number=number, repeat=5))
+        print(f'{title:>28}: {best / number * 1e6:.2f} us per update')
+    per_update = asyncio.run(measure_resolve_async(given_data, number))
+    print(f'{"resolve_async with caches":>28}: {per_update * 1e6:.2f} us per update')
+
+
+if __name__ == '__main__':
+    main()
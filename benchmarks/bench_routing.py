@@ -0,0 +1,215 @@
+"""
+Chat command routing at large command counts: compiling the commands, building the trie and routing messages.
+Command sets share prefixes and have aliases, messages have different lengths and Unicode content.
+Compares `route_command` with the regex search it replaced. Reports operations per second, p50 and p99
+latencies and the memory of the trie. Also measures "did you mean" suggestions for mistyped commands.
+Results are written as JSON to compare them across versions.
+
+Run from the repository root:
+    python -m benchmarks.bench_routing [--sizes 10 1000 50000] [--messages 5000] [--output routing.json]
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from swiftbots.message_handlers import (
+    ChatMessageHandler,
+    CompiledChatCommand,
+    Trie,
+    compile_chat_commands,
+    insert_trie,
+    route_command,
+    search_best_command_match,
+)
+from swiftbots.suggestions import CommandSuggestions
+
+# Shared first words make the commands share prefixes in the trie
+VERBS = ['add', 'get', 'set', 'remove', 'list', 'show', 'добавить', 'показать', 'größe', 'café', 'İstanbul', '予定']
+NOUNS = ['note', 'notes', 'task', 'tasks', 'reminder', 'user', 'заметку', 'задачу', 'straße', 'naïve', '日記']
+WORDS = ['apple', 'milk', 'Bread', 'молоко', 'хлеб', 'Ärger', 'ﬁne', '🍎', '🥛', 'tomorrow', 'в 10:00', 'ΣΊΣΥΦΟΣ']
+ARGUMENT_LENGTHS = [0, 20, 200, 4096, 65536]
+
+
+async def handler() -> None:
+    ...
+
+
+def generate_commands(count: int, rng: random.Random) -> list[ChatMessageHandler]:
+    """Handlers of `count` commands. Every fourth handler has an alias which is a prefix of its main command"""
+    handlers = []
+    names: set[str] = set()
+    while len(names) < count:
+        name = f'{rng.choice(VERBS)} {rng.choice(NOUNS)}'
+        if len(names) > len(VERBS) * len(NOUNS) // 2:
+            name = f'{name} {len(names)}'
+        if name in names:
+            continue
+        names.add(name)
+        commands = [name]
+        if len(names) % 4 == 0 and len(names) < count:
+            alias = name[:max(len(name) - 3, 1)]
+            if alias not in names:
+                names.add(alias)
+                commands.append(alias)
+        handlers.append(ChatMessageHandler(commands, handler, None, None))
+    return handlers
+
+
+def generate_messages(commands: list[str], count: int, rng: random.Random) -> list[str]:
+    messages = []
+    for i in range(count):
+        length = ARGUMENT_LENGTHS[i % len(ARGUMENT_LENGTHS)]
+        arguments = []
+        total = 0
+        while total < length:
+            word = rng.choice(WORDS)
+            arguments.append(word)
+            total += len(word) + 1
+        text = ' '.join(arguments)[:length]
+        if i % 10 == 0:
+            # Unknown command
+            messages.append(f'{rng.choice(WORDS)} {text}')
+        else:
+            command = rng.choice(commands)
+            messages.append(f'{command.upper() if i % 3 == 0 else command} {text}'.rstrip())
+    return messages
+
+
+def mistype(message: str, rng: random.Random) -> str:
+    """Swap, drop or replace a character of the command in the message"""
+    command, _, arguments = message.partition(' ')
+    if len(command) < 3:
+        return message
+    index = rng.randrange(len(command) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        command = command[:index] + command[index + 1] + command[index] + command[index + 2:]
+    elif kind == 1:
+        command = command[:index] + command[index + 1:]
+    else:
+        command = command[:index] + 'q' + command[index + 1:]
+    return f'{command} {arguments}'
+
+
+def build_trie(compiled: list[CompiledChatCommand]) -> Trie:
+    trie: Trie = {}
+    for command in compiled:
+        insert_trie(trie, command.command_name.lower(), command)
+    return trie
+
+
+def count_nodes(trie: Trie) -> int:
+    count = 0
+    stack = [trie]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(child for key, child in node.items() if isinstance(child, dict))
+    return count
+
+
+def measure(call: Callable[[Any], Any], items: list) -> dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        call_started = time.perf_counter_ns()
+        call(item)
+        latencies.append(time.perf_counter_ns() - call_started)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'ops_per_second': round(len(items) / elapsed),
+        'p50_us': round(latencies[len(latencies) // 2] / 1000, 3),
+        'p99_us': round(latencies[min(len(latencies) * 99 // 100, len(latencies) - 1)] / 1000, 3),
+    }
+
+
+def run_size(size: int, messages_count: int, seed: int) -> dict[str, Any]:
+    rng = random.Random(seed)
+    handlers = generate_commands(size, rng)
+    command_names = [command for h in handlers for command in h.commands]
+    messages = generate_messages(command_names, messages_count, rng)
+
+    started = time.perf_counter()
+    compiled = compile_chat_commands(handlers)
+    compile_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    trie = build_trie(compiled)
+    insert_seconds = time.perf_counter() - started
+
+    # Separate pass, tracing makes the allocations slower
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    traced_trie = build_trie(compiled)
+    trie_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del traced_trie
+
+    # The regex search misses commands whose lowercased form is longer, like `İstanbul`
+    disagreements = sum(search_best_command_match(trie, message.lower())[0] is not route_command(trie, message)[0]
+                        for message in messages)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    suggestions = CommandSuggestions(compiled)
+    suggestions_seconds = time.perf_counter() - started
+    suggestions_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    mistyped = [mistype(message, rng) for message in messages]
+
+    return {
+        'commands': len(compiled),
+        'messages': len(messages),
+        'average_message_length': round(sum(map(len, messages)) / len(messages)),
+        'compile_chat_commands': {'seconds': round(compile_seconds, 4),
+                                  'ops_per_second': round(len(compiled) / compile_seconds)},
+        'insert_trie': {'seconds': round(insert_seconds, 4),
+                        'ops_per_second': round(len(compiled) / insert_seconds)},
+        'trie': {'nodes': count_nodes(trie), 'memory_bytes': trie_bytes},
+        'routed_differently': disagreements,
+        'routing': {
+            'search_best_command_match': measure(lambda m: search_best_command_match(trie, m.lower()), messages),
+            'route_command': measure(lambda m: route_command(trie, m), messages),
+        },
+        'suggestions': {
+            'build_seconds': round(suggestions_seconds, 4),
+            'memory_bytes': suggestions_bytes,
+            'found': sum(bool(suggestions.suggest(message)) for message in mistyped),
+            **measure(suggestions.suggest, mistyped),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--output', help='write the JSON results to the file instead of stdout')
+    args = parser.parse_args()
+
+    results = {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'results': [run_size(size, args.messages, args.seed) for size in args.sizes],
+    }
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Local load harness for the Telegram webhook endpoint. Posts synthetic updates to a `WebhookServer`
+over keep-alive connections and reports requests per second. Telegram is never reached.
+The client writes pre-encoded requests to raw sockets, so it costs much less than the server it measures.
+
+Run from the repository root:
+    python -m benchmarks.bench_webhook [--requests 20000] [--connections 40]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from swiftbots.webhooks import WebhookConfig, WebhookServer
+
+SECRET = 'benchmark-secret'
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'from': {'id': update_id % 1000, 'username': f'user{update_id % 1000}'},
+            'chat': {'id': update_id % 1000, 'type': 'private'},
+            'date': 1700000000,
+            'text': f'add note number {update_id}',
+        },
+    }
+
+
+def build_request(path: str, update: dict) -> bytes:
+    body = json.dumps(update).encode()
+    head = (f'POST {path} HTTP/1.1\r\n'
+            f'Host: localhost\r\n'
+            f'Content-Type: application/json\r\n'
+            f'X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n')
+    return head.encode() + body
+
+
+async def run(requests: int, connections: int) -> dict:
+    config = WebhookConfig(url='https://localhost/webhook', host='127.0.0.1', port=0, secret_token=SECRET)
+    updates: asyncio.Queue[dict] = asyncio.Queue(maxsize=config.queue_size)
+    server = WebhookServer(config, on_update=updates.put)
+    await server.start()
+
+    async def consume() -> None:
+        # Stands for the handlers: takes the updates as fast as possible
+        while True:
+            await updates.get()
+
+    consumer = asyncio.create_task(consume())
+    requests_bytes = [build_request(config.path, make_update(i)) for i in range(requests)]
+
+    async def worker(offset: int) -> None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        for i in range(offset, requests, connections):
+            writer.write(requests_bytes[i])
+            status_line = await reader.readline()
+            assert status_line.startswith(b'HTTP/1.1 200'), status_line
+            # Responses have no body, so just skip the headers
+            while await reader.readline() != b'\r\n':
+                pass
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    consumer.cancel()
+    await server.close()
+    return {
+        'requests': requests,
+        'connections': connections,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(requests / elapsed),
+        'received': server.received,
+        'refused': server.refused,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--connections', type=int, default=40)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.connections)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -34,12 +34,12 @@ async def send_async(message, user):
     await print_async(message)
 
 
-@calc_bot.message_handler(commands=['+', 'add'])
-async def add(message: str, logger: ILogger, chat: calc_bot.Chat,
+# `add two 2` is answered with `Usage: add <num1:int> <num2:int>` and the handler isn't called
+@calc_bot.message_handler(commands=['+', 'add'], parse_arguments=True)
+async def add(num1: int, num2: int, logger: ILogger, chat: calc_bot.Chat,
               calculator: CalculatorService = depends(get_calculator_service)):
-    await logger.debug_async(f'User is requesting ADD operation: {message}')
-    num1, num2 = message.split(' ')
-    result = calculator.add(int(num1), int(num2))
+    await logger.debug_async(f'User is requesting ADD operation: {num1} {num2}')
+    result = calculator.add(num1, num2)
     await chat.reply_async(str(result))
 
 
@@ -1,5 +1,9 @@
 from swiftbots.tasks.triggers import PeriodTrigger as PeriodTrigger
+from swiftbots.tasks.triggers import CronTrigger as CronTrigger
+from swiftbots.tasks.triggers import DateTrigger as DateTrigger
 from swiftbots.functions import depends as depends
+from swiftbots.types import DependencyScope as DependencyScope
+from swiftbots.types import RestOfLine as RestOfLine
 from swiftbots.bots import (Bot as Bot,
                             StubBot as StubBot,
                             ChatBot as ChatBot,
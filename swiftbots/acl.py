@@ -0,0 +1,126 @@
+__all__ = [
+    'AccessList',
+    'RoleRegistry',
+]
+
+import json
+import os
+from collections.abc import Iterable, Mapping
+from typing import Optional, Union
+
+EMPTY_ROLE: frozenset[str] = frozenset()
+
+
+def normalize_user(user: Union[str, int]) -> str:
+    return str(user).casefold()
+
+
+def compile_users(users: Iterable[Union[str, int]]) -> frozenset[str]:
+    return frozenset(map(normalize_user, users))
+
+
+def compile_roles(roles: Mapping[str, Iterable[Union[str, int]]]) -> dict[str, frozenset[str]]:
+    for role, users in roles.items():
+        assert isinstance(role, str), 'Role name must be a string'
+        assert not isinstance(users, (str, int)), f'Users of role `{role}` must be a list'
+    return {role: compile_users(users) for role, users in roles.items()}
+
+
+class RoleRegistry:
+    """
+    Named groups of users, which many commands can refer to. E.g. `{"moderators": ["alice", 12345]}`.
+    Roles are replaced as a whole: a new dict of frozensets is built aside and then swapped,
+    so concurrent access checks see either the old roles or the new ones, never a mix.
+    """
+
+    def __init__(self, roles: Optional[Mapping[str, Iterable[Union[str, int]]]] = None, path: Optional[str] = None):
+        """
+        :param roles: users of each role.
+        :param path: JSON file with an object of roles and their users, loaded immediately.
+            It isn't watched. Call `reload_if_changed` to load it again when it's modified.
+        """
+        self.__roles: dict[str, frozenset[str]] = compile_roles(roles or {})
+        self.path = path
+        self.__modified_at: Optional[int] = None
+        if path is not None:
+            self.load(path)
+
+    @property
+    def roles(self) -> dict[str, frozenset[str]]:
+        """The current roles. Don't change the dict, use `set_roles` instead"""
+        return self.__roles
+
+    def get(self, role: str) -> frozenset[str]:
+        """Users of the role. An unknown role has no users"""
+        return self.__roles.get(role, EMPTY_ROLE)
+
+    def set_roles(self, roles: Mapping[str, Iterable[Union[str, int]]]) -> None:
+        self.__roles = compile_roles(roles)
+
+    def load(self, path: str) -> None:
+        """
+        Replace the roles with the ones from the JSON file.
+        If the file is broken, an exception is raised and the old roles are kept.
+        """
+        modified_at = os.stat(path).st_mtime_ns
+        with open(path, encoding='utf-8') as file:
+            roles = json.load(file)
+        assert isinstance(roles, dict), f'File {path} must contain an object of roles'
+        self.set_roles(roles)
+        self.path = path
+        self.__modified_at = modified_at
+
+    def reload_if_changed(self) -> bool:
+        """
+        Load the file again if it's modified since the last load. It's never called by the bots themselves,
+        the app decides how often to check. E.g. with a task of a bot:
+
+            @bot.task(PeriodTrigger(seconds=30))
+            def reload_roles():
+                roles.reload_if_changed()
+
+        :returns: whether the roles are reloaded.
+        """
+        assert self.path is not None, 'Roles are not loaded from a file'
+        if os.stat(self.path).st_mtime_ns == self.__modified_at:
+            return False
+        self.load(self.path)
+        return True
+
+
+class AccessList:
+    """
+    Users and roles allowed to (or banned from) a command. One list is shared by all aliases of the command.
+    Checking a user costs one set lookup per referenced role, whatever the number of users.
+    """
+    __slots__ = ('registry', 'role_names', 'users')
+
+    def __init__(self,
+                 users: Optional[Iterable[Union[str, int]]] = None,
+                 role_names: Optional[Iterable[str]] = None,
+                 registry: Optional[RoleRegistry] = None):
+        self.users = compile_users(users or ())
+        self.role_names = tuple(role_names or ())
+        assert not self.role_names or registry is not None, 'Roles can be used only with a role registry'
+        self.registry = registry
+
+    def __contains__(self, user: object) -> bool:
+        """:param user: normalized by `normalize_user`"""
+        if user in self.users:
+            return True
+        if self.role_names and self.registry is not None:
+            # The same snapshot for all the roles, even if they are reloaded meanwhile
+            roles = self.registry.roles
+            for role in self.role_names:
+                if user in roles.get(role, EMPTY_ROLE):
+                    return True
+        return False
+
+
+def build_access_list(users: Optional[Iterable[Union[str, int]]],
+                      role_names: Optional[Iterable[str]],
+                      registry: Optional[RoleRegistry]) -> Optional[AccessList]:
+    """None if neither users nor roles are given, i.e. there is no such restriction"""
+    if users is None and role_names is None:
+        return None
+    return AccessList(users, role_names, registry)
@@ -1,11 +1,11 @@
 import asyncio
 import random
+from datetime import datetime
 from typing import Any, Optional
 
-import httpx
-
-from swiftbots.all_types import ExitApplicationException, StartBotException
-from swiftbots.runners import get_all_tasks
+from swiftbots.all_types import ExitApplicationException, StartBotException, TaskStats
+from swiftbots.http_clients import HttpClientRegistry, get_default_http_clients
+from swiftbots.runners import get_all_tasks, get_scheduler
 
 
 def shutdown_app() -> None:
@@ -65,34 +65,78 @@ async def start_bot_async(bot_name: str) -> int:
     return 2
 
 
+async def get_task_stats_async() -> list[TaskStats]:
+    """
+    :returns: statistics of the tasks scheduled in the running app: next fire time, last start and end,
+    durations, failures and lateness. An empty list if no app is running.
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return []
+    return sorted(scheduler.get_task_stats(), key=lambda stats: stats.name)
+
+
+def format_task_stats(stats: list[TaskStats]) -> str:
+    """Make a text report of the tasks for an admin"""
+    def format_time(moment: Optional[datetime]) -> str:
+        return moment.astimezone().strftime('%Y-%m-%d %H:%M:%S') if moment is not None else '-'
+
+    if not stats:
+        return 'No tasks scheduled'
+    lines = []
+    for task in stats:
+        durations = task.durations
+        lines.append(
+            f"{task.name}: next {format_time(task.next_fire)}, last start {format_time(task.last_start)}, "
+            f"last end {format_time(task.last_end)}\n"
+            f"  runs {task.runs}, failures {task.failures}, timeouts {task.timeouts}, running {task.running}, "
+            f"queued {task.queued}, skipped {task.skipped}, coalesced {task.coalesced}\n"
+            f"  duration mean {durations.mean:.3f}s, p95 {durations.quantile(0.95):.3f}s, max {durations.max:.3f}s; "
+            f"lateness {task.lateness:.3f}s, max {task.max_lateness:.3f}s"
+        )
+    return '\n'.join(lines)
+
+
 async def send_telegram_message_async(
-    message: str, admin: str, token: str, data: Optional[dict[str, Any]] = None
+    message: str,
+    admin: str,
+    token: str,
+    data: Optional[dict[str, Any]] = None,
+    http_clients: Optional[HttpClientRegistry] = None,
 ) -> None:
+    """
+    :param http_clients: pooled clients to send with. The default shared registry if not given.
+    """
     if data is None:
         data = {}
 
     is_traceback = "Traceback" in message and "parse_mode" not in data
-    async with httpx.AsyncClient() as session:
-        messages = [message[i : i + 4096] for i in range(0, len(message), 4096)]
-        for msg in messages:
-            send_data = {
-                "chat_id": admin,
-                "text": f"```\n{msg}\n```" if is_traceback else msg,
-            }
-            if is_traceback:
-                send_data["parse_mode"] = "markdown"
-            send_data.update(data)
-            await session.post(
-                f"https://api.telegram.org/bot{token}/sendMessage", json=send_data
-            )
+    session = (http_clients or get_default_http_clients()).get_async_client()
+    messages = [message[i : i + 4096] for i in range(0, len(message), 4096)]
+    for msg in messages:
+        send_data = {
+            "chat_id": admin,
+            "text": f"```\n{msg}\n```" if is_traceback else msg,
+        }
+        if is_traceback:
+            send_data["parse_mode"] = "markdown"
+        send_data.update(data)
+        await session.post(
+            f"https://api.telegram.org/bot{token}/sendMessage", json=send_data
+        )
 
 
 def send_telegram_message(
-    message: str, admin: str, token: str, data: Optional[dict[str, Any]] = None
+    message: str,
+    admin: str,
+    token: str,
+    data: Optional[dict[str, Any]] = None,
+    http_clients: Optional[HttpClientRegistry] = None,
 ) -> None:
     if data is None:
         data = {}
     is_traceback = "Traceback" in message and "parse_mode" not in data
+    session = (http_clients or get_default_http_clients()).get_client()
     messages = [message[i : i + 4096] for i in range(0, len(message), 4096)]
     for msg in messages:
         send_data = {
@@ -102,35 +146,47 @@ def send_telegram_message(
         if is_traceback:
             send_data["parse_mode"] = "markdown"
         send_data.update(data)
-        httpx.post(f"https://api.telegram.org/bot{token}/sendMessage", json=send_data)
+        session.post(f"https://api.telegram.org/bot{token}/sendMessage", json=send_data)
 
 
 async def send_vk_message_async(
-    message: str, admin: str, token: str, data: Optional[dict[str, Any]] = None
+    message: str,
+    admin: str,
+    token: str,
+    data: Optional[dict[str, Any]] = None,
+    http_clients: Optional[HttpClientRegistry] = None,
 ) -> None:
+    """
+    :param http_clients: pooled clients to send with. The default shared registry if not given.
+    """
     if data is None:
         data = {}
-    async with httpx.AsyncClient() as session:
-        messages = [message[i : i + 4096] for i in range(0, len(message), 4096)]
-        for msg in messages:
-            send_data = {
-                "user_id": admin,
-                "message": msg,
-                "random_id": random.randint(-(2 ** 31), 2 ** 31),
-                "dont_parse_links": 1,
-            }
-            send_data.update(data)
-            url = (
-                f"https://api.vk.com/method/messages.send?v=5.199&access_token={token}"
-            )
-            await session.post(url=url, data=send_data)
+    session = (http_clients or get_default_http_clients()).get_async_client()
+    messages = [message[i : i + 4096] for i in range(0, len(message), 4096)]
+    for msg in messages:
+        send_data = {
+            "user_id": admin,
+            "message": msg,
+            "random_id": random.randint(-(2 ** 31), 2 ** 31),
+            "dont_parse_links": 1,
+        }
+        send_data.update(data)
+        url = (
+            f"https://api.vk.com/method/messages.send?v=5.199&access_token={token}"
+        )
+        await session.post(url=url, data=send_data)
 
 
 def send_vk_message(
-    message: str, admin: str, token: str, data: Optional[dict[str, Any]] = None
+    message: str,
+    admin: str,
+    token: str,
+    data: Optional[dict[str, Any]] = None,
+    http_clients: Optional[HttpClientRegistry] = None,
 ) -> None:
     if data is None:
         data = {}
+    session = (http_clients or get_default_http_clients()).get_client()
     messages = [message[i : i + 4096] for i in range(0, len(message), 4096)]
     for msg in messages:
         send_data = {
@@ -141,4 +197,4 @@ def send_vk_message(
         }
         send_data.update(data)
 
-        httpx.post(f"https://api.vk.com/method/messages.send?v=5.199&access_token={token}", json=send_data)
+        session.post(f"https://api.vk.com/method/messages.send?v=5.199&access_token={token}", json=send_data)
@@ -2,3 +2,4 @@ from swiftbots.all_types._loggers import *
 from swiftbots.all_types._exceptions import *
 from swiftbots.all_types._triggers import *
 from swiftbots.all_types._schedulers import *
+from swiftbots.all_types._job_stores import *
@@ -0,0 +1,40 @@
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Optional
+
+
+class JobState:
+    """What a scheduler remembers about a task between restarts"""
+
+    def __init__(self, last_fire: Optional[datetime], next_fire: Optional[datetime]):
+        """
+        :param last_fire: when the task was called the last time. Aware datetime.
+        :param next_fire: when the task must be called the next time. None if it's unknown yet.
+        """
+        self.last_fire = last_fire
+        self.next_fire = next_fire
+
+
+class IJobStore(ABC):
+    @abstractmethod
+    def load(self, name: str) -> Optional[JobState]:
+        """Return the saved state of the task, None if the task has never been scheduled"""
+        ...
+
+    @abstractmethod
+    def save(self, name: str, state: JobState) -> None:
+        """Remember the state of the task"""
+        ...
+
+    def save_many(self, states: Mapping[str, JobState]) -> None:
+        """
+        Remember the states of several tasks. Schedulers save the states in batches from a worker thread,
+        so the stores that can write a batch at once override it.
+        """
+        for name, state in states.items():
+            self.save(name, state)
+
+    def close(self) -> None:
+        """Release the resources of the store"""
+        ...
@@ -1,11 +1,91 @@
+import bisect
 from abc import ABC, abstractmethod
 from collections.abc import Callable
-from typing import TYPE_CHECKING, Any
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Optional
 
 if TYPE_CHECKING:
     from swiftbots.tasks import TaskInfo
 
 
+class DurationHistogram:
+    """Durations of calls counted by buckets. The upper bounds of the buckets are in seconds"""
+    bounds = (0.01, 0.1, 1., 10., 60., 600.)
+
+    def __init__(self) -> None:
+        # The last bucket counts the durations above the last bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile of the durations, e.g. 0.95.
+        :returns: the upper bound of the bucket the quantile falls in, never more than the longest duration.
+        """
+        assert 0 <= q <= 1, 'Quantile must be between 0 and 1'
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def copy(self) -> 'DurationHistogram':
+        histogram = DurationHistogram()
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.max = self.max
+        return histogram
+
+
+class TaskStats:
+    """What a scheduler knows about a task. Times are aware datetimes, durations are in seconds"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.next_fire: Optional[datetime] = None
+        self.last_start: Optional[datetime] = None
+        self.last_end: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.durations = DurationHistogram()
+        # Calls started, calls raised an exception or timed out, calls timed out
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        # Calls running now, waiting for the running ones, and skipped by the overlap policy
+        self.running = 0
+        self.queued = 0
+        self.skipped = 0
+        # Fires of a period missed because the scheduler was late, merged into one call
+        self.coalesced = 0
+        # How much later than scheduled the last call started, and the worst of it
+        self.lateness = 0.
+        self.max_lateness = 0.
+        self.group: Optional[str] = None
+        # The group of the task is paused
+        self.paused = False
+
+    def copy(self) -> 'TaskStats':
+        stats = TaskStats(self.name)
+        stats.__dict__.update(self.__dict__)
+        stats.durations = self.durations.copy()
+        return stats
+
+
 class IScheduler(ABC):
     @abstractmethod
     def add_task(self,
@@ -27,6 +107,42 @@ class IScheduler(ABC):
         """Return a list of tasks which now are scheduled"""
         ...
 
+    def add_job(self, job_id: str, fire_time: datetime, caller: Callable[[], Any]) -> None:
+        """
+        Call the caller once at `fire_time`, an aware datetime. A pending job with the same id is replaced.
+        Jobs are added at runtime and aren't kept between restarts.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} doesn't support one-shot jobs")
+
+    def cancel_job(self, job_id: str) -> bool:
+        """
+        Forget the pending job.
+        :returns: False if there is no such job, e.g. it has been called already.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} doesn't support one-shot jobs")
+
+    def pause_group(self, group: str) -> bool:
+        """
+        Stop calling the tasks of the group. They keep their schedule, and the calls missed while the group
+        is paused are merged into one call on resume. Calls running now aren't cancelled.
+        :returns: False if the scheduler doesn't know the group, e.g. it doesn't support groups.
+        """
+        return False
+
+    def resume_group(self, group: str) -> bool:
+        """
+        Call the tasks of the paused group again.
+        :returns: False if the scheduler doesn't know the group.
+        """
+        return False
+
+    def get_task_stats(self) -> list[TaskStats]:
+        """
+        Return the statistics of the scheduled tasks.
+        A scheduler that doesn't collect them returns only the names of the tasks.
+        """
+        return [TaskStats(name) for name in self.list_tasks()]
+
     @abstractmethod
     async def start(self) -> None:
         """
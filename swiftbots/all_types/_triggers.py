@@ -1,10 +1,18 @@
 from abc import ABC, abstractmethod
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Optional
 
 
 class ITrigger(ABC):
-    ...
+    @abstractmethod
+    def get_next_fire_time(self, after: datetime) -> Optional[datetime]:
+        """
+        The first moment strictly after `after` when the trigger fires.
+        A scheduler calls it once per fire, so it must compute the moment directly, without checking every tick.
+        :param after: an aware datetime, or a naive one in the local time.
+        :returns: an aware datetime, or None if the trigger won't fire anymore.
+        """
+        ...
 
 
 class IPeriodTrigger(ITrigger, ABC):
@@ -4,17 +4,29 @@ from typing import Any, Optional, Union
 from swiftbots.all_types import ILogger, ILoggerFactory, IScheduler
 from swiftbots.app.container import AppContainer
 from swiftbots.bots import Bot, build_scheduler
+from swiftbots.executors import ExecutorRegistry
+from swiftbots.functions import DependencyCache
+from swiftbots.http_clients import HttpClientRegistry, get_default_http_clients
 from swiftbots.loggers import SysIOLoggerFactory
 from swiftbots.runners import run_async
-from swiftbots.tasks.schedulers import SimpleScheduler
+from swiftbots.tasks.schedulers import HeapScheduler
 
 
 class SwiftBots:
     def __init__(self,
                  logger_factory: Optional[ILoggerFactory] = None,
                  scheduler: Optional[IScheduler] = None,
-                 runner: Optional[Callable[[AppContainer], Any]] = None
+                 runner: Optional[Callable[[AppContainer], Any]] = None,
+                 http_clients: Optional[HttpClientRegistry] = None,
+                 executors: Optional[ExecutorRegistry] = None
                  ):
+        """
+        :param scheduler: runs the tasks of the bots. `HeapScheduler` by default.
+        :param http_clients: pooled HTTP clients shared by all the bots.
+            By default, the registry shared with `admin_utils` functions is used.
+        :param executors: thread and process pools for synchronous handlers and tasks.
+            The app creates its own pools by default and shuts them down when it's closed.
+        """
         assert logger_factory is None or isinstance(
             logger_factory, ILoggerFactory
         ), "Logger factory must be of type ILoggerFactory"
@@ -22,8 +34,11 @@ class SwiftBots:
         self.__bots: dict[str, Bot] = {}
         self.__logger_factory: ILoggerFactory = logger_factory or SysIOLoggerFactory()
         self.__logger: ILogger = self.__logger_factory.get_logger()
-        self.__scheduler: IScheduler = scheduler or SimpleScheduler()
+        self.__scheduler: IScheduler = scheduler or HeapScheduler(logger=self.__logger)
         self.__runner: Callable[[AppContainer], Any] = runner or run_async
+        self.__dependency_cache = DependencyCache()
+        self.__http_clients = http_clients or get_default_http_clients()
+        self.__executors = executors or ExecutorRegistry()
 
     def add_bot(self, bot: Bot) -> None:
         assert isinstance(bot, Bot), "Bot must be of type Bot or an inherited class"
@@ -36,6 +51,9 @@ class SwiftBots:
         assert 'listener_func' in members, 'You have to set a listener or use different type of a bot'
         assert 'handler_func' in members, 'You have to set a handler or use different type of a bot'
 
+        bot.app_dependency_cache = self.__dependency_cache
+        bot.http_clients = self.__http_clients
+        bot.executors = self.__executors
         self.__bots[bot.name] = bot
 
     def add_bots(self, bots: Union[Bot, list[Bot]]) -> None:
@@ -58,6 +76,7 @@ class SwiftBots:
         bots = list(self.__bots.values())
 
         build_scheduler(bots, self.__scheduler)
-        app_container = AppContainer(bots, self.__logger, self.__scheduler)
+        app_container = AppContainer(bots, self.__logger, self.__scheduler,
+                                     self.__dependency_cache, self.__http_clients, self.__executors)
 
         self.__runner(app_container)
@@ -1,4 +1,8 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
+
+from swiftbots.executors import ExecutorRegistry, get_default_executors
+from swiftbots.functions import DependencyCache
+from swiftbots.http_clients import HttpClientRegistry, get_default_http_clients
 
 if TYPE_CHECKING:
     from swiftbots.all_types import ILogger, IScheduler
@@ -6,7 +10,17 @@ if TYPE_CHECKING:
 
 
 class AppContainer:
-    def __init__(self, bots: list['Bot'], logger: 'ILogger', scheduler: 'IScheduler') -> None:
+    def __init__(self,
+                 bots: list['Bot'],
+                 logger: 'ILogger',
+                 scheduler: 'IScheduler',
+                 dependency_cache: Optional[DependencyCache] = None,
+                 http_clients: Optional[HttpClientRegistry] = None,
+                 executors: Optional[ExecutorRegistry] = None) -> None:
         self.bots = bots
         self.logger = logger
         self.scheduler = scheduler
+        # Dependencies with `app` scope
+        self.dependency_cache = dependency_cache or DependencyCache()
+        self.http_clients = http_clients or get_default_http_clients()
+        self.executors = executors or get_default_executors()
@@ -1,10 +1,12 @@
 import asyncio
 import random
-from collections.abc import AsyncGenerator, Callable, Coroutine
+import re
+from collections.abc import AsyncGenerator, Callable, Coroutine, Iterable
 from typing import Any, Optional, TypeVar, Union
 
 import httpx
 
+from swiftbots.acl import RoleRegistry
 from swiftbots.all_types import (
     ExitBotException,
     ILogger,
@@ -14,41 +16,78 @@ from swiftbots.all_types import (
     RestartListeningException,
 )
 from swiftbots.chats import Chat, TelegramChat, VkChat
+from swiftbots.executors import ExecutorKind, ExecutorRegistry, build_offloaded_function, get_default_executors
 from swiftbots.functions import (
+    BOT_DEPENDENCY_NAMES,
+    DependencyCache,
     call_raisable_function_async,
+    compile_resolution_plan,
     decompose_bot_as_dependencies,
     generate_name,
-    resolve_function_args,
 )
+from swiftbots.http_clients import get_default_http_clients
+from swiftbots.ingress import IngressQueue, OverflowPolicy
+from swiftbots.limiters import RateLimiter
 from swiftbots.loggers import SysIOLoggerFactory
 from swiftbots.message_handlers import (
+    CHAT_HANDLER_DEPENDENCY_NAMES,
+    ArgumentParser,
     ChatMessageHandler,
     CompiledChatCommand,
+    Trie,
     compile_chat_commands,
     handle_message,
-    Trie,
     insert_trie,
 )
-from swiftbots.tasks.tasks import TaskInfo
+from swiftbots.outbox import Outbox
+from swiftbots.suggestions import CommandSuggestions
+from swiftbots.tasks.planner import TaskPlanner
+from swiftbots.tasks.tasks import MisfirePolicy, OverlapPolicy, PeriodMode, TaskInfo
 from swiftbots.types import AsyncListenerFunction, AsyncSenderFunction, DecoratedCallable
+from swiftbots.webhooks import WebhookConfig, WebhookServer
+
+# The server can't be reached, or all the connections of the pool are busy. The listener waits and tries again
+CONNECTION_ERRORS = (httpx.ConnectError, httpx.PoolTimeout)
 
 
 class Bot:
     """Base class for all other types of bots.
     This bot can only have a listener, a handler or tasks"""
+    # The name of the listener output field. If the bot handles updates concurrently,
+    # the updates with the same value of this field are handled one after another.
+    dispatch_key: Optional[str] = None
+    # Names of the fields the listener yields, if they are known in advance.
+    # Used to check the handler parameters before the app starts
+    update_keys: Optional[frozenset[str]] = None
     listener_func: AsyncListenerFunction
     handler_func: DecoratedCallable
     task_infos: list[TaskInfo]
+    # The queue between the listener and the handlers. Exists while the bot is listening, if `ingress_capacity` is set
+    ingress_queue: Optional[IngressQueue] = None
     __logger: ILogger
 
     def __init__(
             self,
             name: Optional[str] = None,
             bot_logger_factory: Optional[ILoggerFactory] = None,
+            max_concurrency: Optional[int] = None,
+            ingress_capacity: Optional[int] = None,
+            overflow_policy: Union[OverflowPolicy, str] = OverflowPolicy.BLOCK,
     ):
+        """
+        :param max_concurrency: if set, the listener keeps pulling updates while the previous ones are handled,
+            and up to `max_concurrency` handlers run at the same time. By default, updates are handled one by one.
+        :param ingress_capacity: if set, updates are put into a queue of this size between the listener
+            and the handlers, so the listener isn't held back by the handlers during a burst.
+        :param overflow_policy: what to do with an update when the ingress queue is full.
+        """
         assert bot_logger_factory is None or isinstance(
             bot_logger_factory, ILoggerFactory
         ), "Logger must be of type ILoggerFactory"
+        assert max_concurrency is None or (isinstance(max_concurrency, int) and max_concurrency >= 1), \
+            'max_concurrency must be a positive integer'
+        assert ingress_capacity is None or (isinstance(ingress_capacity, int) and ingress_capacity >= 1), \
+            'ingress_capacity must be a positive integer'
 
         self.task_infos = list()
         self.name: str = name or generate_name()
@@ -56,6 +95,19 @@ class Bot:
         self.__logger = bot_logger_factory.get_logger()
         self.__logger.bot_name = self.name
         self.__is_enabled = True
+        self.max_concurrency = max_concurrency
+        self.ingress_capacity = ingress_capacity
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        # Dependencies with `bot` scope
+        self.dependency_cache = DependencyCache()
+        # Dependencies with `app` scope. The app shares its cache with all its bots
+        self.app_dependency_cache = DependencyCache()
+        # Pooled HTTP clients. The app shares its registry with all its bots
+        self.http_clients = get_default_http_clients()
+        # Thread and process pools for synchronous handlers and tasks. The app shares its pools with all its bots
+        self.executors: ExecutorRegistry = get_default_executors()
+        # One-shot calls scheduled at runtime
+        self.planner = TaskPlanner(self)
 
     @property
     def logger(self) -> ILogger:
@@ -71,29 +123,72 @@ class Bot:
     def enable(self) -> None:
         self.__is_enabled = True
 
-    def listener(self) -> Callable[[DecoratedCallable], DecoratedCallable]:
+    def listener(self, update_keys: Optional[Iterable[str]] = None) -> Callable[[DecoratedCallable], DecoratedCallable]:
+        """
+        :param update_keys: names of the fields of the updates the listener yields. If given, the parameters
+            of the handlers are checked against them when the app starts, not when the first update comes.
+        """
         def wrapper(func: DecoratedCallable) -> DecoratedCallable:
             self.listener_func = func
+            if update_keys is not None:
+                self.update_keys = frozenset(update_keys)
             return func
 
         return wrapper
 
-    def handler(self) -> Callable[[DecoratedCallable], DecoratedCallable]:
+    def handler(self,
+                executor: Optional[Union[ExecutorKind, str]] = None
+                ) -> Callable[[DecoratedCallable], DecoratedCallable]:
+        """
+        :param executor: run a synchronous handler in the `thread` or `process` pool of the app.
+        """
         def wrapper(func: DecoratedCallable) -> DecoratedCallable:
-            self.handler_func = func
+            compile_resolution_plan(func)
+            self.handler_func = self._offload(func, executor)
             return func
 
         return wrapper
 
+    def _offload(self,
+                 func: Callable[..., Any],
+                 executor: Optional[Union[ExecutorKind, str]]) -> Callable[..., Any]:
+        """Make the function run in the executor of the app, if it's given. Arguments are resolved as usual"""
+        if executor is None:
+            return func
+        return build_offloaded_function(func, executor, lambda: self.executors)
+
     def task(
             self,
             triggers: Union[ITrigger, list[ITrigger]],
             run_at_start: bool = False,
-            name: Optional[str] = None
+            name: Optional[str] = None,
+            max_instances: int = 1,
+            overlap: Union[OverlapPolicy, str] = OverlapPolicy.SKIP,
+            period_mode: Union[PeriodMode, str] = PeriodMode.FIXED_RATE,
+            misfire_policy: Union[MisfirePolicy, str] = MisfirePolicy.CATCH_UP_ONCE,
+            misfire_grace_time: float = 0.,
+            executor: Optional[Union[ExecutorKind, str]] = None,
+            timeout: Optional[float] = None,
+            max_timeouts: Optional[int] = None,
     ) -> Callable[[DecoratedCallable], TaskInfo]:
         """
         Mark a bot method as a task.
         Will be executed by SwiftBots automatically.
+        :param max_instances: how many calls of the task can run at the same time.
+        :param overlap: what to do if the task fires while `max_instances` of its calls are still running:
+            skip this time, queue the call or run it anyway.
+        :param period_mode: count a period from the previous fire time (fixed rate)
+            or from the end of the previous call (fixed delay).
+        The next parameters matter if the scheduler has a job store, so it remembers the tasks between restarts.
+        Then `run_at_start` fires only if the task has never been called.
+        :param misfire_policy: call the task once at the start if a fire was missed while the app was down,
+            or skip the missed fires.
+        :param misfire_grace_time: a fire late by no more than this number of seconds isn't treated as missed.
+        :param executor: run a synchronous task in the `thread` or `process` pool of the app.
+        :param timeout: cancel a call that runs longer than this number of seconds.
+            The default timeout of the scheduler is used if None. A call in the executor can't be interrupted,
+            only the waiting for it is cancelled.
+        :param max_timeouts: remove the task from the scheduler after this many timeouts in a row.
         """
         assert isinstance(triggers, ITrigger) or isinstance(triggers, list), \
             'Trigger must be the type of ITrigger or a list of ITriggers'
@@ -107,15 +202,32 @@ class Bot:
         assert isinstance(name, str), 'Name must be a string'
 
         def wrapper(func: DecoratedCallable) -> TaskInfo:
+            compile_resolution_plan(func)
             task_info = TaskInfo(name=name,
-                                 func=func,
+                                 func=self._offload(func, executor),
                                  triggers=triggers if isinstance(triggers, list) else [triggers],
-                                 run_at_start=run_at_start)
+                                 run_at_start=run_at_start,
+                                 max_instances=max_instances,
+                                 overlap=overlap,
+                                 period_mode=period_mode,
+                                 misfire_policy=misfire_policy,
+                                 misfire_grace_time=misfire_grace_time,
+                                 timeout=timeout,
+                                 max_timeouts=max_timeouts,
+                                 group=self.name)
             self.task_infos.append(task_info)
             return task_info
 
         return wrapper
 
+    async def drop_update_async(self, update: dict, policy: OverflowPolicy) -> None:
+        """
+        Called when the update is thrown away because the ingress queue is full.
+        """
+        await self.logger.warning_async(
+            f"Bot {self.name} is overloaded. An update was dropped by `{policy.value}` policy"
+        )
+
     async def before_start_async(self) -> None:
         """
         Do something right before the app starts.
@@ -123,10 +235,12 @@ class Bot:
         Use it like `super().before_start_async()`.
         """
         # TODO: do assert, check if listener_func is exist in self
-        ...
+        if self.update_keys is not None:
+            handler_names = BOT_DEPENDENCY_NAMES | self.update_keys | {'all_deps'}
+            compile_resolution_plan(self.handler_func).check(handler_names)
 
     async def before_close_async(self) -> None:
-        ...
+        await self.dependency_cache.aclose()
 
 
 class StubBot(Bot):
@@ -155,12 +269,20 @@ class StubBot(Bot):
 
 class ChatBot(Bot):
     Chat = TypeVar('Chat', bound=Chat)
+    # Messages of one user are handled in order, even if `max_concurrency` is set
+    dispatch_key = 'sender'
     _sender_func: AsyncSenderFunction
     _compiled_chat_commands: list[CompiledChatCommand]
     _default_handler_func: Optional[DecoratedCallable] = None
     _message_handlers: list[ChatMessageHandler]
     _admin: Optional[str] = None
     _trie: Trie
+    # Index of the command names for typo suggestions. Built on start if `suggest_commands` is set
+    _suggestions: Optional[CommandSuggestions] = None
+    # Replies waiting to be sent in the background. Created on start if `outbox_capacity` is set
+    outbox: Optional[Outbox] = None
+    # How many busy replies can be sent at the same time. The others are not sent, the bot is overloaded anyway
+    max_busy_replies = 100
 
     def __init__(self,
                  name: Optional[str] = None,
@@ -169,11 +291,47 @@ class ChatBot(Bot):
                  chat_unknown_error_message: str = "Unknown command",
                  chat_refuse_message: str = "Access forbidden",
                  admin: Optional[Union[int, str]] = None,
+                 max_concurrency: Optional[int] = None,
+                 ingress_capacity: Optional[int] = None,
+                 overflow_policy: Union[OverflowPolicy, str] = OverflowPolicy.BLOCK,
+                 chat_busy_message: str = "Too many requests. Try again later",
+                 outbox_capacity: Optional[int] = None,
+                 outbox_workers: int = 16,
+                 roles: Optional[RoleRegistry] = None,
+                 suggest_commands: bool = False,
+                 chat_suggestion_message: str = "Unknown command. Did you mean: {commands}?",
                  ):
-        super().__init__(name=name, bot_logger_factory=bot_logger_factory)
+        """
+        :param outbox_capacity: if set, the requests to the chats are queued in the outbox.
+            `chat.enqueue_async` doesn't wait for the message to be sent and returns a future of the result,
+            `chat.reply_async` and editing or deleting messages wait for their turn.
+            Requests are sent in order within a chat and in parallel across chats.
+            The outbox holds up to `outbox_capacity` requests, a new one waits if it's full.
+        :param outbox_workers: how many messages of the outbox can be sent at the same time.
+        :param roles: named groups of users for `whitelist_roles` and `blacklist_roles` of the message handlers.
+            One registry can be shared by several bots. Reload it to change the access without a restart.
+        :param suggest_commands: if a message matches no command and there is no default handler,
+            suggest the commands similar to the mistyped one, instead of `chat_unknown_error_message`.
+        :param chat_suggestion_message: the reply with suggestions. `{commands}` is replaced with the commands.
+        """
+        assert outbox_capacity is None or isinstance(outbox_capacity, int) and outbox_capacity >= 1, \
+            'outbox_capacity must be a positive integer or None'
+        super().__init__(name=name,
+                         bot_logger_factory=bot_logger_factory,
+                         max_concurrency=max_concurrency,
+                         ingress_capacity=ingress_capacity,
+                         overflow_policy=overflow_policy)
         self._message_handlers = list()
+        # Busy replies being sent, one per sender. The listener doesn't wait for them
+        self._busy_replies: dict[Union[str, int], asyncio.Task] = {}
         self._admin = admin
         self._trie = {}
+        self._chat_busy_message = chat_busy_message
+        self._outbox_capacity = outbox_capacity
+        self._outbox_workers = outbox_workers
+        self.roles = roles if roles is not None else RoleRegistry()
+        self._suggest_commands = suggest_commands
+        self._chat_suggestion_message = chat_suggestion_message
 
         def handler(message: str, sender: Union[str, int], all_deps: dict[str, Any]) -> Coroutine:
             chat = Chat(
@@ -183,7 +341,8 @@ class ChatBot(Bot):
                 logger=self.logger,
                 error_message=chat_error_message,
                 unknown_message=chat_unknown_error_message,
-                refuse_message=chat_refuse_message
+                refuse_message=chat_refuse_message,
+                outbox=self.outbox
             )
             all_deps['chat'] = chat
             return self.overridden_handler(message=message, chat=chat, all_deps=all_deps)
@@ -194,23 +353,53 @@ class ChatBot(Bot):
                         commands: list[str],
                         admin_only: bool = False,
                         whitelist_users: Optional[list[Union[str, int]]] = None,
-                        blacklist_users: Optional[list[Union[str, int]]] = None) -> DecoratedCallable:
+                        blacklist_users: Optional[list[Union[str, int]]] = None,
+                        executor: Optional[Union[ExecutorKind, str]] = None,
+                        whitelist_roles: Optional[list[str]] = None,
+                        blacklist_roles: Optional[list[str]] = None,
+                        parse_arguments: bool = False,
+                        pattern: Optional[Union[str, re.Pattern]] = None,
+                        usage: Optional[str] = None) -> DecoratedCallable:
         """
         :param commands: commands, that will fire the method. For example: ['add', '+']. Message "add 2 2" will execute in this method.
         :param admin_only: only admin will be able to use this command. If True, whitelist_users list will be ignored.
+            Can't be combined with blacklists, which have a privilege upon whitelists and would let other users in.
         :param whitelist_users: the only users from the list will be able to use this command. If admin_only = True, then whitelist_users will be ignored.
         :param blacklist_users: the users from list won't be able to use this command. blacklist has a privilege upon whitelist.
+        :param executor: run a synchronous handler in the `thread` or `process` pool of the app.
+            A `process` handler gets only picklable arguments, so it can't take `chat`.
+        :param whitelist_roles: names of the roles from `roles` of the bot, whose users are also allowed.
+            Ignored if admin_only = True.
+        :param blacklist_roles: names of the roles from `roles` of the bot, whose users are also banned.
+        :param parse_arguments: parse the arguments into the parameters of the handler, which aren't given by the bot.
+            E.g. `async def add(chat: bot.Chat, count: int, name: str, note: RestOfLine)`. See `ArgumentParser`.
+            If the arguments don't fit, the user gets the usage reply, and the handler isn't called.
+        :param pattern: a regular expression which must match the arguments.
+            Its named groups are parsed into the parameters of the same names. Implies `parse_arguments`.
+        :param usage: the reply if the arguments can't be parsed. By default, the command and its arguments are listed.
         """
         assert isinstance(commands, list), 'Commands must be a list of strings'
         assert len(commands) > 0, 'Empty list of commands'
         for command in commands:
             assert isinstance(command, str), 'Command must be a string'
+        assert not admin_only or blacklist_users is None and blacklist_roles is None, \
+            "admin_only command can't have blacklist_users or blacklist_roles, only the admin can use it anyway"
 
         def wrapper(func: DecoratedCallable) -> ChatMessageHandler:
+            parser = None
+            if parse_arguments or pattern is not None:
+                # Chat bots always give the sender, other names of the listener output are known for some bots
+                reserved_names = BOT_DEPENDENCY_NAMES | CHAT_HANDLER_DEPENDENCY_NAMES | {'sender'}
+                parser = ArgumentParser(func, pattern, reserved_names | (self.update_keys or set()))
             handler = ChatMessageHandler(commands=commands,
-                                         function=func,
+                                         function=self._offload(func, executor),
                                          whitelist_users=whitelist_users if not admin_only else [self._admin],
-                                         blacklist_users=blacklist_users)
+                                         blacklist_users=blacklist_users,
+                                         whitelist_roles=whitelist_roles if not admin_only else None,
+                                         blacklist_roles=blacklist_roles,
+                                         roles=self.roles,
+                                         parser=parser,
+                                         usage=usage)
             self._message_handlers.append(handler)
             return handler
 
@@ -223,31 +412,89 @@ class ChatBot(Bot):
 
         return wrapper
 
-    def default_handler(self) -> DecoratedCallable:
+    def default_handler(self, executor: Optional[Union[ExecutorKind, str]] = None) -> DecoratedCallable:
+        """
+        :param executor: run a synchronous handler in the `thread` or `process` pool of the app.
+        """
         def wrapper(func: DecoratedCallable) -> ChatMessageHandler:
-            self._default_handler_func = func
+            compile_resolution_plan(func)
+            self._default_handler_func = self._offload(func, executor)
             return func
 
         return wrapper
 
+    async def drop_update_async(self, update: dict, policy: OverflowPolicy) -> None:
+        await super().drop_update_async(update, policy)
+        if policy == OverflowPolicy.REPLY_BUSY and 'sender' in update:
+            sender = update['sender']
+            if sender in self._busy_replies or len(self._busy_replies) >= self.max_busy_replies:
+                # The sender is being told already, or too many replies are being sent
+                return
+            chat = Chat(
+                sender=sender,
+                message=update.get('message', ''),
+                function_sender=self._sender_func,
+                logger=self.logger,
+                error_message='',
+                unknown_message='',
+                refuse_message='',
+                busy_message=self._chat_busy_message,
+                outbox=self.outbox
+            )
+            # Sending can wait for a rate limiter, and the listener must keep shedding the load meanwhile
+            self._busy_replies[sender] = asyncio.create_task(self.__send_busy_reply_async(chat))
+
+    async def __send_busy_reply_async(self, chat: Chat) -> None:
+        try:
+            await call_raisable_function_async(chat.busy_async, self)
+        finally:
+            del self._busy_replies[chat.sender]
+
     def overridden_handler(self, message: str, chat: Chat, all_deps: dict[str, Any]) -> Coroutine:
-        return handle_message(message, chat, self._trie, self._default_handler_func, all_deps)
+        return handle_message(message, chat, self._trie, self._default_handler_func, all_deps, self._suggestions)
 
     async def before_start_async(self) -> None:
         await super().before_start_async()
+        if self._outbox_capacity is not None:
+            self.outbox = Outbox(self._sender_func, self.logger, self._outbox_capacity, self._outbox_workers)
         # TODO: do assert, check if listener_func is exist in self
         self._compiled_chat_commands = compile_chat_commands(self._message_handlers)
         self._message_handlers.clear()
         for command in self._compiled_chat_commands:
             insert_trie(self._trie, command.command_name.lower(), command)
+        if self._suggest_commands:
+            self._suggestions = CommandSuggestions(self._compiled_chat_commands, self._chat_suggestion_message)
+
+        if self.update_keys is not None:
+            handler_names = BOT_DEPENDENCY_NAMES | self.update_keys | CHAT_HANDLER_DEPENDENCY_NAMES
+            for command in self._compiled_chat_commands:
+                command.plan.check(handler_names if command.parser is None else handler_names | command.parser.names)
+            if self._default_handler_func is not None:
+                compile_resolution_plan(self._default_handler_func).check(handler_names)
+
+    async def before_close_async(self) -> None:
+        for task in list(self._busy_replies.values()):
+            task.cancel()
+        if self.outbox is not None:
+            # Don't lose the replies that are not sent yet
+            await self.outbox.flush()
+            self.outbox = None
+        await super().before_close_async()
 
 
 class TelegramBot(ChatBot):
     Chat = TypeVar('Chat', bound=TelegramChat)
+    update_keys = frozenset(("message", "photo", "sender", "message_id", "username", "raw_update"))
     __token: str
     __http_session: httpx.AsyncClient
+    # Long polling holds a connection for minutes, so it has a pool of its own
+    __polling_session: httpx.AsyncClient
     __first_time_launched = True
     ALLOWED_UPDATES = ["messages"]
+    # The local server receiving updates, while the bot listens in webhook mode
+    webhook_server: Optional[WebhookServer] = None
+    # How many times a request is repeated after Telegram answered "Too Many Requests"
+    FLOOD_RETRIES = 3
 
     def __init__(self,
                  token: str,
@@ -259,15 +506,48 @@ class TelegramBot(ChatBot):
                  chat_error_message: str = "Error occurred",
                  chat_unknown_error_message: str = "Unknown command",
                  chat_refuse_message: str = "Access forbidden",
+                 max_concurrency: Optional[int] = None,
+                 ingress_capacity: Optional[int] = None,
+                 overflow_policy: Union[OverflowPolicy, str] = OverflowPolicy.BLOCK,
+                 chat_busy_message: str = "Too many requests. Try again later",
+                 outbox_capacity: Optional[int] = None,
+                 outbox_workers: int = 16,
+                 updates_batch_size: int = 100,
+                 webhook: Optional[WebhookConfig] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 roles: Optional[RoleRegistry] = None,
+                 suggest_commands: bool = False,
+                 chat_suggestion_message: str = "Unknown command. Did you mean: {commands}?",
                  ):
+        """
+        :param updates_batch_size: how many updates are requested from Telegram at once, from 1 to 100.
+        :param webhook: if set, the bot receives updates with a webhook instead of long polling.
+        :param rate_limiter: paces requests to Telegram. By default, 30 requests per second
+            and 1 message per second to a chat with short bursts, as Telegram recommends.
+        """
+        assert webhook is None or isinstance(webhook, WebhookConfig), "webhook must be of type WebhookConfig"
+        assert isinstance(updates_batch_size, int) and 1 <= updates_batch_size <= 100, \
+            'updates_batch_size must be an integer from 1 to 100'
         super().__init__(name=name,
                          bot_logger_factory=bot_logger_factory,
-                         admin=admin)
+                         admin=admin,
+                         max_concurrency=max_concurrency,
+                         ingress_capacity=ingress_capacity,
+                         overflow_policy=overflow_policy,
+                         chat_busy_message=chat_busy_message,
+                         outbox_capacity=outbox_capacity,
+                         outbox_workers=outbox_workers,
+                         roles=roles,
+                         suggest_commands=suggest_commands,
+                         chat_suggestion_message=chat_suggestion_message)
         self.__token = token
         self.__greeting_enabled = greeting_enabled
         self._sender_func = self._send_async
         self.__should_skip_old_updates = skip_old_updates
-        self.listener_func = self.telegram_listener
+        self.__updates_batch_size = updates_batch_size
+        self.__webhook = webhook
+        self.__rate_limiter = rate_limiter or RateLimiter(rate=30, burst=30, chat_rate=1, chat_burst=3)
+        self.listener_func = self.telegram_listener if webhook is None else self.telegram_webhook_listener
 
         def handler(message: str,
                     sender: Union[str, int],
@@ -286,6 +566,7 @@ class TelegramBot(ChatBot):
                 error_message=chat_error_message,
                 unknown_message=chat_unknown_error_message,
                 refuse_message=chat_refuse_message,
+                outbox=self.outbox,
             )
             all_deps['chat'] = chat
             return self.overridden_handler(message, chat, all_deps)
@@ -309,15 +590,34 @@ class TelegramBot(ChatBot):
             timeout: float = 30.,
     ) -> dict:
         url = f"https://api.telegram.org/bot{self.__token}/{method}"
-        response = await self.__http_session.post(url=url, json=data, headers=headers, timeout=timeout)
-
-        answer = response.json()
+        chat = data.get("chat_id")
+        session = self.__polling_session if method == "getUpdates" else self.__http_session
+        # Long polling isn't paced, it's a single request waiting for updates
+        paced = method != "getUpdates"
+        flood_retries = 0
+        while True:
+            if paced:
+                await self.__rate_limiter.acquire(chat)
+            response = await session.post(url=url, json=data, headers=headers, timeout=timeout)
+            answer = response.json()
+            if answer["ok"] or answer.get("error_code") != 429 or flood_retries >= self.FLOOD_RETRIES:
+                break
+            # Too many requests. Telegram tells how long to wait
+            retry_after = float(answer.get("parameters", {}).get("retry_after", 1))
+            self.__rate_limiter.retry_after(retry_after, chat)
+            flood_retries += 1
+            await self.logger.warning_async(
+                f"{self.name} is asked by Telegram to wait {retry_after} seconds before `{method}`"
+            )
+            if not paced:
+                # The limiter doesn't hold this request back, so it waits by itself
+                await asyncio.sleep(retry_after)
 
         if not answer["ok"] and not ignore_errors:
             state = await self._handle_error_async(answer)
             if state == 0:  # repeat request
                 await asyncio.sleep(4)
-                response = await self.__http_session.post(
+                response = await session.post(
                     url=url, json=data, headers=headers, timeout=timeout
                 )
                 answer = response.json()
@@ -336,14 +636,42 @@ class TelegramBot(ChatBot):
                     if data:
                         yield data
 
-            except httpx.ConnectError:
+            except CONNECTION_ERRORS:
                 await self._handle_server_connection_error_async()
 
+    async def telegram_webhook_listener(self) -> None:
+        """
+        https://core.telegram.org/bots/api#setwebhook
+        Runs a local HTTP server and registers it as the bot webhook.
+        """
+        config = self.__webhook
+        assert config is not None, 'Webhook is not configured'
+        updates: asyncio.Queue[dict] = asyncio.Queue(maxsize=config.queue_size)
+        self.webhook_server = WebhookServer(config, on_update=updates.put)
+        await self.webhook_server.start()
+        try:
+            await self.fetch_async("setWebhook", {
+                "url": config.url,
+                "secret_token": config.secret_token,
+                "max_connections": config.max_connections,
+                "allowed_updates": self.ALLOWED_UPDATES,
+                "drop_pending_updates": self.__should_skip_old_updates,
+            })
+            if self.__greeting_enabled and self._admin is not None:
+                await self._sender_func(f"{self.name} is started!", self._admin)
+
+            while True:
+                update = await updates.get()
+                data = await self._deconstruct_message_async(update)
+                if data:
+                    yield data
+        finally:
+            await self.webhook_server.close()
+
     async def _deconstruct_message_async(self, update: dict) -> Union[dict, None]:
         """
         https://core.telegram.org/bots/api#message
         """
-        update = update["result"][0]
         if "message" in update:
             message = update["message"]
             sender = message["from"]["id"]
@@ -383,8 +711,10 @@ class TelegramBot(ChatBot):
         """
         Long Polling: Telegram BOT API https://core.telegram.org/bots/api
         """
+        # Telegram refuses `getUpdates` with 409 Conflict while a webhook is set, e.g. by a previous run
+        await self.fetch_async("deleteWebhook", {"drop_pending_updates": False})
         timeout = 1000
-        data = {"timeout": timeout, "limit": 1, "allowed_updates": self.ALLOWED_UPDATES}
+        data = {"timeout": timeout, "limit": self.__updates_batch_size, "allowed_updates": self.ALLOWED_UPDATES}
         if self.__first_time_launched or self.__should_skip_old_updates:
             self.first_time_launched = False
             data["offset"] = await self._skip_old_updates_async()
@@ -399,9 +729,12 @@ class TelegramBot(ChatBot):
                     raise ExitBotException(
                         f"Error {ans} while recieving long polling server"
                     )
-            if len(ans["result"]) != 0:
-                data["offset"] = ans["result"][0]["update_id"] + 1
-                yield ans
+            updates = ans["result"]
+            if len(updates) != 0:
+                # The whole batch is confirmed with the next request
+                data["offset"] = updates[-1]["update_id"] + 1
+                for update in updates:
+                    yield update
 
     async def _handle_error_async(self, error: dict) -> int:
         """
@@ -418,6 +751,10 @@ class TelegramBot(ChatBot):
         if error_code in (400, 403, 404, 406, 303) or 500 <= error_code <= 599:
             await self.logger.error_async(msg)
             return 1
+        # too many requests, and retries didn't help
+        elif error_code == 429:
+            await self.logger.error_async(msg)
+            return 1
         # too many requests (flood)
         elif error_code == 420:
             await self.logger.error_async(
@@ -448,21 +785,21 @@ class TelegramBot(ChatBot):
             return result[0]["update_id"] + 1
         return -1
 
-    async def before_close_async(self) -> None:
-        await super().before_close_async()
-        if not self.__http_session.is_closed:
-            await self.__http_session.aclose()
-
     async def before_start_async(self) -> None:
         await super().before_start_async()
-        self.__http_session = httpx.AsyncClient()
+        # The clients are shared with other bots and closed by the app
+        self.__http_session = self.http_clients.get_async_client()
+        self.__polling_session = self.http_clients.get_async_client(f'long polling {self.name}')
 
 
 class VkontakteBot(ChatBot):
     Chat = TypeVar('Chat', bound=VkChat)
+    update_keys = frozenset(("message", "sender", "message_id"))
     _group_id: int
     __default_headers: dict
     __http_session: httpx.AsyncClient
+    # Long polling holds a connection for minutes, so it has a pool of its own
+    __polling_session: httpx.AsyncClient
     __first_time_launched = True
     ALLOWED_UPDATES = ["messages"]
 
@@ -477,10 +814,32 @@ class VkontakteBot(ChatBot):
                  chat_error_message: str = "Error occurred",
                  chat_unknown_error_message: str = "Unknown command",
                  chat_refuse_message: str = "Access forbidden",
-                 api_version: str = "5.199"):
+                 api_version: str = "5.199",
+                 max_concurrency: Optional[int] = None,
+                 ingress_capacity: Optional[int] = None,
+                 overflow_policy: Union[OverflowPolicy, str] = OverflowPolicy.BLOCK,
+                 chat_busy_message: str = "Too many requests. Try again later",
+                 outbox_capacity: Optional[int] = None,
+                 outbox_workers: int = 16,
+                 roles: Optional[RoleRegistry] = None,
+                 suggest_commands: bool = False,
+                 chat_suggestion_message: str = "Unknown command. Did you mean: {commands}?",
+                 rate_limiter: Optional[RateLimiter] = None):
+        """
+        :param rate_limiter: paces requests to VK. By default, 20 requests per second.
+        """
         super().__init__(name=name,
                          bot_logger_factory=bot_logger_factory,
-                         admin=None if admin is None else int(admin))
+                         admin=None if admin is None else int(admin),
+                         max_concurrency=max_concurrency,
+                         ingress_capacity=ingress_capacity,
+                         overflow_policy=overflow_policy,
+                         chat_busy_message=chat_busy_message,
+                         outbox_capacity=outbox_capacity,
+                         outbox_workers=outbox_workers,
+                         roles=roles,
+                         suggest_commands=suggest_commands,
+                         chat_suggestion_message=chat_suggestion_message)
         self.__token = token
         self._group_id = int(group_id)
         self.__greeting_enabled = greeting_enabled
@@ -488,6 +847,8 @@ class VkontakteBot(ChatBot):
         self.__should_skip_old_updates = skip_old_updates
         self.listener_func = self.vk_listener
         self.__API_VERSION = api_version
+        # VK allows 20 requests per second with a community token
+        self.__rate_limiter = rate_limiter or RateLimiter(rate=20, burst=20)
         self.__default_headers = {"Authorization": f"Bearer {token}"}
 
         def handler(message: str,
@@ -504,6 +865,7 @@ class VkontakteBot(ChatBot):
                 error_message=chat_error_message,
                 unknown_message=chat_unknown_error_message,
                 refuse_message=chat_refuse_message,
+                outbox=self.outbox,
             )
             all_deps['chat'] = chat
             return self.overridden_handler(message, chat, all_deps)
@@ -553,6 +915,7 @@ class VkontakteBot(ChatBot):
         if headers is not None:
             request_headers.update(headers)
 
+        await self.__rate_limiter.acquire()
         response = await self.__http_session.post(
             url=url, data=data, headers=request_headers, timeout=timeout
         )
@@ -561,7 +924,10 @@ class VkontakteBot(ChatBot):
         if "error" in answer and not ignore_errors:
             state = await self._handle_error_async(answer)
             if state == 0:  # repeat request
-                await asyncio.sleep(5)
+                if answer["error"]["error_code"] != 6:
+                    await asyncio.sleep(5)
+                # The limiter was told to slow down, so it keeps the pace
+                await self.__rate_limiter.acquire()
                 response = await self.__http_session.post(
                     url=url, data=data, headers=request_headers, timeout=timeout
                 )
@@ -582,7 +948,7 @@ class VkontakteBot(ChatBot):
                     if data:
                         yield data
 
-            except httpx.ConnectError:
+            except CONNECTION_ERRORS:
                 await self._handle_server_connection_error_async()
 
     async def _deconstruct_message_async(self, update: dict) -> dict:
@@ -632,7 +998,7 @@ class VkontakteBot(ChatBot):
         timeout = "25"
         while True:
             url = f"{server}?act=a_check&key={key}&ts={ts}&wait={timeout}"
-            ans = await self.__http_session.post(url=url, timeout=float(timeout)*2)
+            ans = await self.__polling_session.post(url=url, timeout=float(timeout)*2)
             result = ans.json()
             if "updates" in result:
                 updates = result["updates"]
@@ -692,10 +1058,10 @@ class VkontakteBot(ChatBot):
             return 1
         # too many requests
         elif error_code == 6:
-            await self.logger.error_async(
-                f"{self.name} reached too many requests error. Fix the code"
+            await self.logger.warning_async(
+                f"{self.name} reached too many requests error. Requests are slowed down"
             )
-            await asyncio.sleep(10)
+            self.__rate_limiter.retry_after(1.)
             return 0
         # unforgivable errors
         elif error_code in (2, 4, 5, 7, 11, 20, 21, 27, 28, 100, 101):
@@ -711,27 +1077,31 @@ class VkontakteBot(ChatBot):
     def get_random_id() -> int:
         return random.randint(-(2 ** 31), 2 ** 31)
 
-    async def before_close_async(self) -> None:
-        await super().before_close_async()
-        if not self.__http_session.is_closed:
-            await self.__http_session.aclose()
-
     async def before_start_async(self) -> None:
         await super().before_start_async()
-        self.__http_session = httpx.AsyncClient()
+        # The clients are shared with other bots and closed by the app
+        self.__http_session = self.http_clients.get_async_client()
+        self.__polling_session = self.http_clients.get_async_client(f'long polling {self.name}')
 
 
 def build_task_caller(info: TaskInfo, bot: Bot) -> Callable[..., Any]:
     func = info.func
+    plan = compile_resolution_plan(func)
+    plan.check(BOT_DEPENDENCY_NAMES)
 
-    def caller() -> Any:  # noqa: ANN401
+    async def caller() -> Any:  # noqa: ANN401
         if bot.is_enabled:
-            min_deps = decompose_bot_as_dependencies(bot)
-            args = resolve_function_args(func, min_deps)
-            return func(**args)
+            update_cache = DependencyCache()
+            try:
+                min_deps = decompose_bot_as_dependencies(bot, update_cache)
+                args = await plan.resolve_async(min_deps)
+                return await func(**args)
+            finally:
+                await update_cache.aclose()
 
     def wrapped_caller() -> Any:  # noqa: ANN401
-        return call_raisable_function_async(caller, bot)
+        # The scheduler counts the failed calls
+        return call_raisable_function_async(caller, bot, reraise=True)
 
     return wrapped_caller
 
@@ -743,18 +1113,30 @@ def build_scheduler(bots: list[Bot], scheduler: IScheduler) -> None:
             assert task_info.name not in task_names, f'Task {task_info.name} met twice. Tasks must have different names'
             task_names.add(task_info.name)
             scheduler.add_task(task_info, build_task_caller(task_info, bot))
+        bot.planner.scheduler = scheduler
     task_names.clear()
 
 
 def disable_tasks(bot: Bot, scheduler: IScheduler) -> None:
-    """Method is used to disable tasks when the bot is exiting or disabling."""
-    scheduled_tasks = scheduler.list_tasks()
-    bot_tasks = map(lambda ti: ti.name, bot.task_infos)
-    for bot_task in bot_tasks:
-        if bot_task in scheduled_tasks:
-            scheduler.remove_task(bot_task)
+    """
+    Method is used to disable tasks when the bot is exiting or disabling.
+    The tasks are paused and keep their schedule. If the scheduler doesn't support groups, they are removed.
+    """
+    if scheduler.pause_group(bot.name):
+        return
+    scheduled_tasks = set(scheduler.list_tasks())
+    for task_info in bot.task_infos:
+        if task_info.name in scheduled_tasks:
+            scheduler.remove_task(task_info.name)
+
+
+def enable_tasks(bot: Bot, scheduler: IScheduler) -> None:
+    """Resume the tasks of the bot paused by `disable_tasks`, or add them again if they were removed"""
+    if not scheduler.resume_group(bot.name):
+        build_scheduler([bot], scheduler)
 
 
 async def stop_bot_async(bot: Bot, scheduler: IScheduler) -> None:
     bot.disable()
     disable_tasks(bot, scheduler)
+    await bot.dependency_cache.aclose()
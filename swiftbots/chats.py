@@ -1,10 +1,14 @@
+import asyncio
 import random
-from collections.abc import Callable
-from typing import Optional, Union
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, Any, Optional, Union
 
 from swiftbots.all_types import ILogger
 from swiftbots.types import AsyncSenderFunction
 
+if TYPE_CHECKING:
+    from swiftbots.outbox import Outbox
+
 
 class Chat:
     def __init__(
@@ -15,8 +19,13 @@ class Chat:
             logger: ILogger,
             error_message: str,
             unknown_message: str,
-            refuse_message: str
+            refuse_message: str,
+            busy_message: str = "Too many requests. Try again later",
+            outbox: Optional['Outbox'] = None
     ):
+        """
+        :param outbox: the outbox of the bot, if it's enabled. The requests to the chat are sent through it in order.
+        """
         self.sender = sender
         self.message = message
         self.function_sender = function_sender
@@ -24,12 +33,36 @@ class Chat:
         self.error_message = error_message
         self.unknown_message = unknown_message
         self.refuse_message = refuse_message
+        self.busy_message = busy_message
+        self.outbox = outbox
 
     async def reply_async(self, message: str) -> dict:
         """
         Send the user the message back.
+        If the bot has an outbox, the message is sent after the ones queued for the chat before.
+        """
+        return await self.call_in_order_async(lambda: self.function_sender(message, self.sender))
+
+    async def enqueue_async(self, message: str) -> asyncio.Future:
+        """
+        Put the message in the outbox of the bot and don't wait for it to be sent.
+        Without an outbox, the message is sent before it returns.
+        :returns: a future of the sender result.
         """
-        return await self.function_sender(message, self.sender)
+        if self.outbox is not None:
+            return await self.outbox.send_async(message, self.sender)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(await self.function_sender(message, self.sender))
+        return future
+
+    async def call_in_order_async(self, call: Callable[[], Awaitable[Any]]) -> Any:  # noqa: ANN401
+        """
+        Make a request to the chat, e.g. edit a message. If the bot has an outbox, the request waits
+        for the messages queued for the chat before, so it doesn't overtake the message it refers to.
+        """
+        if self.outbox is None:
+            return await call()
+        return await (await self.outbox.submit_async(self.sender, call))
 
     async def error_async(self) -> dict:
         """
@@ -38,12 +71,13 @@ class Chat:
         await self.logger.error_async(f"Error in the bot. The sender: {self.sender}, the message: {self.message}")
         return await self.reply_async(self.error_message)
 
-    async def unknown_command_async(self) -> dict:
+    async def unknown_command_async(self, reply: Optional[str] = None) -> dict:
         """
         If the user sends some unknown shit, then needed to warn him
+        :param reply: the reply instead of the unknown command message, e.g. with suggestions of similar commands.
         """
         await self.logger.info_async(f"{self.sender} sent unknown command. {self.message}")
-        return await self.reply_async(self.unknown_message)
+        return await self.reply_async(self.unknown_message if reply is None else reply)
 
     async def refuse_async(self) -> dict:
         """
@@ -52,6 +86,20 @@ class Chat:
         await self.logger.info_async(f"Forbidden. The sender: {self.sender}, the message: {self.message}")
         return await self.reply_async(self.refuse_message)
 
+    async def usage_async(self, usage: str) -> dict:
+        """
+        If the arguments of the command can't be parsed, then the user must know how to use it.
+        """
+        await self.logger.info_async(f"Wrong arguments. The sender: {self.sender}, the message: {self.message}")
+        return await self.reply_async(usage)
+
+    async def busy_async(self) -> dict:
+        """
+        If the bot is overloaded and the message is thrown away, then the user must know to try later.
+        """
+        await self.logger.info_async(f"Busy. The sender: {self.sender}, the message: {self.message}")
+        return await self.reply_async(self.busy_message)
+
 
 class TelegramChat(Chat):
     def __init__(
@@ -65,7 +113,8 @@ class TelegramChat(Chat):
             fetch_async: Callable,
             error_message: str,
             unknown_message: str,
-            refuse_message: str
+            refuse_message: str,
+            outbox: Optional['Outbox'] = None
     ):
         super().__init__(sender=sender,
                          message=message,
@@ -73,7 +122,8 @@ class TelegramChat(Chat):
                          logger=logger,
                          error_message=error_message,
                          unknown_message=unknown_message,
-                         refuse_message=refuse_message)
+                         refuse_message=refuse_message,
+                         outbox=outbox)
         self.message_id = message_id
         self.username = username
         self.fetch_async = fetch_async
@@ -86,7 +136,7 @@ class TelegramChat(Chat):
         data["text"] = new_text
         data["message_id"] = message_id
         data["chat_id"] = self.sender
-        return await self.fetch_async("editMessageText", data)
+        return await self.call_in_order_async(lambda: self.fetch_async("editMessageText", data))
 
     async def send_async(
         self, message: str, user: Union[str, int], data: Optional[dict] = None
@@ -109,7 +159,7 @@ class TelegramChat(Chat):
             data = {}
         data["chat_id"] = self.sender
         data["message_id"] = message_id
-        return await self.fetch_async("deleteMessage", data)
+        return await self.call_in_order_async(lambda: self.fetch_async("deleteMessage", data))
 
     async def send_sticker_async(
         self, file_id: str, data: Optional[dict] = None
@@ -118,7 +168,7 @@ class TelegramChat(Chat):
             data = {}
         data["chat_id"] = self.sender
         data["sticker"] = file_id
-        return await self.fetch_async("sendSticker", data)
+        return await self.call_in_order_async(lambda: self.fetch_async("sendSticker", data))
 
 
 class VkChat(Chat):
@@ -132,7 +182,8 @@ class VkChat(Chat):
             fetch_async: Callable,
             error_message: str,
             unknown_message: str,
-            refuse_message: str
+            refuse_message: str,
+            outbox: Optional['Outbox'] = None
     ):
         super().__init__(sender=sender,
                          message=message,
@@ -140,7 +191,8 @@ class VkChat(Chat):
                          logger=logger,
                          error_message=error_message,
                          unknown_message=unknown_message,
-                         refuse_message=refuse_message)
+                         refuse_message=refuse_message,
+                         outbox=outbox)
         self.message_id = message_id
         self.fetch_async = fetch_async
 
@@ -178,7 +230,7 @@ class VkChat(Chat):
         data["peer_id"] = self.sender
         data["message_id"] = message_id
         data["message"] = new_message
-        return await self.fetch_async("messages.edit", data)
+        return await self.call_in_order_async(lambda: self.fetch_async("messages.edit", data))
 
     async def send_sticker_async(
         self, sticker_id: int, data: Optional[dict] = None
@@ -188,4 +240,4 @@ class VkChat(Chat):
         data["user_id"] = self.sender
         data["random_id"] = random.randint(-(2 ** 31), 2 ** 31)
         data["sticker_id"] = sticker_id
-        return await self.fetch_async("messages.send", data)
+        return await self.call_in_order_async(lambda: self.fetch_async("messages.send", data))
@@ -0,0 +1,167 @@
+__all__ = [
+    'SequentialDispatcher',
+    'ConcurrentDispatcher',
+    'KeyedDispatcher',
+    'build_dispatcher',
+]
+
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+if TYPE_CHECKING:
+    from swiftbots.bots import Bot
+
+HandleFunction = Callable[[], Awaitable[Any]]
+
+
+class SequentialDispatcher:
+    """
+    Awaits each handler before the next update is pulled from the listener.
+    It's the default behaviour of bots.
+    """
+
+    async def dispatch(self, handle: HandleFunction, key: Optional[Hashable] = None) -> None:
+        await handle()
+
+    async def close(self) -> None:
+        ...
+
+    def raise_pending(self) -> None:
+        ...
+
+    @property
+    def in_flight(self) -> int:
+        return 0
+
+
+class ConcurrentDispatcher:
+    """
+    Runs handlers as tracked tasks, so the listener can pull the next update while the previous ones are handled.
+    At most `max_concurrency` handlers run at the same time; `dispatch` waits for a free slot otherwise.
+
+    Exceptions derived from `Exception` must be handled inside `handle`. Other `BaseException`s
+    (e.g. `ExitApplicationException` raised by `shutdown_app`) are remembered and the owner task is cancelled,
+    so the owner can re-raise them by calling `raise_pending`.
+    """
+
+    def __init__(self, max_concurrency: int, owner: Optional[asyncio.Task] = None):
+        assert isinstance(max_concurrency, int) and max_concurrency >= 1, 'max_concurrency must be a positive integer'
+        self.max_concurrency = max_concurrency
+        self._owner = owner
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._pending_exception: Optional[BaseException] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Number of dispatched updates that are not handled yet"""
+        return self._in_flight
+
+    async def dispatch(self, handle: HandleFunction, key: Optional[Hashable] = None) -> None:
+        self.raise_pending()
+        await self._slots.acquire()
+        self._in_flight += 1
+        self._start(self._run(handle))
+
+    def _start(self, coro: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, handle: HandleFunction) -> None:
+        try:
+            await handle()
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            self._remember(e)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    def _remember(self, exception: BaseException) -> None:
+        if self._pending_exception is None:
+            self._pending_exception = exception
+            if self._owner is not None and not self._owner.done():
+                self._owner.cancel()
+
+    def raise_pending(self) -> None:
+        """Re-raise an exception that a handler let out, if there is one"""
+        if self._pending_exception is not None:
+            exception, self._pending_exception = self._pending_exception, None
+            raise exception
+
+    async def close(self) -> None:
+        """Wait for all the in-flight handlers to finish"""
+        while self._tasks:
+            tasks = list(self._tasks)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Done callbacks may not have removed the finished tasks yet
+            self._tasks.difference_update(tasks)
+
+
+class KeyedDispatcher(ConcurrentDispatcher):
+    """
+    Handlers of updates with the same key run one after another, in the order the updates came.
+    Updates with different keys are handled in parallel, limited by `max_concurrency` as well.
+    An update waiting for the previous ones of its key holds no slot, so a key flooded with updates
+    doesn't hold back the others. Up to `queue_size` updates can wait to be handled, `dispatch` waits otherwise.
+
+    A queue of a key exists only while the key has updates to handle, so memory doesn't grow
+    with the number of all the keys (senders) ever seen.
+    """
+
+    def __init__(self, max_concurrency: int, owner: Optional[asyncio.Task] = None, queue_size: int = 1000):
+        super().__init__(max_concurrency, owner=owner)
+        assert isinstance(queue_size, int) and queue_size >= 1, 'queue_size must be a positive integer'
+        self._waiting = asyncio.Semaphore(queue_size)
+        self._queues: dict[Hashable, deque[HandleFunction]] = {}
+
+    @property
+    def active_keys(self) -> int:
+        """Number of keys which have updates being handled or waiting"""
+        return len(self._queues)
+
+    async def dispatch(self, handle: HandleFunction, key: Optional[Hashable] = None) -> None:
+        if key is None:
+            await super().dispatch(handle)
+            return
+        self.raise_pending()
+        await self._waiting.acquire()
+        self._in_flight += 1
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(handle)
+        else:
+            self._queues[key] = deque((handle,))
+            self._start(self._run_key_queue(key))
+
+    async def _run_key_queue(self, key: Hashable) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                # A slot is taken for each update, so the other keys waiting for a slot go in between
+                await self._slots.acquire()
+                self._waiting.release()
+                await self._run(queue.popleft())
+        finally:
+            del self._queues[key]
+
+
+Dispatcher = Union[SequentialDispatcher, ConcurrentDispatcher, KeyedDispatcher]
+
+
+def build_dispatcher(bot: 'Bot') -> Dispatcher:
+    """
+    Create the dispatcher the bot is configured for.
+    Must be called from the task that listens to the bot updates.
+    """
+    if bot.max_concurrency is None:
+        return SequentialDispatcher()
+    if bot.dispatch_key is not None:
+        return KeyedDispatcher(bot.max_concurrency, owner=asyncio.current_task())
+    return ConcurrentDispatcher(bot.max_concurrency, owner=asyncio.current_task())
@@ -0,0 +1,164 @@
+__all__ = [
+    'ExecutorKind',
+    'ExecutorRegistry',
+    'build_offloaded_function',
+    'get_default_executors',
+]
+
+import asyncio
+import functools
+import importlib
+import inspect
+import os
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Optional, Union
+
+
+class ExecutorKind(str, Enum):
+    # Blocking functions, e.g. a synchronous database driver or a file system
+    THREAD = 'thread'
+    # CPU-bound functions. Their arguments and results must be picklable
+    PROCESS = 'process'
+
+
+class ExecutorStats:
+    def __init__(self) -> None:
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.submitted - self.completed - self.failed
+
+
+class ExecutorRegistry:
+    """
+    Thread and process pools of an app, created on the first use.
+    Synchronous handlers and tasks run in them, so they don't freeze the event loop.
+    """
+
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        """
+        :param thread_workers: size of the thread pool. By default, as `ThreadPoolExecutor` decides.
+        :param process_workers: size of the process pool. By default, the number of CPUs.
+        """
+        # The defaults of the standard executors, so the sizes are known before the pools are created
+        cpus = os.cpu_count() or 1
+        self.__workers = {
+            ExecutorKind.THREAD: thread_workers if thread_workers is not None else min(32, cpus + 4),
+            ExecutorKind.PROCESS: process_workers if process_workers is not None else cpus,
+        }
+        self.__executors: dict[ExecutorKind, Executor] = {}
+        self.__stats = {kind: ExecutorStats() for kind in ExecutorKind}
+
+    def get_executor(self, kind: Union[ExecutorKind, str]) -> Executor:
+        kind = ExecutorKind(kind)
+        executor = self.__executors.get(kind)
+        if executor is None:
+            workers = self.__workers[kind]
+            if kind == ExecutorKind.THREAD:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='swiftbots')
+            else:
+                executor = ProcessPoolExecutor(max_workers=workers)
+            self.__executors[kind] = executor
+        return executor
+
+    async def run(self, kind: Union[ExecutorKind, str], func: Callable[..., Any], kwargs: dict[str, Any]) -> Any:  # noqa: ANN401
+        """Call the function with the keyword arguments in the pool and wait for the result"""
+        kind = ExecutorKind(kind)
+        executor = self.get_executor(kind)
+        stats = self.__stats[kind]
+        if kind == ExecutorKind.PROCESS and get_function_key(func) in _offloaded_functions:
+            call = functools.partial(call_offloaded_function, get_function_key(func), kwargs)
+        else:
+            call = functools.partial(func, **kwargs)
+        stats.submitted += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, call)
+        except BaseException:
+            stats.failed += 1
+            raise
+        stats.completed += 1
+        return result
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """
+        Sizes and load of the pools. `queued` is the number of calls waiting for a free worker.
+        """
+        result = {}
+        for kind in ExecutorKind:
+            stats = self.__stats[kind]
+            workers = self.__workers[kind]
+            result[kind.value] = {
+                'started': kind in self.__executors,
+                'workers': workers,
+                'in_flight': stats.in_flight,
+                'queued': max(stats.in_flight - workers, 0),
+                'completed': stats.completed,
+                'failed': stats.failed,
+            }
+        return result
+
+    async def ashutdown(self) -> None:
+        """Wait for the running calls and stop the pools. The next use creates new ones"""
+        executors = list(self.__executors.values())
+        self.__executors.clear()
+        for executor in executors:
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+
+__default_executors = ExecutorRegistry()
+
+
+def get_default_executors() -> ExecutorRegistry:
+    """The registry used by bots which aren't added to an app"""
+    return __default_executors
+
+
+# Functions offloaded to processes are found by a key in a child process, because decorators
+# usually replace them in their modules, so they can't be pickled.
+# A spawned child process fills it by importing the module of the function
+_offloaded_functions: dict[str, Callable[..., Any]] = {}
+
+
+def get_function_key(func: Callable[..., Any]) -> str:
+    return f'{func.__module__}:{func.__qualname__}'
+
+
+def call_offloaded_function(key: str, kwargs: dict[str, Any]) -> Any:  # noqa: ANN401
+    func = _offloaded_functions.get(key)
+    if func is None:
+        # A spawned process doesn't know the function yet. Importing its module runs the decorators again
+        importlib.import_module(key.partition(':')[0])
+        func = _offloaded_functions[key]
+    return func(**kwargs)
+
+
+def build_offloaded_function(func: Callable[..., Any],
+                             kind: Union[ExecutorKind, str],
+                             get_registry: Callable[[], ExecutorRegistry]) -> Callable[..., Awaitable[Any]]:
+    """
+    Wrap a synchronous function into a coroutine function which calls it in a pool.
+    The wrapper keeps the signature, so the arguments are resolved as for the original function.
+    A function for the `process` executor must be defined at the top level of an importable module,
+    so a child process can find it.
+    """
+    kind = ExecutorKind(kind)
+    assert not inspect.iscoroutinefunction(func), \
+        f'Function {func.__name__} must be synchronous to be run in the {kind.value} executor'
+    if kind == ExecutorKind.PROCESS:
+        assert func.__qualname__ == func.__name__, \
+            f'Function {func.__qualname__} must be defined at the top level of a module to be run in a process'
+        assert func.__module__ != '__main__', \
+            f'Function {func.__name__} must be defined in an importable module, not in the main script, ' \
+            f'to be run in a process'
+        _offloaded_functions[get_function_key(func)] = func
+
+    @functools.wraps(func)
+    async def offloaded(**kwargs: Any) -> Any:  # noqa: ANN401
+        return await get_registry().run(kind, func, kwargs)
+
+    return offloaded
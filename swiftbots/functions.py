@@ -1,56 +1,231 @@
+import asyncio
 import inspect
 import random
 import string
-from collections.abc import Callable
+from collections.abc import Callable, Collection
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
 from traceback import format_exc
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Optional, Union
 
-from swiftbots.types import DependencyContainer
+from swiftbots.types import DependencyContainer, DependencyScope
 
 if TYPE_CHECKING:
     from swiftbots.bots import Bot
 
 
-def depends(dependency: Callable[..., Any]) -> DependencyContainer:
+def depends(
+        dependency: Callable[..., Any],
+        scope: Union[DependencyScope, str] = DependencyScope.UPDATE
+) -> DependencyContainer:
     """
     :param dependency: A "dependable" argument, must be function.
+        It can be a coroutine function or a generator (also async) function. A generator yields the value once,
+        and the code after `yield` is executed when the scope ends. E.g. to close a connection.
+    :param scope: how long the computed value is reused. `update` by default: a dependency is computed once
+        per update even if it's used several times. `bot` and `app` make singletons of a bot or the whole app.
     """
-    return DependencyContainer(dependency)
+    compile_resolution_plan(dependency)
+    return DependencyContainer(dependency, DependencyScope(scope))
 
 
 def is_dependable_param(param: inspect.Parameter) -> bool:
     return isinstance(param.default, DependencyContainer)
 
 
-def resolve_function_args(function: Callable[..., Any], given_data: dict) -> dict:
-    sig = inspect.signature(function)
-    args = {}
-    for param in sig.parameters.values():
-        name = param.name
-        if is_dependable_param(param):  # dependency to resolve
+class DependencyCache:
+    """
+    Values of the dependencies computed within one scope, and teardowns of the generator dependencies.
+    """
+
+    def __init__(self) -> None:
+        self.values: dict[Callable[..., Any], asyncio.Future] = {}
+        self.exit_stack = AsyncExitStack()
+
+    async def aclose(self) -> None:
+        """Forget the values and execute the teardowns"""
+        self.values.clear()
+        exit_stack, self.exit_stack = self.exit_stack, AsyncExitStack()
+        await exit_stack.aclose()
+
+
+# Scopes from the shortest-lived to the longest-lived
+SCOPE_WIDTHS = {DependencyScope.UPDATE: 0, DependencyScope.BOT: 1, DependencyScope.APP: 2}
+
+
+# The key of `given_data` that keeps caches of all the scopes for the resolving functions
+DEPENDENCY_CACHES_KEY = '__dependency_caches__'
+
+
+class ResolutionPlan:
+    """
+    Parameters of the function analysed once: which of them are taken from the given data
+    and which of them are dependencies to be resolved recursively.
+    A dependency can't depend on a narrower scope, e.g. a `bot` singleton on an `update` connection,
+    because it would keep the value after its teardown.
+    """
+
+    def __init__(self, function: Callable[..., Any]):
+        self.function = function
+        # (name, description for errors) of the parameters taken from the given data
+        self.simple_params: list[tuple[str, str]] = []
+        self.dependencies: list[tuple[str, DependencyScope, ResolutionPlan]] = []
+        for param in inspect.signature(function).parameters.values():
+            if is_dependable_param(param):
+                container: DependencyContainer = param.default
+                self.dependencies.append((param.name, container.scope, compile_resolution_plan(container.dependency)))
+            else:
+                self.simple_params.append((param.name, str(param)))
+        for name, scope, plan in self.dependencies:
+            for sub_name, sub_scope, _ in plan.dependencies:
+                assert SCOPE_WIDTHS[sub_scope] >= SCOPE_WIDTHS[scope], \
+                    f"Dependency `{name}` of `{getattr(function, '__name__', function)}` has `{scope.value}` scope, " \
+                    f"so its dependency `{sub_name}` can't have the narrower `{sub_scope.value}` scope"
+
+        self.__context_manager: Optional[Callable[..., Any]] = None
+        self.__async_context_manager: Optional[Callable[..., Any]] = None
+        if inspect.isasyncgenfunction(function):
+            self.__async_context_manager = asynccontextmanager(function)
+        elif inspect.isgeneratorfunction(function):
+            self.__context_manager = contextmanager(function)
+        self.__is_coroutine = inspect.iscoroutinefunction(function)
+        # Whether the dependencies can be resolved only with `resolve_async`
+        self.is_async: bool = any(plan.is_async or plan.__is_special for _, _, plan in self.dependencies)
+
+    @property
+    def __is_special(self) -> bool:
+        return self.__is_coroutine or self.__context_manager is not None or self.__async_context_manager is not None
+
+    def resolve(self, given_data: dict) -> dict:
+        """
+        Resolve the arguments without caching. Only plain functions can be the dependencies.
+        """
+        assert not self.is_async, \
+            f"`{self.function}` has asynchronous or generator dependencies. Resolve them with `resolve_async`"
+        args = self.__take_simple_params(given_data)
+        for name, _, plan in self.dependencies:
             # Dependency function also can have dependencies
-            dep: DependencyContainer = param.default
-            dep_func = dep.dependency
-            dep_args = resolve_function_args(dep_func, given_data)
-            # Call dependency function
-            result = dep_func(**dep_args)
-            args[name] = result
-        elif name not in given_data:
-            raise AssertionError(f"Can't use parameter {param}")
-        else:  # simple parameter
+            args[name] = plan.function(**plan.resolve(given_data))
+        return args
+
+    async def resolve_async(self, given_data: dict) -> dict:
+        """
+        Resolve the arguments. The dependencies are cached in their scopes, which are taken from
+        `given_data[DEPENDENCY_CACHES_KEY]`. Without them, all the dependencies are cached in `given_data`
+        and teardowns of the generator dependencies are never executed.
+        """
+        args = self.__take_simple_params(given_data)
+        if self.dependencies:
+            caches = given_data.get(DEPENDENCY_CACHES_KEY)
+            if caches is None:
+                cache = DependencyCache()
+                caches = {scope: cache for scope in DependencyScope}
+                given_data[DEPENDENCY_CACHES_KEY] = caches
+            for name, scope, plan in self.dependencies:
+                args[name] = await plan.__get_value_async(given_data, caches[scope])
+        return args
+
+    def __take_simple_params(self, given_data: dict) -> dict:
+        args = {}
+        for name, description in self.simple_params:
+            if name not in given_data:
+                raise AssertionError(f"Can't use parameter {description}")
             args[name] = given_data[name]
+        return args
+
+    async def __get_value_async(self, given_data: dict, cache: DependencyCache) -> Any:  # noqa: ANN401
+        future = cache.values.get(self.function)
+        if future is not None:
+            # Already computed or being computed by a concurrent update
+            return await asyncio.shield(future)
 
-    return args
+        future = asyncio.get_running_loop().create_future()
+        cache.values[self.function] = future
+        try:
+            value = await self.__call_async(given_data, cache)
+        except BaseException as e:
+            del cache.values[self.function]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark it retrieved, the exception is raised here anyway
+            raise
+        future.set_result(value)
+        return value
 
+    async def __call_async(self, given_data: dict, cache: DependencyCache) -> Any:  # noqa: ANN401
+        args = await self.resolve_async(given_data)
+        if self.__async_context_manager is not None:
+            return await cache.exit_stack.enter_async_context(self.__async_context_manager(**args))
+        if self.__context_manager is not None:
+            return cache.exit_stack.enter_context(self.__context_manager(**args))
+        if self.__is_coroutine:
+            return await self.function(**args)
+        return self.function(**args)
 
-def decompose_bot_as_dependencies(bot: 'Bot') -> dict[str, Any]:
+    def check(self, available_names: Collection[str]) -> None:
+        """
+        Make sure every parameter will be given, including the parameters of the dependencies.
+        Raises AssertionError otherwise, so the mistake is found at start, not on the first update.
+        """
+        for name, description in self.simple_params:
+            assert name in available_names, \
+                f"Can't use parameter {description} of `{getattr(self.function, '__name__', self.function)}`"
+        for _, _, plan in self.dependencies:
+            plan.check(available_names)
+
+
+__resolution_plans: dict[Callable[..., Any], ResolutionPlan] = {}
+
+
+def compile_resolution_plan(function: Callable[..., Any], cache: bool = True) -> ResolutionPlan:
+    """
+    Analyse the function parameters. The plan is computed once per function and cached.
+    :param cache: whether to cache a new plan. The cache is never cleared, so the functions made at runtime,
+        e.g. closures given for one call, must not be cached. A plan cached before is returned anyway.
+    """
+    plan = __resolution_plans.get(function)
+    if plan is None:
+        plan = ResolutionPlan(function)
+        if cache:
+            __resolution_plans[function] = plan
+    return plan
+
+
+def resolve_function_args(function: Callable[..., Any], given_data: dict) -> dict:
+    return compile_resolution_plan(function).resolve(given_data)
+
+
+async def resolve_function_args_async(function: Callable[..., Any], given_data: dict) -> dict:
+    return await compile_resolution_plan(function).resolve_async(given_data)
+
+
+# Names which `decompose_bot_as_dependencies` gives
+BOT_DEPENDENCY_NAMES = frozenset(('name', 'logger', 'planner'))
+
+
+def decompose_bot_as_dependencies(bot: 'Bot', update_cache: Optional[DependencyCache] = None) -> dict[str, Any]:
+    """
+    :param update_cache: the cache of `update` scope dependencies. The caller has to close it when
+        the update is handled.
+    """
     return {
         'name': bot.name,
         'logger': bot.logger,
+        'planner': bot.planner,
+        DEPENDENCY_CACHES_KEY: {
+            DependencyScope.UPDATE: update_cache or DependencyCache(),
+            DependencyScope.BOT: bot.dependency_cache,
+            DependencyScope.APP: bot.app_dependency_cache,
+        },
     }
 
 
-async def call_raisable_function_async(func: Callable[[], Any], bot: 'Bot') -> Any:
+async def call_raisable_function_async(func: Callable[[], Any], bot: 'Bot', reraise: bool = False) -> Any:
+    """
+    Call the function and log the exceptions it raises.
+    :param reraise: raise the exception again after logging, so the caller knows the call failed.
+    """
     try:
         return await func()
     except (AttributeError, TypeError, KeyError, AssertionError) as e:
@@ -58,6 +233,8 @@ async def call_raisable_function_async(func: Callable[[], Any], bot: 'Bot') -> A
             f"Fix the code. Critical `{e.__class__.__name__}` "
             f"raised:\n{e}.\nFull traceback:\n{format_exc()}"
         )
+        if reraise:
+            raise
         # if context is not None and isinstance(bot.view, IChatView): TODO: сделать
         #     await bot.view.error_async(context)
     except Exception as e:
@@ -65,6 +242,8 @@ async def call_raisable_function_async(func: Callable[[], Any], bot: 'Bot') -> A
             f"Bot {bot.name} was raised with unhandled `{e.__class__.__name__}` "
             f"and kept on working:\n{e}.\nFull traceback:\n{format_exc()}"
         )
+        if reraise:
+            raise
         # if context is not None and isinstance(bot.view, IChatView): TODO: сделать
         #     await bot.view.error_async(context)
 
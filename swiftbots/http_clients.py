@@ -0,0 +1,106 @@
+__all__ = [
+    'HttpClientConfig',
+    'HttpClientRegistry',
+    'get_default_http_clients',
+]
+
+import asyncio
+import importlib.util
+from typing import Optional
+
+import httpx
+
+
+class HttpClientConfig:
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.,
+                 timeout: float = 30.,
+                 connect_timeout: Optional[float] = 10.,
+                 http2: bool = False):
+        """
+        :param max_connections: maximum number of connections a client opens to all the hosts.
+        :param max_keepalive_connections: how many idle connections are kept open to be reused.
+        :param keepalive_expiry: how many seconds an idle connection is kept open.
+        :param timeout: default timeout of a request, seconds. Requests can override it.
+        :param connect_timeout: timeout of establishing a connection, seconds.
+        :param http2: use HTTP/2 if the server supports it. Requires `swiftbots[http2]` to be installed.
+        """
+        if http2 and importlib.util.find_spec('h2') is None:
+            raise ImportError('HTTP/2 requires the `h2` package. Install it with `pip install swiftbots[http2]`')
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.http2 = http2
+
+    def get_limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    def get_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+
+class HttpClientRegistry:
+    """
+    Pooled HTTP clients shared by bots, loggers and admin utilities, so connections and TLS sessions are reused.
+    Clients are created on the first use. Different names give separate pools with the same settings.
+    """
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        self.config = config or HttpClientConfig()
+        self.__async_clients: dict[str, tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self.__clients: dict[str, httpx.Client] = {}
+
+    def get_async_client(self, name: str = 'default') -> httpx.AsyncClient:
+        """
+        Must be called inside a running event loop. Connections can't be shared between loops,
+        so a new client is created if the loop has changed.
+        """
+        loop = asyncio.get_running_loop()
+        entry = self.__async_clients.get(name)
+        if entry is None or entry[0] is not loop or entry[1].is_closed:
+            client = httpx.AsyncClient(limits=self.config.get_limits(),
+                                       timeout=self.config.get_timeout(),
+                                       http2=self.config.http2)
+            entry = (loop, client)
+            self.__async_clients[name] = entry
+        return entry[1]
+
+    def get_client(self, name: str = 'default') -> httpx.Client:
+        client = self.__clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.Client(limits=self.config.get_limits(),
+                                  timeout=self.config.get_timeout(),
+                                  http2=self.config.http2)
+            self.__clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close all the clients. The next use creates new ones"""
+        loop = asyncio.get_running_loop()
+        async_clients = list(self.__async_clients.values())
+        self.__async_clients.clear()
+        for client_loop, client in async_clients:
+            if client_loop is loop:
+                await client.aclose()
+        self.close()
+
+    def close(self) -> None:
+        """Close the synchronous clients"""
+        clients = list(self.__clients.values())
+        self.__clients.clear()
+        for client in clients:
+            client.close()
+
+
+__default_http_clients = HttpClientRegistry()
+
+
+def get_default_http_clients() -> HttpClientRegistry:
+    """The registry used when an app or a function isn't given its own one"""
+    return __default_http_clients
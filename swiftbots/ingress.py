@@ -0,0 +1,76 @@
+__all__ = [
+    'OverflowPolicy',
+    'IngressQueue',
+]
+
+import asyncio
+from enum import Enum
+from typing import Optional
+
+
+class OverflowPolicy(str, Enum):
+    """What to do with a new update when the ingress queue is full"""
+    # The listener waits until the handlers take an update from the queue
+    BLOCK = 'block'
+    # The oldest queued update is thrown away to make room for the new one
+    DROP_OLDEST = 'drop_oldest'
+    # The new update is thrown away
+    DROP_NEWEST = 'drop_newest'
+    # The new update is thrown away, and the sender is told the bot is busy. For chat bots only
+    REPLY_BUSY = 'reply_busy'
+
+
+class IngressQueue:
+    """
+    A bounded queue between a bot listener and its handlers.
+    Counters can be used to size the deployment.
+    """
+
+    def __init__(self, capacity: int, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        assert isinstance(capacity, int) and capacity >= 1, 'Capacity must be a positive integer'
+        self.capacity = capacity
+        self.policy = OverflowPolicy(policy)
+        self.__queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=capacity)
+        self.received = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of updates waiting for a handler"""
+        return self.__queue.qsize()
+
+    async def put(self, update: dict) -> Optional[dict]:
+        """
+        Put the update in the queue following the overflow policy.
+        :returns: the update that was dropped, if any.
+        """
+        self.received += 1
+        dropped = None
+        if self.__queue.full():
+            if self.policy == OverflowPolicy.BLOCK:
+                await self.__queue.put(update)
+            elif self.policy == OverflowPolicy.DROP_OLDEST:
+                dropped = self.__queue.get_nowait()
+                self.__queue.put_nowait(update)
+            else:
+                dropped = update
+        else:
+            self.__queue.put_nowait(update)
+
+        if dropped is not None:
+            self.dropped += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return dropped
+
+    async def get(self) -> dict:
+        return await self.__queue.get()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'capacity': self.capacity,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'received': self.received,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,123 @@
+__all__ = [
+    'TokenBucket',
+    'RateLimiter',
+]
+
+import asyncio
+import time
+from collections.abc import Callable, Hashable
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Classic token bucket. Tokens are reserved in advance, so concurrent callers are served in order
+    and each of them knows how long to wait.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """
+        :param rate: tokens added per second.
+        :param capacity: maximum number of tokens, i.e. how many requests can be made in a burst.
+        """
+        assert rate > 0 and capacity >= 1, 'Rate must be positive and capacity must be at least 1'
+        self.rate = rate
+        self.capacity = capacity
+        self.__clock = clock
+        self.__tokens = capacity
+        self.__updated_at = clock()
+        self.__blocked_until = 0.
+
+    def reserve(self) -> float:
+        """
+        Take a token.
+        :returns: how many seconds the caller must wait before using it.
+        """
+        now = self.__clock()
+        self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated_at) * self.rate)
+        self.__updated_at = now
+        self.__tokens -= 1
+        delay = -self.__tokens / self.rate if self.__tokens < 0 else 0.
+        return max(delay, self.__blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        """Don't give tokens for the next `seconds`. E.g. when the server asked to retry after some time"""
+        self.__blocked_until = max(self.__blocked_until, self.__clock() + seconds)
+
+    def is_idle(self) -> bool:
+        """The bucket has been full for a while, so it's the same as a new one"""
+        now = self.__clock()
+        return now >= self.__blocked_until and self.__tokens + (now - self.__updated_at) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """
+    Paces outgoing requests with a global token bucket and an optional bucket per chat.
+    Buckets of the chats that have been idle long enough are removed, so memory doesn't grow with the number of chats.
+    """
+
+    def __init__(self,
+                 rate: float,
+                 burst: float,
+                 chat_rate: Optional[float] = None,
+                 chat_burst: float = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param rate: requests per second of the whole bot.
+        :param burst: how many requests can be made at once before pacing starts.
+        :param chat_rate: requests per second to one chat. No per-chat limit if None.
+        :param chat_burst: how many requests can be sent to one chat at once.
+        """
+        self.__clock = clock
+        self.__global = TokenBucket(rate, burst, clock)
+        self.__chat_rate = chat_rate
+        self.__chat_burst = chat_burst
+        self.__chats: dict[Hashable, TokenBucket] = {}
+        self.__prune_threshold = 1024
+        # The last refused chat and until when it waits
+        self.__refused_chat: Optional[Hashable] = None
+        self.__refused_until = 0.
+
+    @property
+    def tracked_chats(self) -> int:
+        return len(self.__chats)
+
+    async def acquire(self, chat: Optional[Hashable] = None) -> None:
+        """Wait until a request to the chat (or without a chat) is allowed"""
+        if chat is not None and self.__chat_rate is not None:
+            delay = self.__get_chat_bucket(chat).reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        delay = self.__global.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def retry_after(self, seconds: float, chat: Optional[Hashable] = None) -> None:
+        """
+        The server refused a request and asked to wait. If the chat is known and limited, only the chat waits.
+        Otherwise the whole bot does, as well as when another chat is refused while the previous one still waits:
+        then the limit of the whole bot is exceeded, not the limit of a chat.
+        """
+        if chat is None or self.__chat_rate is None:
+            self.__global.block(seconds)
+            return
+        self.__get_chat_bucket(chat).block(seconds)
+        now = self.__clock()
+        if now < self.__refused_until and chat != self.__refused_chat:
+            self.__global.block(seconds)
+        self.__refused_chat, self.__refused_until = chat, now + seconds
+
+    def __get_chat_bucket(self, chat: Hashable) -> TokenBucket:
+        bucket = self.__chats.get(chat)
+        if bucket is None:
+            if len(self.__chats) >= self.__prune_threshold:
+                self.__prune()
+            assert self.__chat_rate is not None
+            bucket = TokenBucket(self.__chat_rate, self.__chat_burst, self.__clock)
+            self.__chats[chat] = bucket
+        return bucket
+
+    def __prune(self) -> None:
+        self.__chats = {chat: bucket for chat, bucket in self.__chats.items() if not bucket.is_idle()}
+        # Don't scan again until the number of active chats doubles
+        self.__prune_threshold = max(1024, 2 * len(self.__chats))
@@ -1,15 +1,22 @@
+import inspect
 import re
-from collections.abc import Coroutine
-from typing import TYPE_CHECKING, Any, Optional, Union
+from collections.abc import Callable, Collection, Container, Iterable
+from typing import TYPE_CHECKING, Any, Optional, Union, get_type_hints
 
-from swiftbots.functions import resolve_function_args
-from swiftbots.types import DecoratedCallable
+from swiftbots.acl import RoleRegistry, build_access_list, normalize_user
+from swiftbots.functions import compile_resolution_plan, is_dependable_param
+from swiftbots.types import DecoratedCallable, RestOfLine
 
 if TYPE_CHECKING:
     from swiftbots.chats import Chat
+    from swiftbots.suggestions import CommandSuggestions
 
 
 FINAL_INDICATOR = '**'
+LENGTH_INDICATOR = '*len'
+
+# Names which `handle_message` and chat bots give to the handlers in addition to the listener output
+CHAT_HANDLER_DEPENDENCY_NAMES = frozenset(('all_deps', 'chat', 'raw_message', 'arguments', 'args', 'command', 'message'))
 
 
 class CompiledChatCommand:
@@ -18,20 +25,36 @@ class CompiledChatCommand:
         command_name: str,
         method: DecoratedCallable,
         pattern: re.Pattern,
-        whitelist_users: Optional[list[str]],
-        blacklist_users: Optional[list[str]]
+        whitelist_users: Optional[Container[str]],
+        blacklist_users: Optional[Container[str]],
+        parser: Optional['ArgumentParser'] = None,
+        usage: Optional[str] = None
     ):
+        """
+        :param usage: the reply if the parser can't parse the arguments. By default, it's made of the parser signature.
+        """
         self.command_name = command_name
         self.method = method
         self.pattern = pattern
         self.whitelist_users = whitelist_users
         self.blacklist_users = blacklist_users
+        self.plan = compile_resolution_plan(method)
+        self.parser = parser
+        if usage is None and parser is not None:
+            usage = f'Usage: {command_name} {parser.signature}'.rstrip()
+        self.usage = usage
+
 
+# A node maps the characters to the child nodes, and `FINAL_INDICATOR` to the command ending at the node.
+# The root also maps `LENGTH_INDICATOR` to the length of the longest command
+Trie = dict[str, Any]
 
-type Trie = dict[str, Union[Trie, CompiledChatCommand]]
+# A word with the whitespace before it
+WORD_PATTERN = re.compile(r'\s*\S*')
 
 
 def insert_trie(trie: Trie, word: str, command: CompiledChatCommand) -> None:
+    trie[LENGTH_INDICATOR] = max(trie.get(LENGTH_INDICATOR, 0), len(word))
     for ch in word:
         trie = trie.setdefault(ch, {})
     trie[FINAL_INDICATOR] = command
@@ -41,22 +64,25 @@ def search_trie(trie: Trie, word: str) -> Optional[Trie]:
     """
     Searches the first full command match in the trie.
     """
+    node = trie
     for ch in word:
-        trie = trie.get(ch)
-        if trie is None:
+        child: Optional[Trie] = node.get(ch)
+        if child is None:
             return None
-        if FINAL_INDICATOR in trie:
-            return trie
+        node = child
+        if FINAL_INDICATOR in node:
+            return node
     return None
 
 
 def search_best_command_match(trie: Trie, word: str) -> tuple[Optional[CompiledChatCommand], Optional[re.Match]]:
     matches = []
     sub_word = word
-    while trie:
-        trie = search_trie(trie, sub_word)
-        if trie:
-            command: CompiledChatCommand = trie[FINAL_INDICATOR]
+    node: Optional[Trie] = trie
+    while node:
+        node = search_trie(node, sub_word)
+        if node:
+            command: CompiledChatCommand = node[FINAL_INDICATOR]
             matches.append(command)
             sub_word = word[len(command.command_name):]
     for command in reversed(matches):
@@ -66,16 +92,173 @@ def search_best_command_match(trie: Trie, word: str) -> tuple[Optional[CompiledC
     return None, None
 
 
+def route_command(trie: Trie, message: str) -> tuple[Optional[CompiledChatCommand], str]:
+    """
+    Find the longest command the message starts with, in one walk of the trie.
+    The command must be followed by whitespace or the end of the message. Case is ignored.
+    Only as many characters as the longest command has are read and lowercased,
+    so the cost doesn't grow with the message.
+    :returns: the command and the arguments, i.e. the rest of the message without the leading whitespace.
+    """
+    node: Optional[Trie] = trie
+    best_command: Optional[CompiledChatCommand] = None
+    command_end = 0
+    length = len(message)
+    # Each character is lowercased to one character or more. So a word which goes past the longest command
+    # can't be its end, and the extra character shows whether the word goes on
+    limit = min(length, trie.get(LENGTH_INDICATOR, 0) + 1)
+    position = 0
+    while node is not None and position < limit:
+        match = WORD_PATTERN.match(message, position, limit)
+        assert match is not None
+        position = match.end()
+        # Words are lowercased as a whole, as the commands are, because the case of a letter
+        # can depend on its neighbours. E.g. `Σ` at the end of a word becomes `ς`
+        for char in match.group().lower():
+            node = node.get(char)
+            if node is None:
+                break
+        if node is not None and FINAL_INDICATOR in node:
+            best_command, command_end = node[FINAL_INDICATOR], position
+    if best_command is None:
+        return None, ''
+    arguments_start = command_end
+    while arguments_start < length and message[arguments_start].isspace():
+        arguments_start += 1
+    return best_command, message[arguments_start:]
+
+
+# Converters of the argument annotations. Not annotated arguments are strings
+ARGUMENT_CONVERTERS: dict[Any, Callable[[str], Any]] = {
+    inspect.Parameter.empty: str,
+    str: str,
+    RestOfLine: str,
+    int: int,
+    float: float,
+}
+
+
+class Argument:
+    __slots__ = ('convert', 'default', 'is_rest', 'name', 'type_name')
+
+    def __init__(self, param: inspect.Parameter, annotation: Any):  # noqa: ANN401
+        """:param annotation: the annotation of the parameter, evaluated if it's a string"""
+        assert annotation in ARGUMENT_CONVERTERS, \
+            f"Argument {param.name} can't be parsed as {annotation}. Use one of: str, int, float, RestOfLine"
+        self.name = param.name
+        self.convert = ARGUMENT_CONVERTERS[annotation]
+        self.default = param.default
+        self.is_rest = annotation is RestOfLine
+        self.type_name = '' if annotation in (str, RestOfLine, inspect.Parameter.empty) else f':{annotation.__name__}'
+
+    @property
+    def required(self) -> bool:
+        return self.default is inspect.Parameter.empty
+
+
+class ArgumentParser:
+    """
+    Parses the arguments of a command into the parameters of the handler. Compiled once, when the handler is registered.
+    Without a pattern, the arguments are whitespace separated words, assigned to the parameters in order.
+    The parameter annotated with `RestOfLine` takes the rest of the message. Parameters with defaults are optional.
+    With a pattern, it must match all the arguments, and its named groups are assigned to the parameters.
+    Values are converted by the annotations of the parameters: `str`, `int` or `float`.
+    """
+
+    def __init__(self,
+                 function: Callable[..., Any],
+                 pattern: Optional[Union[str, re.Pattern]] = None,
+                 reserved_names: Collection[str] = ()):
+        """
+        :param reserved_names: names of the parameters which are given by the bot, so they are not arguments.
+        """
+        params = inspect.signature(function).parameters
+        # String annotations, e.g. with `from __future__ import annotations`, are evaluated in the module of the function
+        hints = get_type_hints(function) if any(isinstance(p.annotation, str) for p in params.values()) else {}
+        annotations = {name: hints.get(name, param.annotation) if isinstance(param.annotation, str)
+                       else param.annotation for name, param in params.items()}
+        self.pattern = None if pattern is None else re.compile(pattern)
+        if self.pattern is not None:
+            for name in self.pattern.groupindex:
+                assert name in params, f"Group `{name}` of the pattern is not a parameter of {function.__name__}"
+            self.arguments = [Argument(params[name], annotations[name]) for name in self.pattern.groupindex]
+        else:
+            self.arguments = [Argument(param, annotations[param.name]) for param in params.values()
+                              if param.name not in reserved_names and not is_dependable_param(param)]
+            for index, argument in enumerate(self.arguments):
+                assert not argument.is_rest or index == len(self.arguments) - 1, \
+                    f"Argument {argument.name} takes the rest of the line, so it must be the last one"
+                assert argument.required or all(not a.required for a in self.arguments[index:]), \
+                    f"Optional argument {argument.name} must be after the required ones"
+        self.names = frozenset(argument.name for argument in self.arguments)
+        self.__has_rest = self.pattern is None and any(argument.is_rest for argument in self.arguments)
+        self.__required_count = sum(argument.required for argument in self.arguments)
+
+    @property
+    def signature(self) -> str:
+        """How the arguments look, for the usage reply"""
+        if self.pattern is not None:
+            return self.pattern.pattern
+        parts = []
+        for argument in self.arguments:
+            part = f'<{argument.name}{argument.type_name}{"..." if argument.is_rest else ""}>'
+            parts.append(part if argument.required else f'[{part}]')
+        return ' '.join(parts)
+
+    def parse(self, arguments: str) -> Optional[dict[str, Any]]:
+        """
+        :returns: values of the parameters, or None if the arguments don't fit.
+        """
+        if self.pattern is not None:
+            match = self.pattern.fullmatch(arguments)
+            if match is None:
+                return None
+            values = match.groupdict()
+        else:
+            count = len(self.arguments)
+            words = arguments.split(maxsplit=count - 1) if self.__has_rest else arguments.split()
+            if not self.__required_count <= len(words) <= count:
+                return None
+            values = dict(zip((argument.name for argument in self.arguments), words))
+        result = {}
+        for argument in self.arguments:
+            value = values.get(argument.name)
+            if value is None:
+                if argument.required and self.pattern is None:
+                    return None
+                result[argument.name] = None if argument.required else argument.default
+                continue
+            try:
+                result[argument.name] = argument.convert(value)
+            except ValueError:
+                return None
+        return result
+
+
 class ChatMessageHandler:
     def __init__(self,
                  commands: list[str],
                  function: DecoratedCallable,
-                 whitelist_users: Optional[list[Union[str, int]]],
-                 blacklist_users: Optional[list[Union[str, int]]]):
+                 whitelist_users: Optional[Iterable[Union[str, int]]],
+                 blacklist_users: Optional[Iterable[Union[str, int]]],
+                 whitelist_roles: Optional[Iterable[str]] = None,
+                 blacklist_roles: Optional[Iterable[str]] = None,
+                 roles: Optional[RoleRegistry] = None,
+                 parser: Optional[ArgumentParser] = None,
+                 usage: Optional[str] = None):
+        """
+        :param roles: the registry where `whitelist_roles` and `blacklist_roles` are looked up.
+        :param parser: parses the arguments of the commands into the parameters of the function.
+        :param usage: the reply if the arguments can't be parsed. By default, it's made of the parser signature.
+        """
         self.commands = commands
         self.function = function
-        self.whitelist_users = None if whitelist_users is None else [str(x).casefold() for x in whitelist_users]
-        self.blacklist_users = None if blacklist_users is None else [str(x).casefold() for x in blacklist_users]
+        self.plan = compile_resolution_plan(function)
+        self.parser = parser
+        self.usage = usage
+        # Compiled once and shared by all the commands of the handler
+        self.whitelist_users = build_access_list(whitelist_users, whitelist_roles, roles)
+        self.blacklist_users = build_access_list(blacklist_users, blacklist_roles, roles)
 
 
 def compile_command_as_regex(name: str) -> re.Pattern:
@@ -100,7 +283,9 @@ def compile_chat_commands(
             method=handler.function,
             pattern=compile_command_as_regex(command),
             blacklist_users=handler.blacklist_users,
-            whitelist_users=handler.whitelist_users
+            whitelist_users=handler.whitelist_users,
+            parser=handler.parser,
+            usage=handler.usage
         )
         for handler in handlers
         for command in handler.commands
@@ -109,10 +294,10 @@ def compile_chat_commands(
 
 
 def is_user_allowed(user: Union[str, int],
-                    whitelist_users: Optional[list[str]],
-                    blacklist_users: Optional[list[str]]
+                    whitelist_users: Optional[Container[str]],
+                    blacklist_users: Optional[Container[str]]
                     ) -> bool:
-    user = str(user).casefold()
+    user = normalize_user(user)
     if blacklist_users is not None:
         return user not in blacklist_users
     if whitelist_users is not None:
@@ -120,28 +305,29 @@ def is_user_allowed(user: Union[str, int],
     return True
 
 
-def handle_message(
+async def handle_message(
         message: str,
         chat: 'Chat',
         trie: Trie,
         default_handler_func: Optional[DecoratedCallable],
-        all_deps: dict[str, Any]
-) -> Coroutine:
-    best_matched_command, match = search_best_command_match(trie, message.lower())
+        all_deps: dict[str, Any],
+        suggestions: Optional['CommandSuggestions'] = None
+) -> Any:  # noqa: ANN401
+    # Check if the command has arguments like `ADD NOTE apple, cigarettes, cheese`,
+    # where `ADD NOTE` is a command and the rest is arguments
+    best_matched_command, arguments = route_command(trie, message)
 
     if best_matched_command and not is_user_allowed(chat.sender, best_matched_command.whitelist_users, best_matched_command.blacklist_users):
-        return chat.refuse_async()
-
-    arguments = ""
-    # check if the command has arguments like `ADD NOTE apple, cigarettes, cheese`,
-    # where `ADD NOTE` is a command and the rest is arguments
-    if match:
-        message_without_command = match.group(1)
-        if message_without_command:
-            arguments = message_without_command
+        return await chat.refuse_async()
 
     # Found the command. Call the method attached to the command
     if best_matched_command:
+        if best_matched_command.parser is not None:
+            parsed_arguments = best_matched_command.parser.parse(arguments)
+            if parsed_arguments is None:
+                assert best_matched_command.usage is not None
+                return await chat.usage_async(best_matched_command.usage)
+            all_deps.update(parsed_arguments)
         method = best_matched_command.method
         command_name = best_matched_command.command_name
         all_deps['raw_message'] = message
@@ -149,8 +335,8 @@ def handle_message(
         all_deps['args'] = arguments
         all_deps['command'] = command_name
         all_deps['message'] = arguments
-        args = resolve_function_args(method, all_deps)
-        return method(**args)
+        args = await best_matched_command.plan.resolve_async(all_deps)
+        return await method(**args)
 
     elif default_handler_func is not None:  # No matches. Use default handler
         method = default_handler_func
@@ -158,8 +344,13 @@ def handle_message(
         all_deps['arguments'] = message
         all_deps['args'] = message
         all_deps['command'] = ''
-        args = resolve_function_args(method, all_deps)
-        return method(**args)
+        args = await compile_resolution_plan(method).resolve_async(all_deps)
+        return await method(**args)
 
-    else:  # No matches and default handler. Send `unknown message`
-        return chat.unknown_command_async()
+    else:  # No matches and default handler. Suggest similar commands or send `unknown message`
+        if suggestions is not None:
+            similar_commands = [command for command in suggestions.suggest(message)
+                                if is_user_allowed(chat.sender, command.whitelist_users, command.blacklist_users)]
+            if similar_commands:
+                return await chat.unknown_command_async(suggestions.format(similar_commands))
+        return await chat.unknown_command_async()
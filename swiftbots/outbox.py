@@ -0,0 +1,101 @@
+__all__ = [
+    'Outbox',
+]
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from traceback import format_exc
+from typing import Any, Union
+
+from swiftbots.all_types import ILogger
+from swiftbots.dispatchers import KeyedDispatcher
+from swiftbots.types import AsyncSenderFunction
+
+
+class Outbox:
+    """
+    Outgoing messages are queued and sent in the background: in order within a chat
+    and in parallel across chats. A handler doesn't wait for the network to send a reply.
+    Must be created inside a running event loop.
+    """
+
+    def __init__(self, sender: AsyncSenderFunction, logger: ILogger, capacity: int = 1000, workers: int = 16):
+        """
+        :param sender: the function which actually sends a message.
+        :param capacity: how many messages can wait to be sent. When the outbox is full, `send_async` waits.
+        :param workers: how many messages can be sent at the same time.
+        """
+        assert isinstance(workers, int) and workers >= 1, 'workers must be a positive integer'
+        self.__sender = sender
+        self.__logger = logger
+        self.__dispatcher = KeyedDispatcher(workers, queue_size=capacity)
+        self.sending = 0
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def queued(self) -> int:
+        """Number of messages waiting to be sent"""
+        return self.__dispatcher.in_flight - self.sending
+
+    async def send_async(self, message: str, user: Union[str, int]) -> asyncio.Future:
+        """
+        Put the message in the queue.
+        :returns: a future of the sender result. Await it to know the message is delivered.
+        """
+        return await self.submit_async(user, lambda: self.__sender(message, user))
+
+    async def submit_async(self, user: Union[str, int], call: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Put another request to the chat in the queue, e.g. editing or deleting a message.
+        It's made after the messages queued for the chat before, so it can't overtake the message it refers to.
+        :returns: a future of the call result.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        async def send() -> None:
+            self.sending += 1
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                self.failed += 1
+                future.cancel()
+            except Exception as e:
+                self.failed += 1
+                await self.__logger.exception_async(
+                    f"Couldn't send a request to {user}. Raised `{e.__class__.__name__}`:\n{e}.\n"
+                    f"Full traceback:\n{format_exc()}"
+                )
+                # The one who waited for the result may be cancelled already
+                if not future.done():
+                    future.set_exception(e)
+                    # It's logged already. Nobody has to await the future
+                    future.exception()
+            except BaseException as e:
+                # Control exceptions like `ExitApplicationException` come out of the next `send_async`
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+                raise
+            else:
+                self.sent += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.sending -= 1
+
+        await self.__dispatcher.dispatch(send, key=user)
+        return future
+
+    async def flush(self) -> None:
+        """Wait until all the queued messages are sent"""
+        await self.__dispatcher.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'queued': self.queued,
+            'sending': self.sending,
+            'sent': self.sent,
+            'failed': self.failed,
+            'active_chats': self.__dispatcher.active_keys,
+        }
@@ -1,6 +1,8 @@
 import asyncio
+import functools
+from collections.abc import AsyncGenerator, Callable, Coroutine
 from traceback import format_exc
-from typing import Any
+from typing import Any, Optional
 
 from swiftbots.all_types import (
     ExitApplicationException,
@@ -10,22 +12,53 @@ from swiftbots.all_types import (
     StartBotException,
 )
 from swiftbots.app.container import AppContainer
-from swiftbots.bots import Bot, build_scheduler, stop_bot_async
-from swiftbots.functions import call_raisable_function_async, decompose_bot_as_dependencies, resolve_function_args
+from swiftbots.bots import Bot, enable_tasks, stop_bot_async
+from swiftbots.dispatchers import Dispatcher, build_dispatcher
+from swiftbots.functions import (
+    DependencyCache,
+    call_raisable_function_async,
+    decompose_bot_as_dependencies,
+    resolve_function_args_async,
+)
+from swiftbots.ingress import IngressQueue
 from swiftbots.utils import ErrorRateMonitor
 
 __ALL_TASKS: set[str] = set()
 __SCHEDULER_TASK_NAME = '__sched__'
+__SCHEDULER: Optional[IScheduler] = None
 
 
 def get_all_tasks() -> set[str]:
     return __ALL_TASKS
 
 
-async def start_async_listener(bot: Bot) -> None:
+def get_scheduler() -> Optional[IScheduler]:
+    """The scheduler of the running app. None if no app is running"""
+    return __SCHEDULER
+
+
+def build_update_handler(bot: Bot, output: dict) -> Callable[[], Coroutine]:
+    """Bind the listener output to the bot handler, so it can be called later"""
+    async def handle() -> Any:  # noqa: ANN401
+        update_cache = DependencyCache()
+        try:
+            deps = decompose_bot_as_dependencies(bot, update_cache)
+            deps.update(output)
+            deps['all_deps'] = deps
+            args = await resolve_function_args_async(bot.handler_func, deps)
+            return await bot.handler_func(**args)
+        finally:
+            await update_cache.aclose()
+
+    async def raisable_handle() -> Any:  # noqa: ANN401
+        return await call_raisable_function_async(handle, bot)
+
+    return raisable_handle
+
+
+async def listen_async(bot: Bot) -> AsyncGenerator[dict, None]:
     """
-    Launches all bot listeners, and sends all updates to their handlers.
-    Runs asynchronously.
+    Pull updates from the bot listener. Restart the listener if it raises.
     """
     err_monitor = ErrorRateMonitor(cooldown=60)
     generator = bot.listener_func()
@@ -55,19 +88,60 @@ async def start_async_listener(bot: Bot) -> None:
                 err_monitor.error_count = 3
             generator = bot.listener_func()
             continue
+        yield output
 
-        async def handle() -> Any:  # noqa: ANN401
-            deps = decompose_bot_as_dependencies(bot)
-            deps.update(output)
-            deps['all_deps'] = deps
-            args = resolve_function_args(bot.handler_func, deps)
-            return await bot.handler_func(**args)
-        await call_raisable_function_async(handle, bot)
+
+async def pump_updates_async(bot: Bot, ingress: IngressQueue) -> None:
+    """Move updates from the bot listener to the ingress queue"""
+    async for output in listen_async(bot):
+        dropped = await ingress.put(output)
+        if dropped is not None:
+            await call_raisable_function_async(functools.partial(bot.drop_update_async, dropped, ingress.policy), bot)
+
+
+async def dispatch_update_async(bot: Bot, dispatcher: Dispatcher, output: dict) -> None:
+    key = output.get(bot.dispatch_key) if bot.dispatch_key is not None else None
+    await dispatcher.dispatch(build_update_handler(bot, output), key=key)
+
+
+async def start_async_listener(bot: Bot) -> None:
+    """
+    Launches all bot listeners, and sends all updates to their handlers.
+    Runs asynchronously.
+    """
+    dispatcher = build_dispatcher(bot)
+    ingress = None if bot.ingress_capacity is None else IngressQueue(bot.ingress_capacity, bot.overflow_policy)
+    bot.ingress_queue = ingress
+    pump: Optional[asyncio.Task] = None
+    try:
+        if ingress is None:
+            async for output in listen_async(bot):
+                await dispatch_update_async(bot, dispatcher, output)
+        else:
+            # The listener is pumped by a separate task, so bursts are absorbed by the queue
+            owner = asyncio.current_task()
+            pump = asyncio.create_task(pump_updates_async(bot, ingress))
+            pump.add_done_callback(lambda t: None if t.cancelled() or owner is None else owner.cancel())
+            while True:
+                output = await ingress.get()
+                await dispatch_update_async(bot, dispatcher, output)
+    except asyncio.CancelledError:
+        # A concurrent handler or the listener could stop the bot or the app.
+        # Propagate it as if it was raised right here
+        dispatcher.raise_pending()
+        listener_exception = pump.exception() if pump is not None and pump.done() and not pump.cancelled() else None
+        if listener_exception is not None:
+            raise listener_exception
+        raise
+    finally:
+        if pump is not None:
+            pump.cancel()
+        await dispatcher.close()
 
 
 async def start_bot(bot: Bot, scheduler: IScheduler) -> None:
     bot.enable()
-    build_scheduler([bot], scheduler)
+    enable_tasks(bot, scheduler)
     await start_async_listener(bot)
 
 
@@ -80,8 +154,9 @@ async def start_async_loop(app_container: AppContainer) -> None:
     tasks: set[asyncio.Task] = set()
 
     bots_dict: dict[str, Bot] = {bot.name: bot for bot in bots}
-    global __ALL_TASKS
+    global __ALL_TASKS, __SCHEDULER
     __ALL_TASKS = set(bots_dict.keys())
+    __SCHEDULER = sched
 
     # Create tasks for the bots' views
     for name, bot in bots_dict.items():
@@ -98,6 +173,10 @@ async def start_async_loop(app_container: AppContainer) -> None:
             await app_container.logger.report_async("Bots application's closed. The reason is no bots launched now.")
             for bot_to_close in bots:
                 await bot_to_close.before_close_async()
+            await app_container.dependency_cache.aclose()
+            await app_container.http_clients.aclose()
+            await app_container.executors.ashutdown()
+            __SCHEDULER = None
             return
         done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
         for task in done:
@@ -160,7 +239,11 @@ async def start_async_loop(app_container: AppContainer) -> None:
                         )
                 for bot_to_close in bots:
                         await bot_to_close.before_close_async()
+                await app_container.dependency_cache.aclose()
                 await logger.report_async("Bots application's closed")
+                await app_container.http_clients.aclose()
+                await app_container.executors.ashutdown()
+                __SCHEDULER = None
                 return
 
 
@@ -0,0 +1,153 @@
+__all__ = [
+    'CommandSuggestions',
+]
+
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from swiftbots.message_handlers import CompiledChatCommand
+
+
+def get_deletion_levels(word: str, max_distance: int) -> list[set[str]]:
+    """Strings made by removing characters from the word: the word itself, then 1 character removed and so on"""
+    levels = [{word}]
+    seen = {word}
+    for _ in range(max_distance):
+        # Removing different characters often gives the same string, e.g. in `aab`, so every level is deduplicated
+        level = {w[:i] + w[i + 1:] for w in levels[-1] for i in range(len(w))} - seen
+        seen |= level
+        levels.append(level)
+    return levels
+
+
+def get_edit_distance(first: str, second: str, max_distance: int) -> int:
+    """
+    Levenshtein distance where swapping two adjacent characters is one edit.
+    Only the cells within `max_distance` of the diagonal are computed, the others can't give a closer match.
+    :returns: the distance, or `max_distance + 1` if it's greater than `max_distance`.
+    """
+    too_far = max_distance + 1
+    if abs(len(first) - len(second)) > max_distance:
+        return too_far
+    # A mistyped word usually differs in one place, so the common start and end don't need to be compared
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    end_first, end_second = len(first), len(second)
+    while end_first > start and end_second > start and first[end_first - 1] == second[end_second - 1]:
+        end_first -= 1
+        end_second -= 1
+    first, second = first[start:end_first], second[start:end_second]
+    if not first or not second:
+        return min(len(first) + len(second), too_far)
+
+    width = len(second) + 1
+    last_row: list[int] = []
+    previous_row = [j if j <= max_distance else too_far for j in range(width)]
+    for i in range(1, len(first) + 1):
+        char = first[i - 1]
+        previous_char = first[i - 2] if i > 1 else ''
+        row = [too_far] * width
+        if i <= max_distance:
+            row[0] = i
+        row_min = row[0]
+        for j in range(max(1, i - max_distance), min(width, i + max_distance + 1)):
+            # Comparisons instead of `min` calls, it's the hot loop
+            value = previous_row[j - 1] + (char != second[j - 1])
+            if previous_row[j] + 1 < value:  # noqa: PLR1730
+                value = previous_row[j] + 1
+            if row[j - 1] + 1 < value:  # noqa: PLR1730
+                value = row[j - 1] + 1
+            if j > 1 and char == second[j - 2] and previous_char == second[j - 1] and last_row[j - 2] + 1 < value:
+                value = last_row[j - 2] + 1
+            row[j] = value
+            if value < row_min:  # noqa: PLR1730
+                row_min = value
+        if row_min > max_distance:
+            return too_far
+        last_row, previous_row = previous_row, row
+    return min(previous_row[-1], too_far)
+
+
+class CommandSuggestions:
+    """
+    Finds the commands similar to a mistyped one, for the "did you mean" reply.
+    The index keeps every command name with up to `max_distance` characters deleted. Two words are within
+    `max_distance` edits only if they have a common deletion, so a lookup generates the deletions of the typed word
+    and reads their entries. The cost depends on the length of the typed word, not on the number of commands,
+    and the number of compared commands is limited by `max_checks`.
+    """
+
+    def __init__(self,
+                 commands: Iterable['CompiledChatCommand'],
+                 message: str = 'Unknown command. Did you mean: {commands}?',
+                 max_distance: int = 1,
+                 limit: int = 3,
+                 max_checks: int = 100):
+        """
+        :param message: the reply. `{commands}` is replaced with the suggested commands.
+        :param max_distance: how many characters can be mistyped, a swap of two adjacent characters is one mistake.
+            Short words are allowed one mistake for each 3 characters. The index grows with the square
+            of it, e.g. with 2 it's about 10 times bigger for the commands of 16 characters.
+        :param limit: how many commands are suggested at most. The most similar ones go first.
+        :param max_checks: how many similar commands are compared with the typed one at most.
+            The closest commands are found first, so it only matters for many commands of similar names.
+        """
+        assert max_distance >= 1 and limit >= 1 and max_checks >= 1, \
+            'max_distance, limit and max_checks must be positive'
+        self.message = message
+        self.max_distance = max_distance
+        self.limit = limit
+        self.max_checks = max_checks
+        self.__index: dict[str, list[tuple[str, CompiledChatCommand]]] = {}
+        # Commands can consist of several words, so the typed command is taken as the same number of words
+        word_counts = set()
+        self.__max_length = 0
+        for command in commands:
+            name = command.command_name.lower()
+            word_counts.add(len(name.split()))
+            self.__max_length = max(self.__max_length, len(name))
+            for level in get_deletion_levels(name, max_distance):
+                for deletion in level:
+                    self.__index.setdefault(deletion, []).append((name, command))
+        self.__word_counts = sorted(word_counts)
+
+    def suggest(self, message: str) -> list['CompiledChatCommand']:
+        if not self.__word_counts:
+            return []
+        # The rest of the message is split off once and isn't lowercased, so long messages cost nothing more
+        words = message.split(maxsplit=self.__word_counts[-1])[:self.__word_counts[-1]]
+        distances: dict[CompiledChatCommand, int] = {}
+        checks = 0
+        for count in self.__word_counts:
+            if count > len(words):
+                break
+            typed = ' '.join(words[:count]).lower()
+            max_distance = min(self.max_distance, len(typed) // 3)
+            if max_distance == 0 or len(typed) > self.__max_length + max_distance:
+                continue
+            checked: set[CompiledChatCommand] = set()
+            # All the commands within N mistakes are found with N characters removed from the typed word.
+            # So if there are enough suggestions after a level, the next levels can only find worse ones
+            for level_distance, level in enumerate(get_deletion_levels(typed, max_distance)):
+                for deletion in level:
+                    if checks >= self.max_checks:
+                        break
+                    for name, command in self.__index.get(deletion, ()):
+                        if checks >= self.max_checks:
+                            break
+                        if command in checked:
+                            continue
+                        checked.add(command)
+                        checks += 1
+                        distance = get_edit_distance(typed, name, max_distance)
+                        # Words can be merged or split by a mistake, so a command can be close to several typed ones
+                        if distance <= max_distance and distance < distances.get(command, distance + 1):
+                            distances[command] = distance
+                if sum(distance <= level_distance for distance in distances.values()) >= self.limit:
+                    break
+        return sorted(distances, key=lambda c: (distances[c], c.command_name))[:self.limit]
+
+    def format(self, commands: list['CompiledChatCommand']) -> str:
+        return self.message.format(commands=', '.join(command.command_name for command in commands))
@@ -1,10 +1,21 @@
 __all__ = [
     'SimpleScheduler',
+    'HeapScheduler',
     'TaskInfo',
-    'PeriodTrigger'
+    'OverlapPolicy',
+    'PeriodMode',
+    'MisfirePolicy',
+    'JsonJobStore',
+    'SqliteJobStore',
+    'TaskPlanner',
+    'PeriodTrigger',
+    'CronTrigger',
+    'DateTrigger',
 ]
 
 
-from swiftbots.tasks.schedulers import SimpleScheduler
-from swiftbots.tasks.tasks import TaskInfo
-from swiftbots.tasks.triggers import PeriodTrigger
+from swiftbots.tasks.schedulers import HeapScheduler, SimpleScheduler
+from swiftbots.tasks.job_stores import JsonJobStore, SqliteJobStore
+from swiftbots.tasks.planner import TaskPlanner
+from swiftbots.tasks.tasks import MisfirePolicy, OverlapPolicy, PeriodMode, TaskInfo
+from swiftbots.tasks.triggers import CronTrigger, DateTrigger, PeriodTrigger
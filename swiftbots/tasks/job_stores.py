@@ -0,0 +1,101 @@
+__all__ = [
+    'JsonJobStore',
+    'SqliteJobStore',
+]
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Optional
+
+from swiftbots.all_types import IJobStore, JobState
+
+
+def serialize_time(moment: Optional[datetime]) -> Optional[str]:
+    return None if moment is None else moment.isoformat()
+
+
+def deserialize_time(value: Optional[str]) -> Optional[datetime]:
+    return None if value is None else datetime.fromisoformat(value)
+
+
+class JsonJobStore(IJobStore):
+    """
+    Keeps the states of the tasks in a JSON file. The file is rewritten on every save,
+    so it suits a moderate number of tasks. Use `SqliteJobStore` for many frequent tasks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__states: dict[str, dict[str, Optional[str]]] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.__states = json.load(file)
+
+    def load(self, name: str) -> Optional[JobState]:
+        state = self.__states.get(name)
+        if state is None:
+            return None
+        return JobState(deserialize_time(state.get('last_fire')), deserialize_time(state.get('next_fire')))
+
+    def save(self, name: str, state: JobState) -> None:
+        self.save_many({name: state})
+
+    def save_many(self, states: Mapping[str, JobState]) -> None:
+        for name, state in states.items():
+            self.__states[name] = {
+                'last_fire': serialize_time(state.last_fire),
+                'next_fire': serialize_time(state.next_fire),
+            }
+        # Write a temporary file and replace the old one, so a crash doesn't leave a broken file
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(self.__states, file)
+        os.replace(temporary_path, self.path)
+
+
+class SqliteJobStore(IJobStore):
+    """Keeps the states of the tasks in a SQLite database. Saving a task costs the same for any number of tasks"""
+
+    def __init__(self, path: str):
+        """
+        :param path: path to the database file. It's created if it doesn't exist.
+        """
+        self.path = path
+        # Schedulers save from a worker thread. The lock keeps the connection used by one thread at a time
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = threading.Lock()
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS swiftbots_jobs '
+            '(name TEXT PRIMARY KEY, last_fire TEXT, next_fire TEXT)'
+        )
+        self.__connection.commit()
+
+    def load(self, name: str) -> Optional[JobState]:
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT last_fire, next_fire FROM swiftbots_jobs WHERE name = ?', (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return JobState(deserialize_time(row[0]), deserialize_time(row[1]))
+
+    def save(self, name: str, state: JobState) -> None:
+        self.save_many({name: state})
+
+    def save_many(self, states: Mapping[str, JobState]) -> None:
+        # One transaction for the whole batch
+        with self.__lock:
+            self.__connection.executemany(
+                'INSERT OR REPLACE INTO swiftbots_jobs (name, last_fire, next_fire) VALUES (?, ?, ?)',
+                [(name, serialize_time(state.last_fire), serialize_time(state.next_fire))
+                 for name, state in states.items()]
+            )
+            self.__connection.commit()
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
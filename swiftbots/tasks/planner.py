@@ -0,0 +1,102 @@
+__all__ = [
+    'TaskPlanner',
+]
+
+import datetime
+import uuid
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from swiftbots.all_types import IScheduler
+from swiftbots.functions import (
+    BOT_DEPENDENCY_NAMES,
+    DependencyCache,
+    call_raisable_function_async,
+    compile_resolution_plan,
+    decompose_bot_as_dependencies,
+)
+
+if TYPE_CHECKING:
+    from swiftbots.bots import Bot
+
+
+class TaskPlanner:
+    """
+    Schedules one-shot calls at runtime, e.g. reminders and delayed follow-ups.
+    Handlers and tasks of a bot get it as the `planner` argument.
+
+    The function is called like a task: its arguments are resolved from the bot dependencies
+    and from the payload. Pending calls aren't kept between restarts.
+    """
+
+    def __init__(self, bot: 'Bot'):
+        self.__bot = bot
+        # Set when the tasks of the bot are given to a scheduler
+        self.scheduler: Optional[IScheduler] = None
+
+    def schedule_at(self,
+                    when: datetime.datetime,
+                    func: Callable[..., Any],
+                    payload: Optional[dict[str, Any]] = None,
+                    job_id: Optional[str] = None) -> str:
+        """
+        Call the coroutine function once at `when`.
+        :param when: an aware datetime, or a naive one in the local time. A moment in the past means "now".
+        :param payload: extra arguments of the function.
+        :param job_id: an id to cancel the call by. A pending call with the same id is replaced. Random if not given.
+        :returns: the id of the call.
+        """
+        assert self.scheduler is not None, f'Bot {self.__bot.name} must be added to a running app to schedule calls'
+        if when.tzinfo is None:
+            when = when.astimezone()
+        job_id = job_id or uuid.uuid4().hex
+        self.scheduler.add_job(self.__get_key(job_id), when, self.__build_caller(func, payload or {}))
+        return job_id
+
+    def schedule_in(self,
+                    delay: Union[float, datetime.timedelta],
+                    func: Callable[..., Any],
+                    payload: Optional[dict[str, Any]] = None,
+                    job_id: Optional[str] = None) -> str:
+        """
+        Call the coroutine function once after `delay`, seconds or timedelta.
+        See `schedule_at` for the other parameters.
+        """
+        if not isinstance(delay, datetime.timedelta):
+            delay = datetime.timedelta(seconds=delay)
+        return self.schedule_at(datetime.datetime.now(datetime.timezone.utc) + delay, func, payload, job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a pending call.
+        :returns: False if there is no such call, e.g. it has been made already.
+        """
+        if self.scheduler is None:
+            return False
+        return self.scheduler.cancel_job(self.__get_key(job_id))
+
+    def __get_key(self, job_id: str) -> str:
+        # Bots have their own ids
+        return f'{self.__bot.name}:{job_id}'
+
+    def __build_caller(self, func: Callable[..., Any], payload: dict[str, Any]) -> Callable[[], Any]:
+        bot = self.__bot
+        # A one-shot call is often a closure, its plan would stay in the cache forever
+        plan = compile_resolution_plan(func, cache=False)
+        plan.check(BOT_DEPENDENCY_NAMES | payload.keys())
+
+        async def caller() -> Any:  # noqa: ANN401
+            if bot.is_enabled:
+                update_cache = DependencyCache()
+                try:
+                    given_data = decompose_bot_as_dependencies(bot, update_cache)
+                    given_data.update(payload)
+                    args = await plan.resolve_async(given_data)
+                    return await func(**args)
+                finally:
+                    await update_cache.aclose()
+
+        def wrapped_caller() -> Any:  # noqa: ANN401
+            return call_raisable_function_async(caller, bot)
+
+        return wrapped_caller
@@ -1,58 +1,669 @@
 __all__ = [
-    'SimpleScheduler'
+    'SimpleScheduler',
+    'HeapScheduler',
 ]
 
 import asyncio
 import datetime
-from collections.abc import Callable
+import heapq
+import itertools
+import math
+import time
+from collections.abc import Awaitable, Callable
 from typing import Any, Optional
 
-from swiftbots.all_types import IPeriodTrigger, IScheduler
-from swiftbots.tasks.tasks import TaskInfo
+from swiftbots.all_types import IJobStore, ILogger, IPeriodTrigger, IScheduler, ITrigger, JobState, TaskStats
+from swiftbots.loggers import SysIOLoggerFactory
+from swiftbots.tasks.tasks import MisfirePolicy, OverlapPolicy, PeriodMode, TaskInfo
 
+# A task with a zero period fires once a second, as often as the old scheduler loop ticked, not in a busy loop
+MIN_PERIOD_SECONDS = 1.
 
-def now() -> datetime.datetime:
-    return datetime.datetime.now()
 
+def utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
 
-class TaskContainer:
-    __last_called: Optional[datetime.datetime] = None
-    __called_once = False
+
+class BaseTaskContainer:
+    """
+    A task in a scheduler. Computes the next fire time of the task on the monotonic clock.
+
+    Periods are counted on a grid from the moment the task is added (`PeriodMode.FIXED_RATE`),
+    so they don't drift however late the calls are. If the scheduler stalled and missed several fires,
+    they are coalesced into one call. With `PeriodMode.FIXED_DELAY` the period is counted from the end
+    of the previous call. Other triggers tell their next fire time by the wall clock.
+
+    If the state saved before a restart is given, the task keeps its schedule. A fire missed while the app
+    was down is called at once or skipped, depending on the misfire policy of the task.
+    """
 
     def __init__(self,
                  task_info: TaskInfo,
-                 caller: Callable,
-                 start_point: datetime.datetime):
+                 caller: Callable):
         self.caller: Callable[..., Any] = caller
         self.name = task_info.name
         self.triggers = task_info.triggers
         self.run_at_start = task_info.run_at_start
-        self.start_point = start_point
+        self.max_instances = task_info.max_instances
+        self.overlap = task_info.overlap
+        self.period_mode = task_info.period_mode
+        self.misfire_policy = task_info.misfire_policy
+        self.misfire_grace_time = task_info.misfire_grace_time
+        # The default timeout of the scheduler is set if the task doesn't have its own
+        self.timeout = task_info.timeout
+        self.max_timeouts = task_info.max_timeouts
+        self.timeouts_in_row = 0
+        self.group: Optional[TaskGroup] = None
+        periods = [trigger.get_period().total_seconds() for trigger in self.triggers
+                   if isinstance(trigger, IPeriodTrigger)]
+        # The shortest period fires the task
+        self.period: Optional[float] = None
+        if periods:
+            self.period = min(periods) if min(periods) > 0 else MIN_PERIOD_SECONDS
+        self.calendar_triggers = [trigger for trigger in self.triggers if not isinstance(trigger, IPeriodTrigger)]
+        # Calls that are running now and calls that wait for them by `OverlapPolicy.QUEUE`
+        self.running = 0
+        self.queued = 0
+        self.skipped = 0
+        # Fires of the period that were missed, merged into one call or skipped
+        self.coalesced = 0
+        self.last_fire: Optional[datetime.datetime] = None
+        # The next fire times on the monotonic clock
+        self.period_fire: Optional[float] = None
+        # The first call after a restart, if the saved state tells it
+        self.restored_fire: Optional[float] = None
+        self.calendar_fire: Optional[float] = None
+        self.calendar_due: Optional[datetime.datetime] = None
+        self.__origin = 0.
+        self.__period_index = 0
+        self.__waits_for_end = False
+        # When the last call was due, on the monotonic clock
+        self.__due: Optional[float] = None
+        self.__stats = TaskStats(self.name)
+
+    def get_next_fire_time(self) -> Optional[float]:
+        """Monotonic time of the next call. None if the task won't fire anymore or waits for its call to end"""
+        fire_times = [fire for fire in (self.period_fire, self.calendar_fire, self.restored_fire) if fire is not None]
+        return min(fire_times) if fire_times else None
+
+    def schedule_first(self,
+                       now: float,
+                       wall_now: datetime.datetime,
+                       state: Optional[JobState] = None) -> Optional[float]:
+        """
+        The task is added at `now`.
+        :param state: the state saved before the restart, if the scheduler has a job store.
+        :returns: monotonic time of the first call, None if the task won't fire.
+        """
+        if self.period is not None:
+            self.__origin = now
+            self.__period_index = 1
+            self.period_fire = now + self.period
+        self.__schedule_calendar(now, wall_now, wall_now)
+        if state is None:
+            return now if self.run_at_start else self.get_next_fire_time()
+
+        # The task was scheduled before the restart
+        self.last_fire = state.last_fire
+        if state.next_fire is None:
+            return self.get_next_fire_time()
+        lateness = (wall_now - state.next_fire).total_seconds()
+        missed = lateness > self.misfire_grace_time
+        if self.period is not None:
+            # Keep the grid of the previous run
+            self.__origin = now - lateness
+            self.__period_index = 0
+            self.period_fire = self.__origin
+            if missed and self.misfire_policy == MisfirePolicy.SKIP:
+                self.__advance_period(now)
+        if not missed or self.misfire_policy == MisfirePolicy.CATCH_UP_ONCE:
+            self.restored_fire = now - min(lateness, 0.)
+        return self.get_next_fire_time()
+
+    def schedule_next(self, due: float, now: float, wall_now: datetime.datetime) -> None:
+        """The task that was due at `due` is called at `now`"""
+        self.last_fire = wall_now
+        self.__due = due
+        if self.restored_fire is not None and self.restored_fire <= now:
+            self.restored_fire = None
+        if self.period is not None and self.period_fire is not None and self.period_fire <= now:
+            if self.period_mode == PeriodMode.FIXED_DELAY:
+                self.period_fire = None
+                self.__waits_for_end = True
+            else:
+                self.__advance_period(now)
+        if self.calendar_fire is not None and self.calendar_fire <= now:
+            # The monotonic and the wall clocks can slightly differ, so don't fire twice for the same moment
+            after = wall_now if self.calendar_due is None else max(wall_now, self.calendar_due)
+            self.__schedule_calendar(now, wall_now, after)
+
+    def schedule_after_end(self, now: float) -> bool:
+        """
+        A call of the task ended at `now`.
+        :returns: True if the next fire time has changed.
+        """
+        if not self.__waits_for_end or self.period is None:
+            return False
+        self.__waits_for_end = False
+        self.period_fire = now + self.period
+        return True
+
+    def get_state(self, fire_time: Optional[float], now: float, wall_now: datetime.datetime) -> JobState:
+        """The state to save, if the next call is at monotonic `fire_time`"""
+        next_fire = None if fire_time is None else wall_now + datetime.timedelta(seconds=fire_time - now)
+        return JobState(self.last_fire, next_fire)
+
+    def record_start(self, now: float, wall_now: datetime.datetime) -> None:
+        """A call of the task started at `now`"""
+        stats = self.__stats
+        stats.runs += 1
+        stats.last_start = wall_now
+        if self.__due is not None:
+            stats.lateness = max(now - self.__due, 0.)
+            stats.max_lateness = max(stats.max_lateness, stats.lateness)
+
+    def record_end(self, duration: float, wall_now: datetime.datetime, failed: bool, timed_out: bool = False) -> None:
+        """A call of the task took `duration` seconds and ended"""
+        stats = self.__stats
+        stats.last_end = wall_now
+        stats.last_duration = duration
+        stats.durations.observe(duration)
+        if failed or timed_out:
+            stats.failures += 1
+        if timed_out:
+            stats.timeouts += 1
+            self.timeouts_in_row += 1
+        else:
+            self.timeouts_in_row = 0
+
+    def get_stats(self, fire_time: Optional[float], now: float, wall_now: datetime.datetime) -> TaskStats:
+        """A snapshot of the statistics, if the next call is at monotonic `fire_time`"""
+        stats = self.__stats.copy()
+        stats.next_fire = self.get_state(fire_time, now, wall_now).next_fire
+        stats.running = self.running
+        stats.queued = self.queued
+        stats.skipped = self.skipped
+        stats.coalesced = self.coalesced
+        if self.group is not None:
+            stats.group = self.group.name
+            stats.paused = self.group.paused
+        return stats
+
+    @property
+    def is_paused(self) -> bool:
+        return self.group is not None and self.group.paused
+
+    def __advance_period(self, now: float) -> None:
+        """Move to the first point of the grid after `now`. Missed points are skipped"""
+        assert self.period is not None
+        index = max(self.__period_index + 1, math.floor((now - self.__origin) / self.period) + 1)
+        self.coalesced += max(index - self.__period_index - 1, 0)
+        self.__period_index = index
+        self.period_fire = self.__origin + index * self.period
+
+    def __schedule_calendar(self, now: float, wall_now: datetime.datetime, after: datetime.datetime) -> None:
+        if not self.calendar_triggers:
+            return
+        next_times = (trigger.get_next_fire_time(after) for trigger in self.calendar_triggers)
+        due_times = [due for due in next_times if due is not None]
+        self.calendar_due = min(due_times) if due_times else None
+        self.calendar_fire = None if self.calendar_due is None \
+            else now + (self.calendar_due - wall_now).total_seconds()
+
+
+class TaskGroup:
+    """Tasks paused and resumed together, e.g. the tasks of a bot"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.paused = False
+        self.tasks: dict[str, BaseTaskContainer] = {}
+        # Tasks that came due while the group was paused
+        self.parked: list[BaseTaskContainer] = []
+
+    def add(self, container: BaseTaskContainer) -> None:
+        container.group = self
+        self.tasks[container.name] = container
+
+    def remove(self, container: BaseTaskContainer) -> None:
+        self.tasks.pop(container.name, None)
+
+
+class TaskGroups:
+    """Groups of the tasks of a scheduler by their names"""
+
+    def __init__(self) -> None:
+        self.__groups: dict[str, TaskGroup] = {}
+
+    def add(self, container: BaseTaskContainer, group: Optional[str]) -> None:
+        if group is None:
+            return
+        task_group = self.__groups.get(group)
+        if task_group is None:
+            task_group = TaskGroup(group)
+            self.__groups[group] = task_group
+        task_group.add(container)
+
+    def remove(self, container: BaseTaskContainer) -> None:
+        task_group = container.group
+        if task_group is None:
+            return
+        task_group.remove(container)
+        if not task_group.tasks:
+            del self.__groups[task_group.name]
+
+    def pause(self, group: str) -> bool:
+        task_group = self.__groups.get(group)
+        if task_group is None:
+            return False
+        task_group.paused = True
+        return True
+
+    def resume(self, group: str) -> Optional[list[BaseTaskContainer]]:
+        """
+        :returns: the tasks that came due while the group was paused, None if there is no such group.
+        """
+        task_group = self.__groups.get(group)
+        if task_group is None:
+            return None
+        task_group.paused = False
+        parked, task_group.parked = task_group.parked, []
+        return parked
+
+
+class Job:
+    """A one-shot call. Keeps only what's needed, because there may be lots of pending jobs"""
+    __slots__ = ('job_id', 'caller', 'entry')
+
+    def __init__(self, job_id: str, caller: Callable[[], Any]):
+        self.job_id = job_id
+        self.caller = caller
+        # The entry of the heap: [fire time, sequence number, job]. The job is None if it's cancelled
+        self.entry: Optional[list] = None
+
+
+class JobQueue:
+    """
+    Pending one-shot jobs in a min-heap ordered by their fire time. Adding and cancelling a job cost O(log n).
+    Cancelled jobs stay in the heap until they are popped, the heap is rebuilt if they are most of it.
+    """
+    __compaction_threshold = 64
+
+    def __init__(self) -> None:
+        self.__heap: list[list] = []
+        self.__jobs: dict[str, Job] = {}
+        self.__counter = itertools.count()
+        self.__removed = 0
+
+    def __len__(self) -> int:
+        return len(self.__jobs)
+
+    def add(self, job_id: str, fire_time: float, caller: Callable[[], Any]) -> bool:
+        """
+        Add the job at monotonic `fire_time`, replacing a pending job with the same id.
+        :returns: True if the job is the earliest now.
+        """
+        self.cancel(job_id)
+        job = Job(job_id, caller)
+        job.entry = [fire_time, next(self.__counter), job]
+        self.__jobs[job_id] = job
+        heapq.heappush(self.__heap, job.entry)
+        return self.__heap[0] is job.entry
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.__jobs.pop(job_id, None)
+        if job is None or job.entry is None:
+            return False
+        job.entry[-1] = None
+        job.entry = None
+        self.__removed += 1
+        if self.__removed > self.__compaction_threshold and self.__removed * 2 > len(self.__heap):
+            self.__heap = [entry for entry in self.__heap if entry[-1] is not None]
+            heapq.heapify(self.__heap)
+            self.__removed = 0
+        return True
+
+    def get_next_fire_time(self) -> Optional[float]:
+        heap = self.__heap
+        while heap and heap[0][-1] is None:
+            heapq.heappop(heap)
+            self.__removed -= 1
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now: float) -> list[Job]:
+        """Take the jobs whose fire time has come, in the order of their fire times"""
+        due: list[Job] = []
+        while True:
+            fire_time = self.get_next_fire_time()
+            if fire_time is None or fire_time > now:
+                return due
+            job: Job = heapq.heappop(self.__heap)[-1]
+            job.entry = None
+            del self.__jobs[job.job_id]
+            due.append(job)
+
+
+class JobStoreWriter:
+    """
+    Saves the states of the tasks in a worker thread, so a slow disk doesn't stop the event loop.
+    The states are collected for `delay` seconds and written in one batch, with only the last state of each task.
+    Outside of the event loop, e.g. while the tasks are added before the start, a state is written at once.
+    """
+
+    def __init__(self,
+                 job_store: IJobStore,
+                 logger: ILogger,
+                 delay: float = 1.,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep):
+        self.__job_store = job_store
+        self.__logger = logger
+        self.__delay = delay
+        self.__sleep = sleep
+        self.__pending: dict[str, JobState] = {}
+        self.__flusher: Optional[asyncio.Task] = None
+        self.__lock: Optional[asyncio.Lock] = None
+
+    def save(self, name: str, state: JobState) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.__job_store.save(name, state)
+            return
+        self.__pending[name] = state
+        if self.__flusher is None:
+            self.__flusher = loop.create_task(self.__flush_later())
+
+    async def flush(self) -> None:
+        """Write the collected states and wait for it"""
+        if self.__lock is None:
+            self.__lock = asyncio.Lock()
+        # One batch is written at a time, the store isn't used by several threads at once
+        async with self.__lock:
+            while self.__pending:
+                batch, self.__pending = self.__pending, {}
+                try:
+                    await asyncio.to_thread(self.__job_store.save_many, batch)
+                except Exception as e:
+                    await self.__logger.exception_async(f'Failed to save the states of the tasks. Exception: {e}')
+
+    async def close(self) -> None:
+        """Write the collected states and close the store"""
+        if self.__flusher is not None:
+            self.__flusher.cancel()
+            self.__flusher = None
+        try:
+            await self.flush()
+        finally:
+            await asyncio.to_thread(self.__job_store.close)
+
+    async def __flush_later(self) -> None:
+        await self.__sleep(self.__delay)
+        # The states saved from now on need a new flush
+        self.__flusher = None
+        await self.flush()
+
+
+class TaskSupervisor:
+    """
+    Launches the calls of the tasks as asyncio tasks, so a slow task doesn't delay the others.
+    Applies the overlap policies of the tasks and the global limit of simultaneous calls.
+
+    Callers log exceptions derived from `Exception` themselves, the supervisor only counts them. Other `BaseException`s
+    (e.g. `ExitApplicationException` raised by `shutdown_app`) are remembered and the owner task is cancelled,
+    so the owner can re-raise them by calling `raise_pending`.
+
+    A call longer than the timeout of its task is cancelled, and the timeout is reported to `on_timeout`.
+    """
+
+    def __init__(self,
+                 max_concurrency: Optional[int],
+                 owner: Optional[asyncio.Task] = None,
+                 on_end: Optional[Callable[[BaseTaskContainer], None]] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_timeout: Optional[Callable[[BaseTaskContainer], Awaitable[None]]] = None,
+                 wall_clock: Callable[[], datetime.datetime] = utc_now):
+        """
+        :param on_end: called when a call of a task ends.
+        :param clock: monotonic clock the durations and lateness of the calls are measured with.
+        :param on_timeout: called when a call of a task is cancelled by its timeout.
+        :param wall_clock: current aware datetime, for the statistics.
+        """
+        self.__slots = asyncio.Semaphore(max_concurrency) if max_concurrency is not None else None
+        self.__owner = owner
+        self.__on_end = on_end
+        self.__clock = clock
+        self.__on_timeout = on_timeout
+        self.__wall_clock = wall_clock
+        self.__tasks: set[asyncio.Task] = set()
+        self.__pending_exception: Optional[BaseException] = None
+        self.__closed = False
+
+    @property
+    def running(self) -> int:
+        return len(self.__tasks)
+
+    def launch(self, container: BaseTaskContainer) -> bool:
+        """
+        Call the task in the background.
+        :returns: False if the call is skipped by the overlap policy.
+        """
+        if container.overlap != OverlapPolicy.ALLOW and container.running >= container.max_instances:
+            if container.overlap == OverlapPolicy.QUEUE and container.queued < container.max_instances:
+                container.queued += 1
+                return True
+            container.skipped += 1
+            return False
+        self.__start(container)
+        return True
+
+    def launch_job(self, job: Job) -> None:
+        """Call the one-shot job in the background"""
+        self.__track(asyncio.create_task(self.__guard(job.caller), name=f'job {job.job_id}'))
+
+    def raise_pending(self) -> None:
+        """Re-raise an exception that a task let out, if there is one"""
+        if self.__pending_exception is not None:
+            exception, self.__pending_exception = self.__pending_exception, None
+            raise exception
+
+    async def close(self) -> None:
+        """Cancel the running calls and wait for them"""
+        self.__closed = True
+        for task in self.__tasks:
+            task.cancel()
+        while self.__tasks:
+            tasks = list(self.__tasks)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Done callbacks may not have removed the finished tasks yet
+            self.__tasks.difference_update(tasks)
+
+    def __start(self, container: BaseTaskContainer) -> None:
+        container.running += 1
+        self.__track(asyncio.create_task(self.__run(container), name=f'task {container.name}'))
+
+    def __track(self, task: asyncio.Task) -> None:
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __guard(self, call: Callable[[], Awaitable[Any]]) -> None:
+        """Take a slot, then call. Exceptions derived from `Exception` are logged by the callers"""
+        try:
+            if self.__slots is None:
+                await call()
+            else:
+                async with self.__slots:
+                    await call()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            pass
+        except BaseException as e:
+            if self.__pending_exception is None:
+                self.__pending_exception = e
+                if self.__owner is not None and not self.__owner.done():
+                    self.__owner.cancel()
 
-    def set_called(self) -> None:
-        self.__last_called = now()
-        self.__called_once = True
+    async def __run(self, container: BaseTaskContainer) -> None:
+        try:
+            await self.__guard(lambda: self.__call(container))
+        finally:
+            container.running -= 1
+            if not self.__closed:
+                if self.__on_end is not None:
+                    self.__on_end(container)
+                if container.queued > 0:
+                    container.queued -= 1
+                    self.__start(container)
 
-    def should_run(self) -> bool:
-        if not self.__called_once and self.run_at_start:
-            return True
+    async def __call(self, container: BaseTaskContainer) -> None:
+        started = self.__clock()
+        container.record_start(started, self.__wall_clock())
+        failed = False
+        timed_out = False
+        try:
+            if container.timeout is None:
+                await container.caller()
+            else:
+                timed_out = not await call_with_timeout(container.caller, container.timeout)
+        except Exception:
+            failed = True
+        finally:
+            container.record_end(self.__clock() - started, self.__wall_clock(), failed, timed_out)
+        if timed_out and self.__on_timeout is not None:
+            await self.__on_timeout(container)
 
-        left_point = self.__last_called if self.__last_called else self.start_point
 
-        for trigger in self.triggers:
-            if isinstance(trigger, IPeriodTrigger):
-                if now() - left_point >= trigger.get_period():
-                    return True
+async def call_with_timeout(call: Callable[[], Awaitable[Any]], timeout: float) -> bool:
+    """
+    Cancel the call if it's not finished in `timeout` seconds.
+    Unlike `asyncio.wait_for`, a `TimeoutError` raised by the call itself isn't taken for the timeout.
+    :returns: False if the call is cancelled by the timeout.
+    """
+    task = asyncio.current_task()
+    assert task is not None
+    expired = False
+
+    def expire() -> None:
+        nonlocal expired
+        expired = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(timeout, expire)
+    try:
+        await call()
+    except asyncio.CancelledError:
+        if not expired:
+            raise
+        if hasattr(task, 'uncancel'):
+            # Python 3.11+ counts the cancellations. This one is handled
+            task.uncancel()
         return False
+    finally:
+        handle.cancel()
+    return True
+
+
+async def report_timeout(container: BaseTaskContainer, logger: ILogger) -> bool:
+    """
+    Log the timeout of a call as a structured event.
+    :returns: True if the task has timed out too many times in a row and must be removed.
+    """
+    disable = container.max_timeouts is not None and container.timeouts_in_row >= container.max_timeouts
+    await logger.warning_async(
+        f'Task {container.name} timed out after {container.timeout} seconds and was cancelled. '
+        f'Timeouts in a row: {container.timeouts_in_row}.'
+        + (' The task is removed from the scheduler' if disable else ''),
+        extra={
+            'event': 'task_timeout',
+            'task': container.name,
+            'timeout': container.timeout,
+            'timeouts_in_row': container.timeouts_in_row,
+            'disabled': disable,
+        }
+    )
+    return disable
+
+
+async def supervise(run_scheduler: Callable[[TaskSupervisor], Any],
+                    max_concurrency: Optional[int],
+                    on_end: Optional[Callable[[BaseTaskContainer], None]] = None,
+                    clock: Callable[[], float] = time.monotonic,
+                    on_timeout: Optional[Callable[[BaseTaskContainer], Awaitable[None]]] = None,
+                    wall_clock: Callable[[], datetime.datetime] = utc_now,
+                    writer: Optional[JobStoreWriter] = None) -> None:
+    """
+    Run the loop of a scheduler with a supervisor of the calls. Re-raise control exceptions let out by the tasks.
+    When the loop ends, the job store is flushed and closed.
+    """
+    supervisor = TaskSupervisor(max_concurrency, owner=asyncio.current_task(), on_end=on_end, clock=clock,
+                                on_timeout=on_timeout, wall_clock=wall_clock)
+    try:
+        await run_scheduler(supervisor)
+    except asyncio.CancelledError:
+        supervisor.raise_pending()
+        raise
+    finally:
+        try:
+            await supervisor.close()
+        finally:
+            if writer is not None:
+                await writer.close()
+
+
+class TaskContainer(BaseTaskContainer):
+    first_fire: Optional[float] = None
+
+    def set_called(self, now: float, wall_now: datetime.datetime) -> None:
+        due = self.get_fire_time()
+        self.first_fire = None
+        self.schedule_next(now if due is None else due, now, wall_now)
+
+    def get_fire_time(self) -> Optional[float]:
+        return self.first_fire if self.first_fire is not None else self.get_next_fire_time()
+
+    def should_run(self, now: float) -> bool:
+        fire_time = self.get_fire_time()
+        return fire_time is not None and fire_time <= now
 
 
 class SimpleScheduler(IScheduler):
+    """
+    Checks every task and one-shot job once a second.
+    Use `HeapScheduler` if there are many tasks or they need better precision.
+    """
     __tasks: dict[str, TaskContainer]
     __ping_updates_period_seconds: float = 1.0
-    __supported_trigger_types = (IPeriodTrigger,)
+    __supported_trigger_types = (ITrigger,)
 
-    def __init__(self):
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 job_store: Optional[IJobStore] = None,
+                 default_timeout: Optional[float] = None,
+                 logger: Optional[ILogger] = None,
+                 wall_clock: Callable[[], datetime.datetime] = utc_now):
+        """
+        :param max_concurrency: how many calls of all the tasks can run at the same time. Unlimited if None.
+        :param job_store: remembers the fire times of the tasks between restarts.
+            The states are saved from a worker thread once a second, and the store is closed when the scheduler stops.
+        :param default_timeout: cancel a call of a task without its own timeout if it runs longer, seconds.
+        :param logger: logs the timeouts and the failures of the job store.
+        :param wall_clock: current aware datetime. The fire times of the calendar triggers and one-shot jobs
+            are converted with it.
+        """
+        assert max_concurrency is None or isinstance(max_concurrency, int) and max_concurrency >= 1, \
+            'max_concurrency must be a positive integer or None'
+        assert default_timeout is None or default_timeout > 0, 'default_timeout must be positive or None'
         self.__tasks = {}
+        self.__groups = TaskGroups()
+        self.__jobs = JobQueue()
+        self.__max_concurrency = max_concurrency
+        self.__clock = clock
+        self.__wall_clock = wall_clock
+        self.__job_store = job_store
+        self.__default_timeout = default_timeout
+        self.__logger = logger or SysIOLoggerFactory().get_logger()
+        self.__writer = JobStoreWriter(job_store, self.__logger) if job_store is not None else None
 
     def add_task(self,
                  task_info: TaskInfo,
@@ -63,28 +674,309 @@ class SimpleScheduler(IScheduler):
             assert isinstance(trigger, self.__supported_trigger_types), \
                 f'Trigger type {trigger.__class__.__name__} is not supported'
 
-        self.__tasks[task_info.name] = TaskContainer(task_info, caller, now())
+        container = TaskContainer(task_info, caller)
+        if container.timeout is None:
+            container.timeout = self.__default_timeout
+        state = self.__job_store.load(task_info.name) if self.__job_store is not None else None
+        now, wall_now = self.__clock(), self.__wall_clock()
+        container.first_fire = container.schedule_first(now, wall_now, state)
+        self.__tasks[task_info.name] = container
+        self.__groups.add(container, task_info.group)
+        self.__save(container, now, wall_now)
 
     def remove_task(self, name: str) -> None:
         assert name in self.__tasks, f'Task {name} has not been added'
-        del self.__tasks[name]
+        self.__groups.remove(self.__tasks.pop(name))
+
+    def pause_group(self, group: str) -> bool:
+        return self.__groups.pause(group)
+
+    def resume_group(self, group: str) -> bool:
+        # Due tasks of the group are called on the next check
+        return self.__groups.resume(group) is not None
 
     def list_tasks(self) -> list[str]:
         return list(self.__tasks.keys())
 
+    def add_job(self, job_id: str, fire_time: datetime.datetime, caller: Callable[[], Any]) -> None:
+        self.__jobs.add(job_id, self.__clock() + (fire_time - self.__wall_clock()).total_seconds(), caller)
+
+    def cancel_job(self, job_id: str) -> bool:
+        return self.__jobs.cancel(job_id)
+
+    def get_task_stats(self) -> list[TaskStats]:
+        now, wall_now = self.__clock(), self.__wall_clock()
+        return [task.get_stats(task.get_fire_time(), now, wall_now) for task in self.__tasks.values()]
+
     async def start(self) -> None:
+        await supervise(self.__loop, self.__max_concurrency, self.__on_call_end, self.__clock, self.__on_timeout,
+                        self.__wall_clock, self.__writer)
+
+    async def __loop(self, supervisor: TaskSupervisor) -> None:
         await asyncio.sleep(0)
         while True:
-            await self.__run_pending_tasks()
+            self.__run_pending_tasks(supervisor)
             await asyncio.sleep(self.__ping_updates_period_seconds)
 
-    def __find_tasks_to_run(self) -> list[TaskContainer]:
-        return [task for task in self.__tasks.values() if task.should_run()]
+    def __on_call_end(self, container: BaseTaskContainer) -> None:
+        assert isinstance(container, TaskContainer)
+        if self.__tasks.get(container.name) is not container:
+            # The task is removed
+            return
+        now = self.__clock()
+        if container.schedule_after_end(now):
+            self.__save(container, now, self.__wall_clock())
+
+    async def __on_timeout(self, container: BaseTaskContainer) -> None:
+        if await report_timeout(container, self.__logger) and self.__tasks.get(container.name) is container:
+            self.remove_task(container.name)
+
+    def __run_pending_tasks(self, supervisor: TaskSupervisor) -> None:
+        now, wall_now = self.__clock(), self.__wall_clock()
+        for task in [task for task in self.__tasks.values() if task.should_run(now) and not task.is_paused]:
+            task.set_called(now, wall_now)
+            self.__save(task, now, wall_now)
+            supervisor.launch(task)
+        for job in self.__jobs.pop_due(now):
+            supervisor.launch_job(job)
+
+    def __save(self, container: TaskContainer, now: float, wall_now: datetime.datetime) -> None:
+        if self.__writer is not None:
+            self.__writer.save(container.name, container.get_state(container.get_fire_time(), now, wall_now))
+
+
+class HeapTaskContainer(BaseTaskContainer):
+    # The entry of the heap: [fire time, sequence number, container]. The container is None if the task is removed
+    entry: Optional[list] = None
+    # The fire time of a task that came due while its group was paused. It's out of the heap until the group resumes
+    parked_fire: Optional[float] = None
+
+    def get_scheduled_time(self) -> Optional[float]:
+        if self.entry is not None:
+            return self.entry[0]
+        return self.parked_fire
+
+
+class HeapScheduler(IScheduler):
+    """
+    Keeps the tasks in a min-heap ordered by their next fire time and sleeps exactly until the earliest one.
+    Adding and removing a task costs O(log n), and an idle scheduler costs nothing regardless of the number of tasks.
+    The fire times are measured with a monotonic clock, so periods don't jump if the system time is changed.
+    Any `ITrigger` is supported: triggers other than periods are asked for their next fire time after each call.
+    One-shot jobs added at runtime are kept in a lighter heap of their own, so millions of them are fine.
+    """
+    # Removed tasks stay in the heap until they are popped. Rebuild the heap if they are most of it
+    __compaction_threshold = 64
+
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+                 job_store: Optional[IJobStore] = None,
+                 default_timeout: Optional[float] = None,
+                 logger: Optional[ILogger] = None,
+                 wall_clock: Callable[[], datetime.datetime] = utc_now):
+        """
+        :param max_concurrency: how many calls of all the tasks can run at the same time. Unlimited if None.
+        :param clock: monotonic clock, seconds.
+        :param sleep: waits for the given number of seconds of the clock. A virtual clock can be used in tests.
+        :param job_store: remembers the fire times of the tasks between restarts.
+            The states are saved from a worker thread once a second, and the store is closed when the scheduler stops.
+        :param default_timeout: cancel a call of a task without its own timeout if it runs longer, seconds.
+            Timeouts are measured with the event loop time, not with `clock`.
+        :param logger: logs the timeouts and the failures of the job store.
+        :param wall_clock: current aware datetime. The fire times of the calendar triggers and one-shot jobs
+            are converted with it. A virtual one can be used in tests together with `clock`.
+        """
+        assert max_concurrency is None or isinstance(max_concurrency, int) and max_concurrency >= 1, \
+            'max_concurrency must be a positive integer or None'
+        assert default_timeout is None or default_timeout > 0, 'default_timeout must be positive or None'
+        self.__max_concurrency = max_concurrency
+        self.__tasks: dict[str, HeapTaskContainer] = {}
+        self.__groups = TaskGroups()
+        self.__heap: list[list] = []
+        self.__counter = itertools.count()
+        self.__removed = 0
+        self.__jobs = JobQueue()
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__wall_clock = wall_clock
+        self.__job_store = job_store
+        self.__default_timeout = default_timeout
+        self.__logger = logger or SysIOLoggerFactory().get_logger()
+        self.__writer = JobStoreWriter(job_store, self.__logger, sleep=sleep) if job_store is not None else None
+        self.__wakeup: Optional[asyncio.Event] = None
+
+    def add_task(self,
+                 task_info: TaskInfo,
+                 caller: Callable[[], Any]
+                 ) -> None:
+        assert task_info.name not in self.__tasks, f'Task {task_info.name} has already been added'
+        for trigger in task_info.triggers:
+            assert isinstance(trigger, ITrigger), f'Trigger type {trigger.__class__.__name__} is not supported'
+
+        container = HeapTaskContainer(task_info, caller)
+        if container.timeout is None:
+            container.timeout = self.__default_timeout
+        self.__tasks[task_info.name] = container
+        self.__groups.add(container, task_info.group)
+        state = self.__job_store.load(task_info.name) if self.__job_store is not None else None
+        now, wall_now = self.__clock(), self.__wall_clock()
+        fire_time = container.schedule_first(now, wall_now, state)
+        if fire_time is not None:
+            self.__push(container, fire_time)
+        self.__save(container, fire_time, now, wall_now)
+
+    def remove_task(self, name: str) -> None:
+        assert name in self.__tasks, f'Task {name} has not been added'
+        container = self.__tasks.pop(name)
+        self.__discard_entry(container)
+        self.__groups.remove(container)
+
+    def pause_group(self, group: str) -> bool:
+        # The tasks stay in the heap. When one of them comes due, it's parked until the group is resumed
+        return self.__groups.pause(group)
+
+    def resume_group(self, group: str) -> bool:
+        parked = self.__groups.resume(group)
+        if parked is None:
+            return False
+        for container in parked:
+            assert isinstance(container, HeapTaskContainer)
+            if self.__tasks.get(container.name) is container and container.parked_fire is not None:
+                self.__push(container, container.parked_fire)
+            container.parked_fire = None
+        return True
+
+    def list_tasks(self) -> list[str]:
+        return list(self.__tasks.keys())
+
+    def add_job(self, job_id: str, fire_time: datetime.datetime, caller: Callable[[], Any]) -> None:
+        delay = (fire_time - self.__wall_clock()).total_seconds()
+        is_earliest = self.__jobs.add(job_id, self.__clock() + delay, caller)
+        if is_earliest and self.__wakeup is not None:
+            self.__wakeup.set()
 
-    async def __run_pending_tasks(self) -> None:
-        for task in self.__find_tasks_to_run():
-            # TODO: a temporary solution. Had better launch with `create_task`,
-            #  but then class must supervise these tasks
-            task.set_called()
-            await task.caller()
+    def cancel_job(self, job_id: str) -> bool:
+        return self.__jobs.cancel(job_id)
+
+    def get_task_stats(self) -> list[TaskStats]:
+        now, wall_now = self.__clock(), self.__wall_clock()
+        return [container.get_stats(container.get_scheduled_time(), now, wall_now)
+                for container in self.__tasks.values()]
+
+    async def start(self) -> None:
+        await supervise(self.__loop, self.__max_concurrency, self.__on_call_end, self.__clock, self.__on_timeout,
+                        self.__wall_clock, self.__writer)
+
+    async def __loop(self, supervisor: TaskSupervisor) -> None:
+        self.__wakeup = asyncio.Event()
+        while True:
+            await self.__wait_for_next_task()
+            self.__run_due_tasks(supervisor)
+
+    def __push(self, container: HeapTaskContainer, fire_time: float) -> None:
+        entry = [fire_time, next(self.__counter), container]
+        container.entry = entry
+        heapq.heappush(self.__heap, entry)
+        if self.__heap[0] is entry and self.__wakeup is not None:
+            # The new task is earlier than the one the scheduler is sleeping for
+            self.__wakeup.set()
+
+    def __discard_entry(self, container: HeapTaskContainer) -> None:
+        if container.entry is None:
+            return
+        container.entry[-1] = None
+        container.entry = None
+        self.__removed += 1
+        if self.__removed > self.__compaction_threshold and self.__removed * 2 > len(self.__heap):
+            self.__heap = [entry for entry in self.__heap if entry[-1] is not None]
+            heapq.heapify(self.__heap)
+            self.__removed = 0
+
+    def __peek(self) -> Optional[list]:
+        heap = self.__heap
+        while heap and heap[0][-1] is None:
+            heapq.heappop(heap)
+            self.__removed -= 1
+        return heap[0] if heap else None
+
+    async def __wait_for_next_task(self) -> None:
+        assert self.__wakeup is not None
+        self.__wakeup.clear()
+        entry = self.__peek()
+        fire_times = [fire for fire in (entry[0] if entry is not None else None, self.__jobs.get_next_fire_time())
+                      if fire is not None]
+        if not fire_times:
+            await self.__wakeup.wait()
+            return
+        deadline = min(fire_times)
+        if deadline <= self.__clock():
+            # Let the other coroutines work even if the tasks are always due
             await asyncio.sleep(0)
+            return
+        sleeper = asyncio.ensure_future(self.__sleep_until(deadline))
+        waker = asyncio.ensure_future(self.__wakeup.wait())
+        try:
+            await asyncio.wait((sleeper, waker), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleeper.cancel()
+            waker.cancel()
+
+    async def __sleep_until(self, deadline: float) -> None:
+        # The timeout is computed when the sleeper starts, the tasks launched before could have taken some time
+        timeout = deadline - self.__clock()
+        if timeout > 0:
+            await self.__sleep(timeout)
+
+    def __run_due_tasks(self, supervisor: TaskSupervisor) -> None:
+        now = self.__clock()
+        due: list[tuple[float, HeapTaskContainer]] = []
+        while True:
+            entry = self.__peek()
+            if entry is None or entry[0] > now:
+                break
+            heapq.heappop(self.__heap)
+            container: HeapTaskContainer = entry[-1]
+            container.entry = None
+            if container.is_paused:
+                assert container.group is not None
+                container.parked_fire = entry[0]
+                container.group.parked.append(container)
+                continue
+            due.append((entry[0], container))
+        wall_now = self.__wall_clock()
+        for due_time, container in due:
+            container.schedule_next(due_time, now, wall_now)
+            fire_time = container.get_next_fire_time()
+            if fire_time is not None:
+                self.__push(container, fire_time)
+            self.__save(container, fire_time, now, wall_now)
+            supervisor.launch(container)
+        for job in self.__jobs.pop_due(now):
+            supervisor.launch_job(job)
+
+    def __on_call_end(self, container: BaseTaskContainer) -> None:
+        assert isinstance(container, HeapTaskContainer)
+        if self.__tasks.get(container.name) is not container:
+            # The task is removed
+            return
+        now = self.__clock()
+        if container.schedule_after_end(now):
+            self.__discard_entry(container)
+            fire_time = container.get_next_fire_time()
+            if fire_time is not None:
+                self.__push(container, fire_time)
+            self.__save(container, fire_time, now, self.__wall_clock())
+
+    async def __on_timeout(self, container: BaseTaskContainer) -> None:
+        if await report_timeout(container, self.__logger) and self.__tasks.get(container.name) is container:
+            self.remove_task(container.name)
+
+    def __save(self,
+               container: HeapTaskContainer,
+               fire_time: Optional[float],
+               now: float,
+               wall_now: datetime.datetime) -> None:
+        if self.__writer is not None:
+            self.__writer.save(container.name, container.get_state(fire_time, now, wall_now))
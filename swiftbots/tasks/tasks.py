@@ -1,14 +1,67 @@
+from enum import Enum
+from typing import Optional, Union
+
 from swiftbots.all_types import ITrigger
 from swiftbots.types import DecoratedCallable
 
 
+class OverlapPolicy(str, Enum):
+    """What a scheduler does if a task fires while `max_instances` of its calls are still running"""
+    # Don't call the task this time
+    SKIP = 'skip'
+    # Call the task when one of the running calls finishes. At most `max_instances` calls wait
+    QUEUE = 'queue'
+    # Call the task anyway. `max_instances` is ignored
+    ALLOW = 'allow'
+
+
+class PeriodMode(str, Enum):
+    """How a period of a task is counted"""
+    # From the previous fire time, so the calls keep to a fixed grid. Fires missed during a stall are merged into one
+    FIXED_RATE = 'fixed_rate'
+    # From the end of the previous call
+    FIXED_DELAY = 'fixed_delay'
+
+
+class MisfirePolicy(str, Enum):
+    """What a scheduler with a job store does with a fire missed while the app was down"""
+    # Call the task once at the start, however many fires were missed
+    CATCH_UP_ONCE = 'catch_up_once'
+    # Don't call the task until its next fire time
+    SKIP = 'skip'
+
+
 class TaskInfo:
     def __init__(self,
                  name: str,
                  func: DecoratedCallable,
                  triggers: list[ITrigger],
-                 run_at_start: bool):
+                 run_at_start: bool,
+                 max_instances: int = 1,
+                 overlap: Union[OverlapPolicy, str] = OverlapPolicy.SKIP,
+                 period_mode: Union[PeriodMode, str] = PeriodMode.FIXED_RATE,
+                 misfire_policy: Union[MisfirePolicy, str] = MisfirePolicy.CATCH_UP_ONCE,
+                 misfire_grace_time: float = 0.,
+                 timeout: Optional[float] = None,
+                 max_timeouts: Optional[int] = None,
+                 group: Optional[str] = None):
+        """
+        :param group: tasks of a group are paused and resumed together. The tasks of a bot make a group.
+        """
+        assert isinstance(max_instances, int) and max_instances >= 1, 'max_instances must be a positive integer'
+        assert misfire_grace_time >= 0, 'misfire_grace_time must be positive or zero'
+        assert timeout is None or timeout > 0, 'timeout must be positive or None'
+        assert max_timeouts is None or isinstance(max_timeouts, int) and max_timeouts >= 1, \
+            'max_timeouts must be a positive integer or None'
         self.name = name
         self.func = func
         self.triggers = triggers
         self.run_at_start = run_at_start
+        self.max_instances = max_instances
+        self.overlap = OverlapPolicy(overlap)
+        self.period_mode = PeriodMode(period_mode)
+        self.misfire_policy = MisfirePolicy(misfire_policy)
+        self.misfire_grace_time = misfire_grace_time
+        self.timeout = timeout
+        self.max_timeouts = max_timeouts
+        self.group = group
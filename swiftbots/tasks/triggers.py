@@ -1,6 +1,9 @@
-from datetime import timedelta
+from bisect import bisect_left
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional, Union
+from zoneinfo import ZoneInfo
 
-from swiftbots.all_types import IPeriodTrigger
+from swiftbots.all_types import IPeriodTrigger, ITrigger
 
 
 class PeriodTrigger(IPeriodTrigger):
@@ -14,3 +17,160 @@ class PeriodTrigger(IPeriodTrigger):
 
     def get_period(self) -> timedelta:
         return self.__period
+
+    def get_next_fire_time(self, after: datetime) -> Optional[datetime]:
+        if after.tzinfo is None:
+            after = after.astimezone()
+        return after + self.__period
+
+
+class DateTrigger(ITrigger):
+    """Fires once at the given moment"""
+
+    def __init__(self, run_date: datetime):
+        """
+        :param run_date: an aware datetime, or a naive one in the local time.
+        """
+        self.run_date = run_date if run_date.tzinfo is not None else run_date.astimezone()
+
+    def get_next_fire_time(self, after: datetime) -> Optional[datetime]:
+        if after.tzinfo is None:
+            after = after.astimezone()
+        return self.run_date if self.run_date > after else None
+
+
+class CronField:
+    """Allowed values of one field of a cron expression, sorted"""
+
+    def __init__(self, name: str, expression: str, minimum: int, maximum: int,
+                 aliases: Optional[dict[str, int]] = None):
+        self.is_any = expression == '*'
+        values: set[int] = set()
+        for part in expression.lower().split(','):
+            values.update(self.__parse_part(name, part, minimum, maximum, aliases or {}))
+        self.values = sorted(values)
+        self.__set = frozenset(values)
+
+    @staticmethod
+    def __parse_part(name: str, part: str, minimum: int, maximum: int, aliases: dict[str, int]) -> range:
+        def to_int(value: str) -> int:
+            number = aliases[value] if value in aliases else int(value)
+            assert minimum <= number <= maximum, f'Value {value} of cron field `{name}` is out of [{minimum}, {maximum}]'
+            return number
+
+        try:
+            part, _, step_str = part.partition('/')
+            step = int(step_str) if step_str else 1
+            assert step >= 1, f'Step of cron field `{name}` must be positive'
+            if part == '*':
+                start, end = minimum, maximum
+            elif '-' in part:
+                start_str, end_str = part.split('-', 1)
+                start, end = to_int(start_str), to_int(end_str)
+            else:
+                start = to_int(part)
+                end = maximum if step_str else start
+        except (ValueError, KeyError):
+            raise AssertionError(f'Invalid cron field `{name}`: {part}') from None
+        assert start <= end, f'Invalid range in cron field `{name}`: {part}'
+        return range(start, end + 1, step)
+
+    def __contains__(self, value: int) -> bool:
+        return value in self.__set
+
+    def next(self, value: int) -> Optional[int]:
+        """The least allowed value which is not less than `value`"""
+        i = bisect_left(self.values, value)
+        return self.values[i] if i < len(self.values) else None
+
+
+class CronTrigger(ITrigger):
+    """
+    Fires at the moments described by a cron expression: `minute hour day month day_of_week`.
+    Fields support `*`, numbers, ranges `1-5`, lists `1,15` and steps `*/10`. Months and days of week
+    can be named: `jan`, `mon`. Sunday is 0 or 7. As in cron, if both day and day_of_week are restricted,
+    the trigger fires when either of them matches.
+
+    Examples: `CronTrigger('0 3 * * *')` every day at 03:00, `CronTrigger('0 9 * * mon')` every Monday at 09:00.
+    """
+    __MONTHS = {name: i for i, name in enumerate(
+        ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1)}
+    __DAYS_OF_WEEK = {name: i for i, name in enumerate(('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))}
+    # The search gives up if the expression can't be met in this number of years, e.g. `0 0 30 2 *`
+    __MAX_YEARS = 30
+
+    def __init__(self, expression: str, timezone: Optional[Union[str, tzinfo]] = None):
+        """
+        :param expression: cron expression of 5 fields.
+        :param timezone: timezone the expression is evaluated in, e.g. `Europe/Berlin`. The local time if None.
+        """
+        assert isinstance(expression, str), 'Cron expression must be a string'
+        fields = expression.split()
+        assert len(fields) == 5, 'Cron expression must have 5 fields: minute hour day month day_of_week'
+        self.expression = expression
+        self.timezone: Optional[tzinfo] = ZoneInfo(timezone) if isinstance(timezone, str) else timezone
+        self.__minutes = CronField('minute', fields[0], 0, 59)
+        self.__hours = CronField('hour', fields[1], 0, 23)
+        self.__days = CronField('day', fields[2], 1, 31)
+        self.__months = CronField('month', fields[3], 1, 12, self.__MONTHS)
+        days_of_week = CronField('day_of_week', fields[4], 0, 7, self.__DAYS_OF_WEEK)
+        # Sunday is 0 or 7 in cron, datetime.weekday() of Monday is 0
+        self.__weekdays = frozenset((day - 1) % 7 for day in days_of_week.values)
+        self.__any_day = self.__days.is_any
+        self.__any_day_of_week = days_of_week.is_any
+
+    def get_next_fire_time(self, after: datetime) -> Optional[datetime]:
+        local_after = after.astimezone(self.timezone)
+        candidate = local_after.replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        while True:
+            naive = self.__find_next(candidate)
+            if naive is None:
+                return None
+            result = self.__localize(naive)
+            # A local time can repeat when clocks go back. Don't fire twice
+            if result > after.astimezone(result.tzinfo):
+                return result
+            candidate = naive + timedelta(minutes=1)
+
+    def __localize(self, naive: datetime) -> datetime:
+        if self.timezone is None:
+            return naive.astimezone()
+        return naive.replace(tzinfo=self.timezone)
+
+    def __day_matches(self, moment: datetime) -> bool:
+        day_matches = moment.day in self.__days
+        weekday_matches = moment.weekday() in self.__weekdays
+        if self.__any_day:
+            return weekday_matches
+        if self.__any_day_of_week:
+            return day_matches
+        return day_matches or weekday_matches
+
+    def __find_next(self, moment: datetime) -> Optional[datetime]:
+        """The first naive moment not earlier than `moment` which matches all the fields"""
+        last_year = moment.year + self.__MAX_YEARS
+        while moment.year <= last_year:
+            month = self.__months.next(moment.month)
+            if month is None:
+                moment = datetime(moment.year + 1, 1, 1)
+                continue
+            if month != moment.month:
+                moment = datetime(moment.year, month, 1)
+
+            if not self.__day_matches(moment):
+                moment = datetime(moment.year, moment.month, moment.day) + timedelta(days=1)
+                continue
+
+            hour = self.__hours.next(moment.hour)
+            if hour is None:
+                moment = datetime(moment.year, moment.month, moment.day) + timedelta(days=1)
+                continue
+            if hour != moment.hour:
+                moment = moment.replace(hour=hour, minute=0)
+
+            minute = self.__minutes.next(moment.minute)
+            if minute is None:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            return moment.replace(minute=minute)
+        return None
@@ -1,12 +1,27 @@
 from collections.abc import AsyncGenerator, Callable
-from typing import Any, TypeVar, Union
+from enum import Enum
+from typing import Any, NewType, TypeVar, Union
+
+
+class DependencyScope(str, Enum):
+    """How long a computed dependency lives"""
+    # Computed once per update (or per task call) and shared by all the functions resolved for it
+    UPDATE = 'update'
+    # Computed once and shared by all the updates and tasks of the bot
+    BOT = 'bot'
+    # Computed once and shared by all the bots of the application
+    APP = 'app'
 
 
 class DependencyContainer:
-    def __init__(self, dependency: Callable[..., Any]):
+    def __init__(self, dependency: Callable[..., Any], scope: DependencyScope = DependencyScope.UPDATE):
         self.dependency = dependency
+        self.scope = scope
 
 
 DecoratedCallable = TypeVar("DecoratedCallable", bound=Callable[..., Any])
 AsyncSenderFunction = TypeVar("AsyncSenderFunction", bound=Callable[[str, Union[str, int]], Any])
 AsyncListenerFunction = TypeVar("AsyncListenerFunction", bound=AsyncGenerator[Any, dict])
+
+# Annotation of a message handler parameter which takes the rest of the arguments, with the whitespace inside it
+RestOfLine = NewType('RestOfLine', str)
@@ -0,0 +1,165 @@
+__all__ = [
+    'WebhookConfig',
+    'WebhookServer',
+]
+
+import asyncio
+import contextlib
+import hmac
+import json
+import secrets
+from collections.abc import Awaitable, Callable
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+SECRET_TOKEN_HEADER = 'x-telegram-bot-api-secret-token'
+
+__REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+}
+
+
+def build_response(status: int, keep_alive: bool) -> bytes:
+    connection = 'keep-alive' if keep_alive else 'close'
+    return (f'HTTP/1.1 {status} {__REASONS[status]}\r\n'
+            f'Content-Length: 0\r\n'
+            f'Connection: {connection}\r\n\r\n').encode('latin-1')
+
+
+class WebhookConfig:
+    def __init__(self,
+                 url: str,
+                 host: str = '0.0.0.0',
+                 port: int = 8080,
+                 secret_token: Optional[str] = None,
+                 max_connections: int = 40,
+                 queue_size: int = 1000,
+                 max_body_size: int = 1024 * 1024,
+                 idle_timeout: float = 60):
+        """
+        :param url: public HTTPS url Telegram sends updates to. Its path is served by the local server.
+            A reverse proxy can terminate TLS and forward requests to `host`:`port`.
+        :param host: interface the local HTTP server listens on.
+        :param port: port the local HTTP server listens on. 0 lets the system choose a free port.
+        :param secret_token: value Telegram puts to the `X-Telegram-Bot-Api-Secret-Token` header.
+            Requests without it are refused. Generated if not given.
+        :param max_connections: maximum simultaneous connections Telegram opens to deliver updates, 1-100.
+        :param queue_size: how many received updates can wait for the handlers.
+            When it's full, the server answers Telegram only after some updates are taken.
+        :param max_body_size: larger requests are refused.
+        :param idle_timeout: seconds a connection can send nothing before it's closed.
+            Telegram keeps the connections open, so idle ones don't hold the server forever.
+        """
+        assert idle_timeout > 0, 'idle_timeout must be positive'
+        assert 1 <= max_connections <= 100, 'max_connections must be from 1 to 100'
+        self.url = url
+        self.path = urlsplit(url).path or '/'
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.max_body_size = max_body_size
+        self.idle_timeout = idle_timeout
+
+
+class WebhookServer:
+    """
+    A minimal HTTP/1.1 server on asyncio streams. It accepts POST requests with JSON updates
+    on the configured path and passes them to `on_update`. Keep-alive connections are supported.
+    """
+
+    def __init__(self, config: WebhookConfig, on_update: Callable[[dict], Awaitable[Any]]):
+        self.config = config
+        self.__on_update = on_update
+        self.__server: Optional[asyncio.Server] = None
+        self.__connections: set[asyncio.Task] = set()
+        self.received = 0
+        self.refused = 0
+
+    @property
+    def port(self) -> int:
+        """The port the server is actually bound to"""
+        assert self.__server is not None, 'Server is not started'
+        return self.__server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self.__server = await asyncio.start_server(self.__handle_connection, self.config.host, self.config.port)
+
+    async def close(self) -> None:
+        """Stop listening and drop the open connections, `wait_closed` waits for them otherwise"""
+        if self.__server is not None:
+            self.__server.close()
+            connections = list(self.__connections)
+            for connection in connections:
+                connection.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+            await self.__server.wait_closed()
+            self.__server = None
+
+    async def __read(self, read: Awaitable[bytes]) -> bytes:
+        return await asyncio.wait_for(read, self.config.idle_timeout)
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = asyncio.current_task()
+        assert connection is not None
+        self.__connections.add(connection)
+        try:
+            keep_alive = True
+            while keep_alive:
+                request_line = await self.__read(reader.readline())
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await self.__read(reader.readline())
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                length = int(headers.get('content-length', 0))
+                if length > self.config.max_body_size:
+                    self.refused += 1
+                    writer.write(build_response(413, keep_alive=False))
+                    break
+                body = await self.__read(reader.readexactly(length))
+
+                status = await self.__process(method, path, headers, body)
+                if status != 200:
+                    self.refused += 1
+                writer.write(build_response(status, keep_alive))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.TimeoutError):
+            # Broken, malformed or idle for too long. Nothing to answer
+            pass
+        finally:
+            self.__connections.discard(connection)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def __process(self, method: str, path: str, headers: dict[str, str], body: bytes) -> int:
+        if path.split('?', 1)[0] != self.config.path:
+            return 404
+        if method != 'POST':
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_TOKEN_HEADER, '').encode(),
+                                   self.config.secret_token.encode()):
+            return 401
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(update, dict):
+            return 400
+        self.received += 1
+        await self.__on_update(update)
+        return 200
@@ -41,3 +41,33 @@ class TestBasicBot:
 
         global global_dict
         assert global_dict['value'] == 'Some value'
+
+
+class TestConcurrentBot:
+
+    @pytest.mark.timeout(3)
+    def test_slow_handler_does_not_block_others(self):
+        handled = []
+        concurrent_bot = Bot(max_concurrency=4)
+
+        @concurrent_bot.handler()
+        async def handler(value: str):
+            if value == 'slow':
+                await asyncio.sleep(0.5)
+            handled.append(value)
+            if value == 'exit':
+                shutdown_app()
+
+        @concurrent_bot.listener()
+        async def listen_async():
+            for value in ('slow', 'fast', 'exit'):
+                await asyncio.sleep(0)
+                yield {'value': value}
+            await asyncio.sleep(10)
+
+        app = SwiftBots()
+        app.add_bots([concurrent_bot])
+        app.run()
+
+        # The slow handler is drained on shutdown, but doesn't block the next updates
+        assert handled == ['fast', 'exit', 'slow']
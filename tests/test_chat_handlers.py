@@ -1,8 +1,29 @@
+import asyncio
+import json
+import os
 from typing import Optional
 
 import pytest
 
-from swiftbots.message_handlers import compile_command_as_regex, CompiledChatCommand, insert_trie, search_best_command_match, Trie
+from swiftbots import ChatBot, RestOfLine
+from swiftbots.acl import RoleRegistry
+from swiftbots.chats import Chat
+from swiftbots.loggers import SysIOLoggerFactory
+from swiftbots.message_handlers import (
+    LENGTH_INDICATOR,
+    ArgumentParser,
+    ChatMessageHandler,
+    CompiledChatCommand,
+    Trie,
+    compile_chat_commands,
+    compile_command_as_regex,
+    handle_message,
+    insert_trie,
+    is_user_allowed,
+    route_command,
+    search_best_command_match,
+)
+from swiftbots.suggestions import CommandSuggestions, get_edit_distance
 
 
 def try_on(trie: Trie, word: str) -> Optional[int]:
@@ -18,7 +39,8 @@ class TestChatHandlers:
         trie = {}
 
         def insert(command_name: str, result: int) -> None:
-            insert_trie(trie, command_name, CompiledChatCommand(command_name, lambda: result, compile_command_as_regex(command_name), [], []))
+            command = CompiledChatCommand(command_name, lambda: result, compile_command_as_regex(command_name), [], [])
+            insert_trie(trie, command_name, command)
 
         insert("apple", 1)
         insert("cranberry", 2)
@@ -35,3 +57,236 @@ class TestChatHandlers:
         assert try_on(trie, "cherry") is None
         assert try_on(trie, "cherry apple") is None
         assert try_on(trie, "pple") is None
+
+    @pytest.mark.timeout(3)
+    def test_route_command(self):
+        trie = {}
+        for command_name in ("apple", "cranberry", "apple cranberry", "add note", "İx", "ΟΔΟΣ"):
+            lowered = command_name.lower()
+            command = CompiledChatCommand(lowered, lambda: None, compile_command_as_regex(lowered), [], [])
+            insert_trie(trie, lowered, command)
+
+        def route(message: str) -> tuple[Optional[str], str]:
+            command, arguments = route_command(trie, message)
+            return (command.command_name if command else None), arguments
+
+        # The same commands as the regex search finds
+        for message in ("apple", "cranberry", "apple cranberry", "apple pear", "applecherry", "apple cherry",
+                        "apple cranberrycherry", "a", "cherry", "cherry apple", "pple", "", "apple\n\tpear"):
+            command, _ = search_best_command_match(trie, message.lower())
+            assert route(message)[0] == (command.command_name if command else None)
+
+        assert route("APPLE Cranberry  Pear") == ("apple cranberry", "Pear")
+        assert route("Add Note\n  Buy MILK\nand bread ") == ("add note", "Buy MILK\nand bread ")
+        assert route("apple   ") == ("apple", "")
+        # Lowercased `İ` is two characters
+        assert route("İx y") == ("İx".lower(), "y")
+        # `Σ` is lowercased to `ς` at the end of a word, the same as in the command
+        assert route("ΟΔΟΣ 5") == ("ΟΔΟΣ".lower(), "5")
+        long_message = "add note " + "x" * 4_000_000
+        assert route(long_message) == ("add note", "x" * 4_000_000)
+        # Only the characters of the longest command are read
+        assert trie[LENGTH_INDICATOR] == len("apple cranberry")
+        assert route("apple cranberry") == ("apple cranberry", "")
+        assert route("apple cranberryx") == ("apple", "cranberryx")
+        assert route("x" * 4_000_000) == (None, "")
+
+
+class TestAccessLists:
+    @pytest.mark.timeout(3)
+    def test_users_and_roles(self):
+        roles = RoleRegistry({'moderators': ['Alice', 42], 'banned': ['mallory']})
+        handler = ChatMessageHandler(['ban', 'b'], lambda: None, ['Bob'], ['Eve'],
+                                     whitelist_roles=['moderators', 'unknown'], blacklist_roles=['banned'], roles=roles)
+        ban, b = compile_chat_commands([handler])
+        # Compiled once for all the aliases
+        assert ban.whitelist_users is b.whitelist_users is handler.whitelist_users
+
+        whitelist = ChatMessageHandler(['x'], lambda: None, ['Bob'], None, whitelist_roles=['moderators'], roles=roles)
+        assert is_user_allowed('bob', whitelist.whitelist_users, whitelist.blacklist_users)
+        assert is_user_allowed('ALICE', whitelist.whitelist_users, whitelist.blacklist_users)
+        assert is_user_allowed(42, whitelist.whitelist_users, whitelist.blacklist_users)
+        assert not is_user_allowed('carol', whitelist.whitelist_users, whitelist.blacklist_users)
+        # Blacklist has a privilege upon whitelist
+        assert is_user_allowed('carol', handler.whitelist_users, handler.blacklist_users)
+        assert not is_user_allowed('eve', handler.whitelist_users, handler.blacklist_users)
+        assert not is_user_allowed('Mallory', handler.whitelist_users, handler.blacklist_users)
+        open_handler = ChatMessageHandler(['y'], lambda: None, None, None)
+        assert open_handler.whitelist_users is None and open_handler.blacklist_users is None
+        assert is_user_allowed('anyone', open_handler.whitelist_users, open_handler.blacklist_users)
+
+        roles.set_roles({'moderators': ['carol']})
+        assert is_user_allowed('carol', whitelist.whitelist_users, whitelist.blacklist_users)
+        assert not is_user_allowed('alice', whitelist.whitelist_users, whitelist.blacklist_users)
+
+    @pytest.mark.timeout(3)
+    def test_admin_only_rejects_blacklists(self):
+        bot = ChatBot(admin='admin', roles=RoleRegistry({'banned': ['mallory']}))
+        # A blacklist would let everyone else in, because it has a privilege upon the admin whitelist
+        with pytest.raises(AssertionError):
+            bot.message_handler(commands=['restart'], admin_only=True, blacklist_roles=['banned'])
+        with pytest.raises(AssertionError):
+            bot.message_handler(commands=['restart'], admin_only=True, blacklist_users=['mallory'])
+
+    @pytest.mark.timeout(3)
+    def test_reload_from_file(self, tmp_path):
+        path = tmp_path / 'roles.json'
+        path.write_text(json.dumps({'admins': ['alice'], 'users': [str(i) for i in range(100_000)]}))
+        roles = RoleRegistry(path=str(path))
+        handler = ChatMessageHandler(['stats'], lambda: None, None, None,
+                                     whitelist_roles=['admins', 'users'], roles=roles)
+        assert is_user_allowed('Alice', handler.whitelist_users, None)
+        assert is_user_allowed(99_999, handler.whitelist_users, None)
+        assert not is_user_allowed(100_000, handler.whitelist_users, None)
+        assert not roles.reload_if_changed()
+
+        path.write_text(json.dumps({'admins': ['bob']}))
+        os.utime(path, ns=(0, 1))
+        assert roles.reload_if_changed()
+        assert not is_user_allowed('alice', handler.whitelist_users, None)
+        assert is_user_allowed('bob', handler.whitelist_users, None)
+        assert not is_user_allowed(1, handler.whitelist_users, None)
+
+        # A broken file doesn't change the roles
+        path.write_text('{"admins": ["carol"')
+        os.utime(path, ns=(0, 2))
+        with pytest.raises(ValueError):
+            roles.reload_if_changed()
+        assert is_user_allowed('bob', handler.whitelist_users, None)
+
+
+class TestArgumentParser:
+    @pytest.mark.timeout(3)
+    def test_parse(self):
+        async def add(chat, count: int, name: str, note: RestOfLine): ...
+        parser = ArgumentParser(add, reserved_names={'chat'})
+        assert parser.signature == '<count:int> <name> <note...>'
+        assert parser.parse(' 3  milk buy  it\nnow ') == {'count': 3, 'name': 'milk', 'note': 'buy  it\nnow '}
+        assert parser.parse('x milk buy') is None
+        assert parser.parse('3 milk') is None
+
+        async def take(count: int, price: float = 1.5, where='home'): ...
+        parser = ArgumentParser(take)
+        assert parser.signature == '<count:int> [<price:float>] [<where>]'
+        assert parser.parse('2') == {'count': 2, 'price': 1.5, 'where': 'home'}
+        assert parser.parse('2 3 shop') == {'count': 2, 'price': 3., 'where': 'shop'}
+        assert parser.parse('2 3 shop now') is None
+        assert parser.parse('') is None
+
+        async def note(name: str, count: int = 1): ...
+        parser = ArgumentParser(note, r'(?P<name>[a-z]+)(?:\s*x(?P<count>\d+))?')
+        assert parser.parse('milk x2') == {'name': 'milk', 'count': 2}
+        assert parser.parse('milk') == {'name': 'milk', 'count': 1}
+        assert parser.parse('milk 2') is None
+
+        # String annotations are evaluated, as with `from __future__ import annotations`
+        async def postponed(count: 'int', note: 'RestOfLine'): ...
+        parser = ArgumentParser(postponed)
+        assert parser.parse('2 buy milk') == {'count': 2, 'note': 'buy milk'}
+
+        async def wrong_order(rest: RestOfLine, count: int): ...
+        with pytest.raises(AssertionError):
+            ArgumentParser(wrong_order)
+
+    @pytest.mark.timeout(3)
+    def test_usage_reply(self):
+        bot = ChatBot()
+        called = []
+        replies = []
+
+        @bot.message_handler(commands=['add', '+'], parse_arguments=True)
+        async def add(chat: bot.Chat, sender, count: int, item: str):
+            called.append((sender, count, item))
+
+        @bot.message_handler(commands=['remind'], pattern=r'in (?P<minutes>\d+) min', usage='Try: remind in 5 min')
+        async def remind(minutes: int):
+            called.append(minutes)
+
+        trie = {}
+        for command in compile_chat_commands([add, remind]):
+            insert_trie(trie, command.command_name.lower(), command)
+
+        async def send(message: str, user):
+            replies.append(message)
+
+        async def handle(message: str) -> None:
+            chat = Chat('user', message, send, SysIOLoggerFactory().get_logger(), 'error', 'unknown', 'refuse')
+            await handle_message(message, chat, trie, None, {'chat': chat, 'sender': 'user'})
+
+        async def main():
+            await handle('add 2 apples')
+            await handle('+ two apples')
+            await handle('ADD 2')
+            await handle('remind in 10 min')
+            await handle('remind tomorrow')
+
+        asyncio.run(main())
+        assert called == [('user', 2, 'apples'), 10]
+        assert replies == ['Usage: + <count:int> <item>', 'Usage: add <count:int> <item>', 'Try: remind in 5 min']
+
+
+class TestCommandSuggestions:
+    @pytest.mark.timeout(3)
+    def test_suggest(self):
+        assert get_edit_distance('lsit', 'list', 2) == 1
+        assert get_edit_distance('remnd', 'remind', 2) == 1
+        assert get_edit_distance('kitten', 'sitting', 2) == 3
+        assert get_edit_distance('abcdef', 'a', 2) == 3
+
+        def command(name: str) -> CompiledChatCommand:
+            return CompiledChatCommand(name, lambda: None, compile_command_as_regex(name), None, None)
+
+        commands = [command(name) for name in ('add note', 'remove note', 'list', 'lost', 'help', 'remind', 'Stop')]
+        suggestions = CommandSuggestions(commands)
+
+        def suggest(message: str) -> list[str]:
+            return [c.command_name for c in suggestions.suggest(message)]
+
+        assert suggest('ad note milk') == ['add note']
+        assert suggest('addnote milk') == ['add note']
+        assert suggest('lsit') == ['list']
+        assert suggest('lust') == ['list', 'lost']
+        assert suggest('HLEP me') == ['help']
+        assert suggest('stpo' + ' x' * 100_000) == ['Stop']
+        # Short words are allowed fewer mistakes
+        assert suggest('ls') == []
+        assert suggest('xyzzy') == []
+        assert suggest('') == []
+        assert suggestions.format(suggestions.suggest('lust')) == 'Unknown command. Did you mean: list, lost?'
+
+    @pytest.mark.timeout(3)
+    def test_unknown_command_reply(self):
+        bot = ChatBot(admin='admin', suggest_commands=True)
+        replies = []
+
+        @bot.message_handler(commands=['remind'])
+        async def remind():
+            pass
+
+        @bot.message_handler(commands=['restart'], admin_only=True)
+        async def restart():
+            pass
+
+        @bot.sender()
+        async def send(message: str, user):
+            replies.append((user, message))
+
+        async def handle(message: str, sender: str) -> None:
+            chat = Chat(sender, message, send, SysIOLoggerFactory().get_logger(), 'error', 'Unknown command', 'refuse')
+            await bot.overridden_handler(message, chat, {'chat': chat, 'sender': sender})
+
+        async def main():
+            await bot.before_start_async()
+            await handle('remnid me', 'user')
+            await handle('restrat', 'user')
+            await handle('restrat', 'admin')
+            await handle('unknown', 'user')
+
+        asyncio.run(main())
+        assert replies == [
+            ('user', 'Unknown command. Did you mean: remind?'),
+            # The admin command isn't suggested to other users
+            ('user', 'Unknown command'),
+            ('admin', 'Unknown command. Did you mean: restart?'),
+            ('user', 'Unknown command'),
+        ]
@@ -83,3 +83,110 @@ class TestChatBot:
         global global_dict
         assert global_dict['answer1'] == 'Unknown command from default handler'
         assert global_dict['user1'] == 'Pferd'
+
+
+class TestOutbox:
+
+    @pytest.mark.timeout(3)
+    def test_replies_are_queued_and_flushed_on_shutdown(self):
+        sent = []
+        replied = {}
+        outbox_bot = ChatBot(outbox_capacity=10, outbox_workers=2)
+
+        @outbox_bot.default_handler()
+        async def default_handler(chat: outbox_bot.Chat):
+            first = await chat.enqueue_async('first')
+            second = await chat.enqueue_async('second')
+            replied['done'] = (first.done(), second.done())
+            replied['stats'] = outbox_bot.outbox.stats()
+            shutdown_app()
+
+        @outbox_bot.sender()
+        async def send_async(message, user):
+            await asyncio.sleep(0.1)
+            sent.append((message, user))
+
+        @outbox_bot.listener()
+        async def listen_async():
+            yield {'message': 'hello', 'sender': 'Katze'}
+            await asyncio.sleep(10)
+
+        app = SwiftBots()
+        app.add_bots([outbox_bot])
+        app.run()
+
+        # The handler didn't wait for the network, but nothing was lost on shutdown
+        assert replied['done'] == (False, False)
+        assert replied['stats']['queued'] + replied['stats']['sending'] == 2
+        assert sent == [('first', 'Katze'), ('second', 'Katze')]
+        assert outbox_bot.outbox is None
+
+    @pytest.mark.timeout(3)
+    def test_requests_to_chat_keep_order(self):
+        sent = []
+        replied = {}
+        outbox_bot = ChatBot(outbox_capacity=10)
+
+        @outbox_bot.default_handler()
+        async def default_handler(chat: outbox_bot.Chat):
+            await chat.enqueue_async('first')
+
+            async def edit_async():
+                sent.append(('edit', chat.sender))
+                return {'ok': True}
+
+            # The edit waits for the message queued before, and the reply returns the result of the sender
+            replied['edit'] = await chat.call_in_order_async(edit_async)
+            replied['reply'] = await chat.reply_async('second')
+            shutdown_app()
+
+        @outbox_bot.sender()
+        async def send_async(message, user):
+            await asyncio.sleep(0.1)
+            sent.append((message, user))
+            return {'message_id': len(sent)}
+
+        @outbox_bot.listener()
+        async def listen_async():
+            yield {'message': 'hello', 'sender': 'Katze'}
+            await asyncio.sleep(10)
+
+        app = SwiftBots()
+        app.add_bots([outbox_bot])
+        app.run()
+
+        assert sent == [('first', 'Katze'), ('edit', 'Katze'), ('second', 'Katze')]
+        assert replied == {'edit': {'ok': True}, 'reply': {'message_id': 3}}
+
+    @pytest.mark.timeout(3)
+    def test_cancelled_reply_does_not_break_next_one(self):
+        sent = []
+        replied = {}
+        outbox_bot = ChatBot(outbox_capacity=10)
+
+        @outbox_bot.default_handler()
+        async def default_handler(chat: outbox_bot.Chat):
+            # The handler stops waiting, but the message is still sent
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(chat.reply_async('first'), 0.05)
+            await asyncio.sleep(0.1)
+            replied['second'] = await chat.reply_async('second')
+            shutdown_app()
+
+        @outbox_bot.sender()
+        async def send_async(message, user):
+            await asyncio.sleep(0.1)
+            sent.append((message, user))
+            return {'message_id': len(sent)}
+
+        @outbox_bot.listener()
+        async def listen_async():
+            yield {'message': 'hello', 'sender': 'Katze'}
+            await asyncio.sleep(10)
+
+        app = SwiftBots()
+        app.add_bots([outbox_bot])
+        app.run()
+
+        assert sent == [('first', 'Katze'), ('second', 'Katze')]
+        assert replied == {'second': {'message_id': 2}}
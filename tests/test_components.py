@@ -1,10 +1,23 @@
 import asyncio
+import gc
+import importlib.util
+import threading
+import time
+import weakref
 from datetime import datetime, timedelta
 
 import pytest
 
-from swiftbots import PeriodTrigger, StubBot, depends
-from swiftbots.functions import resolve_function_args
+from swiftbots import ChatBot, DependencyScope, PeriodTrigger, StubBot, SwiftBots, depends
+from swiftbots.executors import ExecutorRegistry
+from swiftbots.functions import (
+    DependencyCache,
+    compile_resolution_plan,
+    decompose_bot_as_dependencies,
+    resolve_function_args,
+    resolve_function_args_async,
+)
+from swiftbots.http_clients import HttpClientConfig, HttpClientRegistry
 from swiftbots.tasks import SimpleScheduler
 
 
@@ -79,4 +92,209 @@ class TestComponents:
             ('1', 4)
         )
 
+    @pytest.mark.timeout(3)
+    def test_resolution_plan_is_compiled_once(self):
+        def dep(s: int):
+            return s
+
+        def caller(c: int, d: int = depends(dep)):
+            return c, d
+
+        plan = compile_resolution_plan(caller)
+        assert compile_resolution_plan(caller) is plan
+        assert plan.resolve({'c': 1, 's': 2}) == {'c': 1, 'd': 2}
+        with pytest.raises(AssertionError):
+            plan.check({'c'})
+
+    @pytest.mark.timeout(3)
+    def test_uncached_plan_lets_function_go(self):
+        def make_caller():
+            def caller(c: int):
+                return c
+            return caller
+
+        caller = make_caller()
+        plan = compile_resolution_plan(caller, cache=False)
+        assert plan.resolve({'c': 1}) == {'c': 1}
+        assert compile_resolution_plan(caller, cache=False) is not plan
+        reference = weakref.ref(caller)
+        del caller, plan
+        gc.collect()
+        assert reference() is None
+
+    @pytest.mark.timeout(3)
+    def test_missing_task_parameter_fails_at_start(self):
+        bot = StubBot()
+
+        @bot.task(PeriodTrigger(seconds=1))
+        async def task_with_unknown_parameter(unknown_parameter: int):
+            ...
+
+        app = SwiftBots()
+        app.add_bot(bot)
+        with pytest.raises(AssertionError, match='unknown_parameter'):
+            app.run()
+
+    @pytest.mark.timeout(3)
+    def test_declared_update_keys_are_checked_at_start(self):
+        bot = ChatBot()
+
+        @bot.listener(update_keys=['message', 'sender', 'language'])
+        async def listen_async():
+            yield {'message': 'hello', 'sender': 1, 'language': 'en'}
+
+        @bot.message_handler(commands=['hello'])
+        async def hello(chat: bot.Chat, language: str):
+            ...
+
+        asyncio.run(bot.before_start_async())
+
+        @bot.message_handler(commands=['bye'])
+        async def bye(chat: bot.Chat, country: str):
+            ...
+
+        with pytest.raises(AssertionError, match='country'):
+            asyncio.run(bot.before_start_async())
+
+    @pytest.mark.timeout(3)
+    def test_scoped_dependencies(self):
+        events = []
+
+        async def connection():
+            events.append('open')
+            yield 'connection'
+            events.append('close')
+
+        def engine():
+            events.append('engine')
+            return 'engine'
+
+        def repository(conn: str = depends(connection), eng: str = depends(engine, scope=DependencyScope.BOT)):
+            return conn, eng
+
+        async def handler(repo: tuple = depends(repository), conn: str = depends(connection)):
+            events.append('handled')
+            return repo, conn
+
+        bot = StubBot()
+
+        async def handle_update():
+            update_cache = DependencyCache()
+            try:
+                deps = decompose_bot_as_dependencies(bot, update_cache)
+                args = await compile_resolution_plan(handler).resolve_async(deps)
+                return await handler(**args)
+            finally:
+                await update_cache.aclose()
+
+        async def main():
+            assert await handle_update() == (('connection', 'engine'), 'connection')
+            assert await handle_update() == (('connection', 'engine'), 'connection')
+            await bot.before_close_async()
+
+        asyncio.run(main())
+        # The connection is opened once per update and closed after the handler,
+        # the engine is created once per bot
+        assert events == ['open', 'engine', 'handled', 'close', 'open', 'handled', 'close']
+
+    @pytest.mark.timeout(3)
+    def test_singleton_cant_depend_on_update_scope(self):
+        async def connection():
+            yield 'connection'
+
+        def cache(conn: str = depends(connection)):
+            return {}
+
+        def engine():
+            return 'engine'
+
+        def repository(eng: str = depends(engine, scope=DependencyScope.BOT)):
+            return eng
+
+        # The bot singleton would keep the connection closed after the first update
+        with pytest.raises(AssertionError, match='narrower `update` scope'):
+            compile_resolution_plan(lambda value=depends(cache, scope=DependencyScope.BOT): value, cache=False)
+        with pytest.raises(AssertionError, match='narrower `bot` scope'):
+            compile_resolution_plan(lambda repo=depends(repository, scope=DependencyScope.APP): repo, cache=False)
+        # A wider scope is allowed
+        compile_resolution_plan(lambda repo=depends(repository): repo, cache=False)
+
+    @pytest.mark.timeout(3)
+    def test_http_clients_are_shared(self):
+        registry = HttpClientRegistry(HttpClientConfig(max_connections=5))
+        app = SwiftBots(http_clients=registry)
+        bot = StubBot()
+        app.add_bot(bot)
+        assert bot.http_clients is registry
+
+        async def main():
+            client = registry.get_async_client()
+            assert registry.get_async_client() is client
+            assert registry.get_async_client('other') is not client
+            await registry.aclose()
+            assert client.is_closed
+            assert registry.get_async_client() is not client
+            await registry.aclose()
+
+        asyncio.run(main())
+        assert registry.get_client() is registry.get_client()
+        registry.close()
+
+    @pytest.mark.skipif(importlib.util.find_spec('h2') is not None, reason='h2 is installed')
+    def test_http2_without_h2_fails_early(self):
+        with pytest.raises(ImportError, match='swiftbots\\[http2\\]'):
+            HttpClientConfig(http2=True)
+
+    @pytest.mark.timeout(10)
+    def test_executors(self):
+        registry = ExecutorRegistry(thread_workers=2, process_workers=1)
+        app = SwiftBots(executors=registry)
+        bot = StubBot()
+        app.add_bot(bot)
+        assert bot.executors is registry
+
+        def blocking(name: str, logger) -> str:
+            # Arguments are resolved in the loop, the call happens in a worker thread
+            time.sleep(0.2)
+            return f'{name} {threading.current_thread().name}'
+
+        offloaded = bot._offload(blocking, 'thread')
+        with pytest.raises(AssertionError):
+            bot._offload(asyncio.sleep, 'thread')
+        # A child process can't find a nested function
+        with pytest.raises(AssertionError, match='top level'):
+            bot._offload(blocking, 'process')
+        # The sizes are known before the pools are started
+        assert registry.stats()['process'] == {
+            'started': False, 'workers': 1, 'in_flight': 0, 'queued': 0, 'completed': 0, 'failed': 0,
+        }
+
+        async def main():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            args = await resolve_function_args_async(offloaded, decompose_bot_as_dependencies(bot))
+            result = await offloaded(**args)
+            ticker.cancel()
+            # The loop kept working while the function blocked
+            assert ticks >= 10
+            assert result.startswith(f'{bot.name} swiftbots')
+
+            assert await registry.run('process', square, {'value': 7}) == 49
+            stats = registry.stats()
+            assert stats['thread']['completed'] == 1 and stats['thread']['workers'] == 2
+            assert stats['process']['completed'] == 1 and stats['process']['in_flight'] == 0
+            await registry.ashutdown()
+            assert registry.stats()['process']['started'] is False
+
+        asyncio.run(main())
+
 
+def square(value: int) -> int:
+    return value * value
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from swiftbots import ChatBot
+from swiftbots.dispatchers import KeyedDispatcher
+from swiftbots.ingress import IngressQueue, OverflowPolicy
+
+
+class TestKeyedDispatcher:
+
+    @pytest.mark.timeout(3)
+    def test_same_key_ordered_different_keys_parallel(self):
+        log = []
+
+        def make_handle(key: str, number: int, delay: float):
+            async def handle():
+                log.append(('start', key, number))
+                await asyncio.sleep(delay)
+                log.append(('end', key, number))
+            return handle
+
+        async def main():
+            dispatcher = KeyedDispatcher(max_concurrency=10)
+            await dispatcher.dispatch(make_handle('a', 1, 0.2), key='a')
+            await dispatcher.dispatch(make_handle('a', 2, 0), key='a')
+            await dispatcher.dispatch(make_handle('b', 1, 0), key='b')
+            assert dispatcher.active_keys == 2
+            await dispatcher.close()
+            assert dispatcher.active_keys == 0
+            assert dispatcher.in_flight == 0
+
+        asyncio.run(main())
+
+        # `b` didn't wait for the slow `a`, but the second `a` did
+        assert log.index(('end', 'b', 1)) < log.index(('end', 'a', 1))
+        assert log.index(('end', 'a', 1)) < log.index(('start', 'a', 2))
+
+    @pytest.mark.timeout(3)
+    def test_flooding_key_does_not_hold_back_others(self):
+        log = []
+
+        def make_handle(key: str, number: int):
+            async def handle():
+                await asyncio.sleep(0.05)
+                log.append((key, number))
+            return handle
+
+        async def main():
+            dispatcher = KeyedDispatcher(max_concurrency=2)
+            for number in range(10):
+                await asyncio.wait_for(dispatcher.dispatch(make_handle('a', number), key='a'), 0.01)
+            # The queued updates of `a` hold no slots, so `b` neither waits to be dispatched nor to run
+            await asyncio.wait_for(dispatcher.dispatch(make_handle('b', 0), key='b'), 0.01)
+            await dispatcher.close()
+
+        asyncio.run(main())
+        assert log.index(('b', 0)) < log.index(('a', 2))
+        assert [entry for entry in log if entry[0] == 'a'] == [('a', number) for number in range(10)]
+
+
+class TestIngressQueue:
+
+    @pytest.mark.timeout(3)
+    def test_overflow_policies(self):
+        async def fill(policy: OverflowPolicy) -> tuple[list, IngressQueue]:
+            queue = IngressQueue(capacity=2, policy=policy)
+            dropped = [await queue.put({'n': n}) for n in range(4)]
+            return [d['n'] for d in dropped if d is not None], queue
+
+        async def main():
+            dropped, queue = await fill(OverflowPolicy.DROP_OLDEST)
+            assert dropped == [0, 1]
+            assert [(await queue.get())['n'] for _ in range(2)] == [2, 3]
+
+            dropped, queue = await fill(OverflowPolicy.DROP_NEWEST)
+            assert dropped == [2, 3]
+            assert queue.stats() == {'capacity': 2, 'depth': 2, 'max_depth': 2, 'received': 4, 'dropped': 2}
+
+            queue = IngressQueue(capacity=1, policy=OverflowPolicy.BLOCK)
+            await queue.put({'n': 0})
+            blocked = asyncio.create_task(queue.put({'n': 1}))
+            await asyncio.sleep(0.01)
+            assert not blocked.done()
+            assert (await queue.get())['n'] == 0
+            assert await blocked is None
+            assert queue.dropped == 0
+
+        asyncio.run(main())
+
+    @pytest.mark.timeout(3)
+    def test_busy_replies_dont_block_the_listener(self):
+        bot = ChatBot()
+        bot.max_busy_replies = 2
+        sent = []
+        release = asyncio.Event()
+
+        @bot.sender()
+        async def send_async(message, user):
+            # A rate limiter makes the sender wait
+            await release.wait()
+            sent.append(user)
+
+        async def main():
+            for sender in ['a', 'a', 'b', 'c', 'a']:
+                update = {'message': 'hi', 'sender': sender}
+                await asyncio.wait_for(bot.drop_update_async(update, OverflowPolicy.REPLY_BUSY), 0.1)
+            release.set()
+            await asyncio.gather(*bot._busy_replies.values())
+            assert not bot._busy_replies
+            # Once the replies are sent, the sender can be told again
+            await bot.drop_update_async({'message': 'hi', 'sender': 'c'}, OverflowPolicy.REPLY_BUSY)
+            await asyncio.gather(*bot._busy_replies.values())
+
+        asyncio.run(main())
+        # One reply per sender, and no more than `max_busy_replies` at once
+        assert sent == ['a', 'b', 'c']
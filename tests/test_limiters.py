@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from swiftbots.limiters import RateLimiter, TokenBucket
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestLimiters:
+
+    @pytest.mark.timeout(3)
+    def test_token_bucket(self):
+        clock = VirtualClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        # A burst of the capacity passes, then requests are paced by the rate
+        assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+        clock.now = 10
+        assert bucket.reserve() == 0
+        bucket.block(3)
+        assert bucket.reserve() == 3
+
+    @pytest.mark.timeout(3)
+    def test_chat_buckets_are_pruned(self):
+        clock = VirtualClock()
+        limiter = RateLimiter(rate=1000, burst=1000, chat_rate=1, chat_burst=1, clock=clock)
+
+        async def main():
+            for chat in range(1024):
+                await limiter.acquire(chat)
+            assert limiter.tracked_chats == 1024
+            clock.now = 5
+            await limiter.acquire('new chat')
+            assert limiter.tracked_chats == 1
+
+        asyncio.run(main())
+
+    @pytest.mark.timeout(3)
+    def test_refusals_of_several_chats_stop_the_whole_bot(self):
+        clock = VirtualClock()
+        limiter = RateLimiter(rate=1000, burst=1000, chat_rate=1, chat_burst=1, clock=clock)
+
+        async def waited(chat: str) -> float:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await limiter.acquire(chat)
+            return loop.time() - started
+
+        async def main():
+            limiter.retry_after(0.2, 'first')
+            # One refused chat doesn't stop the others
+            assert await waited('other') < 0.1
+            limiter.retry_after(0.2, 'second')
+            # Another refused chat means the limit of the bot is exceeded
+            assert await waited('third') >= 0.2
+
+        asyncio.run(main())
@@ -1,9 +1,29 @@
 import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 
 import pytest
 
-from swiftbots import PeriodTrigger, StubBot, SwiftBots, depends
-from swiftbots.admin_utils import shutdown_app
+from swiftbots import CronTrigger, DateTrigger, PeriodTrigger, StubBot, SwiftBots, depends
+from swiftbots.admin_utils import format_task_stats, get_task_stats_async, shutdown_app
+from swiftbots.all_types import ITrigger, JobState
+from swiftbots.bots import build_scheduler, disable_tasks, enable_tasks
+from swiftbots.loggers import SysIOLoggerFactory
+from swiftbots.tasks import (
+    HeapScheduler,
+    JsonJobStore,
+    MisfirePolicy,
+    OverlapPolicy,
+    PeriodMode,
+    SimpleScheduler,
+    SqliteJobStore,
+    TaskInfo,
+    TaskPlanner,
+)
 
 global_var = 0
 
@@ -34,3 +54,600 @@ class TestTasks:
 
         global global_var
         assert global_var == 5
+
+
+class TestHeapScheduler:
+
+    @pytest.mark.timeout(3)
+    def test_sleeps_until_the_earliest_task(self):
+        fired = []
+
+        def make_caller(name: str):
+            async def caller():
+                fired.append((name, time.monotonic()))
+            return caller
+
+        async def stub():
+            pass
+
+        async def main():
+            scheduler = HeapScheduler()
+            # Lots of idle tasks don't slow down the scheduler
+            for i in range(10000):
+                scheduler.add_task(TaskInfo(f'idle-{i}', stub, [PeriodTrigger(hours=1)], False), stub)
+            for i in range(0, 10000, 2):
+                scheduler.remove_task(f'idle-{i}')
+            started = time.monotonic()
+            scheduler.add_task(TaskInfo('fast', stub, [PeriodTrigger(seconds=0.1)], True), make_caller('fast'))
+            scheduler.add_task(TaskInfo('removed', stub, [PeriodTrigger(seconds=0.05)], False), make_caller('removed'))
+            scheduler.remove_task('removed')
+
+            runner = asyncio.create_task(scheduler.start())
+            await asyncio.sleep(0.15)
+            # A task added while the scheduler sleeps wakes it up
+            scheduler.add_task(TaskInfo('late', stub, [PeriodTrigger(seconds=0.05)], True), make_caller('late'))
+            await asyncio.sleep(0.2)
+            runner.cancel()
+            assert len(scheduler.list_tasks()) == 5002
+            return started
+
+        started = asyncio.run(main())
+
+        fast = [moment - started for name, moment in fired if name == 'fast']
+        assert len(fast) == 4
+        assert all(abs(moment - 0.1 * i) < 0.03 for i, moment in enumerate(fast))
+        late = [moment - started for name, moment in fired if name == 'late']
+        assert len(late) >= 3 and abs(late[0] - 0.15) < 0.03
+        assert 'removed' not in [name for name, _ in fired]
+
+    @pytest.mark.timeout(3)
+    def test_overlap_policies(self):
+        async def stub():
+            pass
+
+        async def run(overlap: OverlapPolicy, max_instances: int, max_concurrency=None) -> dict:
+            stats = {'started': 0, 'running': 0, 'max_running': 0, 'fast': 0}
+
+            async def slow():
+                stats['started'] += 1
+                stats['running'] += 1
+                stats['max_running'] = max(stats['max_running'], stats['running'])
+                await asyncio.sleep(0.25)
+                stats['running'] -= 1
+
+            async def fast():
+                stats['fast'] += 1
+
+            scheduler = HeapScheduler(max_concurrency=max_concurrency)
+            scheduler.add_task(TaskInfo('slow', stub, [PeriodTrigger(seconds=0.1)], True, max_instances, overlap), slow)
+            scheduler.add_task(TaskInfo('fast', stub, [PeriodTrigger(seconds=0.1)], True), fast)
+            runner = asyncio.create_task(scheduler.start())
+            await asyncio.sleep(0.45)
+            runner.cancel()
+            return stats
+
+        # Fires at 0.0 .. 0.4. A slow task doesn't delay the fast one
+        skipped = asyncio.run(run(OverlapPolicy.SKIP, 1))
+        assert (skipped['started'], skipped['max_running'], skipped['fast']) == (2, 1, 5)
+        # The fire at 0.1 waits for the first call, the fire at 0.2 is skipped as the queue is full
+        queued = asyncio.run(run(OverlapPolicy.QUEUE, 1))
+        assert queued['started'] == 2 and queued['max_running'] == 1
+        allowed = asyncio.run(run(OverlapPolicy.ALLOW, 1))
+        assert allowed['started'] == 5 and allowed['max_running'] == 3
+        # The global limit holds the calls even if the task allows them
+        limited = asyncio.run(run(OverlapPolicy.ALLOW, 1, max_concurrency=2))
+        assert limited['max_running'] <= 2
+
+
+class TestCronTrigger:
+
+    def test_next_fire_time(self):
+        utc = timezone.utc
+
+        def next_after(expression: str, after: datetime, tz=utc) -> datetime:
+            return CronTrigger(expression, timezone=tz).get_next_fire_time(after.replace(tzinfo=tz))
+
+        assert next_after('0 3 * * *', datetime(2024, 5, 10, 2, 59, 30)) == datetime(2024, 5, 10, 3, tzinfo=utc)
+        # Strictly after
+        assert next_after('0 3 * * *', datetime(2024, 5, 10, 3)) == datetime(2024, 5, 11, 3, tzinfo=utc)
+        # 2024-05-10 is Friday
+        assert next_after('0 9 * * mon', datetime(2024, 5, 10, 12)) == datetime(2024, 5, 13, 9, tzinfo=utc)
+        assert next_after('*/15 8-9 * * 1-5', datetime(2024, 5, 10, 9, 50)) == datetime(2024, 5, 13, 8, tzinfo=utc)
+        assert next_after('0 0 29 feb *', datetime(2024, 3, 1)) == datetime(2028, 2, 29, tzinfo=utc)
+        # Both day and day of week are restricted: either of them fires
+        assert next_after('0 12 1 * sun', datetime(2024, 5, 10)) == datetime(2024, 5, 12, 12, tzinfo=utc)
+        assert CronTrigger('0 0 30 2 *').get_next_fire_time(datetime(2024, 1, 1, tzinfo=utc)) is None
+
+        # The time is in the trigger timezone. Berlin moves clocks forward on 2024-03-31 at 02:00
+        berlin = ZoneInfo('Europe/Berlin')
+        trigger = CronTrigger('0 3 * * *', timezone='Europe/Berlin')
+        fire = trigger.get_next_fire_time(datetime(2024, 3, 30, 12, tzinfo=utc))
+        assert fire == datetime(2024, 3, 31, 3, tzinfo=berlin)
+        assert fire.astimezone(utc) == datetime(2024, 3, 31, 1, tzinfo=utc)
+        # Clocks go back on 2024-10-27 at 03:00: 02:30 happens twice, but fires once
+        trigger = CronTrigger('30 2 * * *', timezone=berlin)
+        first = trigger.get_next_fire_time(datetime(2024, 10, 26, 12, tzinfo=utc))
+        assert first == datetime(2024, 10, 27, 2, 30, tzinfo=berlin)
+        assert trigger.get_next_fire_time(first + timedelta(minutes=30)) == datetime(2024, 10, 28, 2, 30, tzinfo=berlin)
+
+        with pytest.raises(AssertionError):
+            CronTrigger('61 * * * *')
+        with pytest.raises(AssertionError):
+            CronTrigger('* * * *')
+
+    @pytest.mark.timeout(3)
+    def test_heap_scheduler_fires_cron_tasks(self):
+        fired = []
+
+        class SoonTrigger(ITrigger):
+            # Fires every 0.1 seconds by the wall clock, like a very frequent calendar trigger
+            def get_next_fire_time(self, after: datetime):
+                return after + timedelta(seconds=0.1)
+
+        async def stub():
+            pass
+
+        async def caller():
+            fired.append(time.monotonic())
+
+        async def main():
+            scheduler = HeapScheduler()
+            scheduler.add_task(TaskInfo('cron', stub, [CronTrigger('0 3 * * *'), SoonTrigger()], False), caller)
+            runner = asyncio.create_task(scheduler.start())
+            await asyncio.sleep(0.35)
+            runner.cancel()
+
+        asyncio.run(main())
+        assert len(fired) == 3
+
+
+class VirtualClock:
+    """Time passes only when all the coroutines are waiting for it"""
+
+    def __init__(self, start: float):
+        self.now = start
+        self.__sleepers: list = []
+        self.__counter = itertools.count()
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.__sleepers, (self.now + seconds, next(self.__counter), future))
+        await future
+
+    async def run(self, until: float) -> None:
+        while True:
+            for _ in range(10):
+                await asyncio.sleep(0)
+            while self.__sleepers and self.__sleepers[0][2].done():
+                heapq.heappop(self.__sleepers)
+            if not self.__sleepers or self.__sleepers[0][0] > until:
+                return
+            deadline, _, future = heapq.heappop(self.__sleepers)
+            self.now = max(self.now, deadline)
+            future.set_result(None)
+
+
+class TestPeriodModes:
+    PERIOD = 0.7
+    START = 1000.
+
+    def run_periodic(self, period_mode: PeriodMode, work: float, periods: int, stall_at: int = 0) -> list[float]:
+        clock = VirtualClock(self.START)
+        fires = []
+
+        async def stub():
+            pass
+
+        async def caller():
+            fires.append(clock())
+            if len(fires) == stall_at:
+                # Blocking code freezes the event loop for 10.5 periods
+                clock.now += 10.5 * self.PERIOD
+                return
+            await clock.sleep(work)
+
+        async def main():
+            scheduler = HeapScheduler(clock=clock, sleep=clock.sleep)
+            info = TaskInfo('periodic', stub, [PeriodTrigger(seconds=self.PERIOD)], False, period_mode=period_mode)
+            scheduler.add_task(info, caller)
+            runner = asyncio.create_task(scheduler.start())
+            await clock.run(until=self.START + periods * self.PERIOD + self.PERIOD / 2)
+            runner.cancel()
+
+        asyncio.run(main())
+        return fires
+
+    @pytest.mark.timeout(3)
+    def test_zero_period_fires_once_a_second(self):
+        clock = VirtualClock(self.START)
+        fires = []
+
+        async def stub():
+            pass
+
+        async def caller():
+            fires.append(clock())
+
+        async def main():
+            scheduler = HeapScheduler(clock=clock, sleep=clock.sleep)
+            scheduler.add_task(TaskInfo('zero', stub, [PeriodTrigger()], True), caller)
+            runner = asyncio.create_task(scheduler.start())
+            await clock.run(until=self.START + 5.5)
+            runner.cancel()
+
+        asyncio.run(main())
+        assert fires == [self.START + i for i in range(6)]
+
+    @pytest.mark.timeout(10)
+    def test_fixed_rate_has_no_drift(self):
+        fires = self.run_periodic(PeriodMode.FIXED_RATE, work=0.3, periods=3000)
+        assert len(fires) == 3000
+        assert max(abs(fire - (self.START + (i + 1) * self.PERIOD)) for i, fire in enumerate(fires)) < 1e-9
+
+    @pytest.mark.timeout(3)
+    def test_fixed_rate_coalesces_missed_fires(self):
+        fires = self.run_periodic(PeriodMode.FIXED_RATE, work=0.3, periods=20, stall_at=3)
+        # The 10 fires missed during the stall are merged into one late call, then the grid goes on
+        assert len(fires) == 20 - 9
+        assert fires[3] == pytest.approx(self.START + 13.5 * self.PERIOD)
+        assert fires[4:] == pytest.approx([self.START + i * self.PERIOD for i in range(14, 21)])
+
+    @pytest.mark.timeout(3)
+    def test_fixed_delay_counts_from_the_end(self):
+        fires = self.run_periodic(PeriodMode.FIXED_DELAY, work=0.3, periods=10)
+        assert fires == pytest.approx([self.START + self.PERIOD + i * (self.PERIOD + 0.3) for i in range(7)])
+
+
+class TestTaskStats:
+
+    @pytest.mark.timeout(3)
+    def test_heap_scheduler_stats(self):
+        clock = VirtualClock(1000.)
+
+        async def stub():
+            pass
+
+        async def slow():
+            await clock.sleep(0.5)
+
+        async def failing():
+            raise ValueError('Task failed')
+
+        async def main():
+            # One call at a time, so `failing` waits for `slow` every period
+            scheduler = HeapScheduler(max_concurrency=1, clock=clock, sleep=clock.sleep)
+            scheduler.add_task(TaskInfo('slow', stub, [PeriodTrigger(seconds=1)], False), slow)
+            scheduler.add_task(TaskInfo('failing', stub, [PeriodTrigger(seconds=1)], False), failing)
+            runner = asyncio.create_task(scheduler.start())
+            await clock.run(until=1003.9)
+            wall_now = datetime.now(timezone.utc)
+            stats = {task.name: task for task in scheduler.get_task_stats()}
+            runner.cancel()
+            return stats, wall_now
+
+        stats, wall_now = asyncio.run(main())
+        slow_stats, failing_stats = stats['slow'], stats['failing']
+        assert slow_stats.runs == 3 and slow_stats.failures == 0
+        assert slow_stats.last_duration == pytest.approx(0.5)
+        assert slow_stats.durations.count == 3 and slow_stats.durations.mean == pytest.approx(0.5)
+        assert slow_stats.durations.quantile(0.95) == pytest.approx(0.5)
+        assert slow_stats.lateness == 0. and slow_stats.last_end is not None
+        assert failing_stats.runs == 3 and failing_stats.failures == 3
+        assert failing_stats.lateness == pytest.approx(0.5) and failing_stats.max_lateness == pytest.approx(0.5)
+        # The clock stopped at 1003.5, the next fire is at 1004
+        assert (slow_stats.next_fire - wall_now).total_seconds() == pytest.approx(0.5, abs=0.05)
+
+    @pytest.mark.timeout(5)
+    def test_admin_utils_report(self):
+        app = SwiftBots(scheduler=SimpleScheduler())
+        bot = StubBot()
+        reports = []
+
+        @bot.task(PeriodTrigger(hours=1), run_at_start=True, name='failing')
+        async def failing():
+            raise ValueError('Task failed')
+
+        @bot.task(PeriodTrigger(seconds=1), run_at_start=False, name='reporter')
+        async def reporter():
+            reports.append(await get_task_stats_async())
+            shutdown_app()
+
+        app.add_bot(bot)
+        assert asyncio.run(get_task_stats_async()) == []
+        app.run()
+
+        stats = {task.name: task for task in reports[0]}
+        assert stats['failing'].runs == 1 and stats['failing'].failures == 1
+        assert stats['failing'].next_fire is not None and stats['failing'].last_end is not None
+        assert stats['reporter'].runs == 1 and stats['reporter'].running == 1
+        report = format_task_stats(reports[0])
+        assert report.startswith('failing: next ') and 'failures 1' in report
+        assert format_task_stats([]) == 'No tasks scheduled'
+
+
+class TestTaskGroups:
+
+    @pytest.mark.timeout(3)
+    def test_pause_keeps_schedule(self):
+        clock = VirtualClock(1000.)
+        fires: dict[str, list[float]] = {}
+
+        async def stub():
+            pass
+
+        def make_caller(name: str):
+            async def caller():
+                fires.setdefault(name, []).append(clock() - 1000.)
+            return caller
+
+        async def main():
+            scheduler = HeapScheduler(clock=clock, sleep=clock.sleep)
+            for name, group in (('a1', 'a'), ('a2', 'a'), ('b', 'b')):
+                scheduler.add_task(TaskInfo(name, stub, [PeriodTrigger(seconds=1)], False, group=group),
+                                   make_caller(name))
+            runner = asyncio.create_task(scheduler.start())
+            await clock.run(until=1001.5)
+            assert scheduler.pause_group('a') and not scheduler.pause_group('unknown')
+            await clock.run(until=1004.2)
+            clock.now = 1004.2
+            paused = {task.name: task.paused for task in scheduler.get_task_stats()}
+            assert scheduler.resume_group('a')
+            await clock.run(until=1005.5)
+            runner.cancel()
+            return paused
+
+        paused = asyncio.run(main())
+        assert paused == {'a1': True, 'a2': True, 'b': False}
+        assert fires['b'] == pytest.approx([1, 2, 3, 4, 5])
+        # The fires missed while paused are merged into one call on resume, then the grid goes on
+        assert fires['a1'] == pytest.approx([1, 4.2, 5]) and fires['a2'] == pytest.approx([1, 4.2, 5])
+
+    def test_bot_tasks_are_paused(self):
+        bot = StubBot()
+
+        @bot.task(PeriodTrigger(hours=1), name='bot-task')
+        async def bot_task():
+            pass
+
+        scheduler = SimpleScheduler()
+        build_scheduler([bot], scheduler)
+        next_fire = scheduler.get_task_stats()[0].next_fire
+        disable_tasks(bot, scheduler)
+        stats = scheduler.get_task_stats()[0]
+        assert stats.group == bot.name and stats.paused
+        assert stats.next_fire == pytest.approx(next_fire, abs=timedelta(milliseconds=10))
+        enable_tasks(bot, scheduler)
+        stats = scheduler.get_task_stats()[0]
+        assert not stats.paused
+        assert stats.next_fire == pytest.approx(next_fire, abs=timedelta(milliseconds=10))
+        scheduler.remove_task('bot-task')
+        # Unknown group, the tasks are added again
+        enable_tasks(bot, scheduler)
+        assert scheduler.list_tasks() == ['bot-task']
+
+
+class TestTimeouts:
+
+    @pytest.mark.timeout(5)
+    def test_hung_task_is_cancelled_and_removed(self):
+        records: list[logging.LogRecord] = []
+
+        class ListHandler(logging.Handler):
+            def emit(self, record: logging.LogRecord) -> None:
+                records.append(record)
+
+        root_logger = logging.getLogger('test-timeouts')
+        root_logger.addHandler(ListHandler())
+        calls = {'hung': 0, 'default': 0, 'raising': 0}
+
+        async def stub():
+            pass
+
+        async def hung():
+            calls['hung'] += 1
+            await asyncio.Event().wait()
+
+        async def default():
+            calls['default'] += 1
+            await asyncio.sleep(10)
+
+        async def raising():
+            calls['raising'] += 1
+            # Raised by the task itself, it's not a timeout of the scheduler
+            raise asyncio.TimeoutError()
+
+        async def main():
+            scheduler = HeapScheduler(default_timeout=0.05, logger=SysIOLoggerFactory(root_logger).get_logger())
+            scheduler.add_task(TaskInfo('hung', stub, [PeriodTrigger(seconds=0.1)], True,
+                                        timeout=0.02, max_timeouts=3), hung)
+            scheduler.add_task(TaskInfo('default', stub, [PeriodTrigger(hours=1)], True), default)
+            scheduler.add_task(TaskInfo('raising', stub, [PeriodTrigger(hours=1)], True), raising)
+            runner = asyncio.create_task(scheduler.start())
+            await asyncio.sleep(0.6)
+            stats = {task.name: task for task in scheduler.get_task_stats()}
+            tasks = scheduler.list_tasks()
+            runner.cancel()
+            return stats, tasks
+
+        stats, tasks = asyncio.run(main())
+        # Removed after 3 timeouts in a row
+        assert calls['hung'] == 3 and 'hung' not in tasks
+        assert stats['default'].timeouts == 1 and stats['default'].running == 0
+        assert stats['default'].last_duration == pytest.approx(0.05, abs=0.03)
+        assert stats['raising'].timeouts == 0 and stats['raising'].failures == 1
+        events = [record for record in records if getattr(record, 'event', None) == 'task_timeout']
+        assert [(event.task, event.timeouts_in_row, event.disabled) for event in events if event.task == 'hung'] \
+            == [('hung', 1, False), ('hung', 2, False), ('hung', 3, True)]
+        assert any(event.task == 'default' and event.timeout == 0.05 for event in events)
+
+
+class TestTaskPlanner:
+
+    @pytest.mark.timeout(5)
+    def test_schedule_from_task(self):
+        app = SwiftBots()
+        bot = StubBot()
+        reminded = []
+
+        async def remind(text: str, name: str):
+            reminded.append((text, name))
+
+        async def finish():
+            shutdown_app()
+
+        @bot.task(PeriodTrigger(hours=1), run_at_start=True)
+        async def plan(planner: TaskPlanner):
+            planner.schedule_in(0.2, remind, {'text': 'later'})
+            planner.schedule_at(datetime.now() - timedelta(hours=1), remind, {'text': 'at once'})
+            planner.schedule_in(0.1, remind, {'text': 'cancelled'}, job_id='reminder')
+            # The same id replaces the pending call
+            planner.schedule_in(0.1, remind, {'text': 'replaced'}, job_id='reminder')
+            planner.schedule_in(0.1, remind, {'text': 'cancelled'}, job_id='cancelled')
+            assert planner.cancel('cancelled') and not planner.cancel('cancelled')
+            planner.schedule_in(timedelta(seconds=0.3), finish)
+
+        app.add_bot(bot)
+        app.run()
+        assert reminded == [('at once', bot.name), ('replaced', bot.name), ('later', bot.name)]
+
+    @pytest.mark.timeout(10)
+    def test_many_jobs(self):
+        clock = VirtualClock(1000.)
+        now = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+        fired = []
+
+        def make_caller(number: int):
+            async def caller():
+                fired.append((clock(), number))
+            return caller
+
+        async def main():
+            scheduler = HeapScheduler(clock=clock, sleep=clock.sleep,
+                                      wall_clock=lambda: now + timedelta(seconds=clock() - 1000.))
+            runner = asyncio.create_task(scheduler.start())
+            await asyncio.sleep(0)
+            for number in range(100_000):
+                scheduler.add_job(str(number), now + timedelta(seconds=number % 1000 + 1), make_caller(number))
+            for number in range(100_000):
+                if number % 100:
+                    assert scheduler.cancel_job(str(number))
+            await clock.run(until=3000.)
+            runner.cancel()
+
+        asyncio.run(main())
+        assert sorted(number for _, number in fired) == list(range(0, 100_000, 100))
+        assert [moment for moment, _ in fired] == sorted(moment for moment, _ in fired)
+        # The wall clock of the scheduler follows the virtual one, so the fire times are exact
+        assert all(moment == 1000. + number % 1000 + 1 for moment, number in fired)
+
+    def test_date_trigger(self):
+        moment = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+        trigger = DateTrigger(moment)
+        assert trigger.get_next_fire_time(moment - timedelta(seconds=1)) == moment
+        assert trigger.get_next_fire_time(moment) is None
+
+
+class TestJobStores:
+
+    START = 1000.
+
+    @pytest.mark.timeout(5)
+    @pytest.mark.parametrize('store_class', [JsonJobStore, SqliteJobStore])
+    def test_restart_keeps_schedule(self, tmp_path, store_class):
+        path = str(tmp_path / 'jobs')
+        now = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+        clock = VirtualClock(self.START)
+        store = store_class(path)
+        store.save('soon', JobState(now - timedelta(seconds=5), now + timedelta(seconds=0.1)))
+        store.save('missed', JobState(now - timedelta(hours=1), now - timedelta(seconds=10)))
+        store.save('skipped', JobState(now - timedelta(hours=1), now - timedelta(seconds=10)))
+        store.save('in-grace', JobState(now - timedelta(hours=1), now - timedelta(seconds=10)))
+        store.close()
+
+        fired: dict[str, list[float]] = {}
+
+        async def stub():
+            pass
+
+        def make_caller(name: str):
+            async def caller():
+                fired.setdefault(name, []).append(clock.now - self.START)
+            return caller
+
+        tasks = [
+            # Period is 1 hour, but the saved state says the next call is in 0.1 seconds
+            TaskInfo('soon', stub, [PeriodTrigger(hours=1)], run_at_start=True),
+            TaskInfo('missed', stub, [PeriodTrigger(seconds=0.3)], False),
+            TaskInfo('skipped', stub, [PeriodTrigger(seconds=0.3)], False, misfire_policy=MisfirePolicy.SKIP),
+            TaskInfo('in-grace', stub, [PeriodTrigger(seconds=0.3)], False,
+                     misfire_policy=MisfirePolicy.SKIP, misfire_grace_time=20),
+            TaskInfo('new', stub, [PeriodTrigger(hours=1)], run_at_start=True),
+        ]
+
+        async def main():
+            scheduler = HeapScheduler(clock=clock, sleep=clock.sleep, job_store=store_class(path),
+                                      wall_clock=lambda: now + timedelta(seconds=clock.now - self.START))
+            for info in tasks:
+                scheduler.add_task(info, make_caller(info.name))
+            runner = asyncio.create_task(scheduler.start())
+            await clock.run(until=self.START + 0.28)
+            runner.cancel()
+            # The scheduler writes the last states and closes the store when it stops
+            await asyncio.gather(runner, return_exceptions=True)
+
+        asyncio.run(main())
+
+        assert fired['soon'] == pytest.approx([0.1])
+        # The missed fire is caught up once, then the old grid goes on: -10 s + 34 periods = 0.2 s
+        assert fired['missed'] == pytest.approx([0., 0.2])
+        assert fired['skipped'] == pytest.approx([0.2])
+        assert fired['in-grace'] == pytest.approx([0., 0.2])
+        # `run_at_start` works only the first time
+        assert fired['new'] == pytest.approx([0.])
+
+        state = store_class(path).load('soon')
+        assert state is not None and state.last_fire == now + timedelta(seconds=0.1)
+        assert state.next_fire == now + timedelta(hours=1, seconds=0.1)
+
+    @pytest.mark.timeout(5)
+    def test_states_are_saved_in_batches(self, tmp_path):
+        batches: list[dict[str, JobState]] = []
+
+        class RecordingStore(JsonJobStore):
+            closed = False
+
+            def save_many(self, states):
+                batches.append(dict(states))
+                super().save_many(states)
+
+            def close(self):
+                self.closed = True
+
+        async def stub():
+            pass
+
+        now = datetime(2030, 1, 1, 12, tzinfo=timezone.utc)
+        clock = VirtualClock(self.START)
+        store = RecordingStore(str(tmp_path / 'jobs.json'))
+
+        async def main():
+            scheduler = HeapScheduler(clock=clock, sleep=clock.sleep, job_store=store,
+                                      wall_clock=lambda: now + timedelta(seconds=clock.now - self.START))
+            scheduler.add_task(TaskInfo('often', stub, [PeriodTrigger(seconds=0.1)], False), stub)
+            runner = asyncio.create_task(scheduler.start())
+            await clock.run(until=self.START + 2.55)
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        asyncio.run(main())
+
+        # The state on adding, then the states of 25 fires are collected for a second and written together.
+        # The batches are written by a thread, so the virtual clock may run ahead and make them bigger
+        assert 2 <= len(batches) <= 4
+        assert all(list(batch) == ['often'] for batch in batches)
+        assert store.closed
+        state = JsonJobStore(store.path).load('often')
+        assert state is not None and state.next_fire == now + timedelta(seconds=2.6)
@@ -0,0 +1,182 @@
+import asyncio
+
+import httpx
+import pytest
+
+from swiftbots import SwiftBots, TelegramBot
+from swiftbots.http_clients import HttpClientConfig, HttpClientRegistry
+from swiftbots.webhooks import WebhookConfig, WebhookServer
+
+
+def make_update(update_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'from': {'id': 7, 'username': 'tester'}, 'text': text},
+    }
+
+
+class TestTelegramBot:
+
+    @pytest.mark.timeout(3)
+    def test_updates_are_polled_in_batches(self):
+        bot = TelegramBot(token='token', greeting_enabled=False, updates_batch_size=50)
+        requests = []
+        batches = [[make_update(10, 'a'), make_update(11, 'b'), make_update(12, 'c')], [make_update(13, 'd')]]
+
+        async def fetch_async(method: str, data: dict, **kwargs) -> dict:
+            requests.append((method, dict(data)))
+            if method == 'deleteWebhook':
+                return {'ok': True, 'result': True}
+            if data['timeout'] == 0:  # skipping old updates
+                return {'ok': True, 'result': []}
+            return {'ok': True, 'result': batches.pop(0)}
+
+        bot.fetch_async = fetch_async
+
+        async def main():
+            listener = bot.telegram_listener()
+            return [(await listener.__anext__())['message'] for _ in range(4)]
+
+        assert asyncio.run(main()) == ['a', 'b', 'c', 'd']
+        # A webhook left by a previous run is removed first, or Telegram refuses the polling
+        assert requests.pop(0)[0] == 'deleteWebhook'
+        # The first request skips old updates, the next ones confirm the whole previous batch
+        assert [data['offset'] for _, data in requests] == [-1, -1, 13]
+        assert requests[1][1]['limit'] == 50
+
+    @pytest.mark.timeout(3)
+    def test_long_polling_has_own_connections(self):
+        registry = HttpClientRegistry(HttpClientConfig(max_connections=1))
+        app = SwiftBots(http_clients=registry)
+        first, second = TelegramBot(token='1', name='first'), TelegramBot(token='2', name='second')
+        app.add_bots([first, second])
+
+        async def main():
+            await first.before_start_async()
+            await second.before_start_async()
+            sessions = [first._TelegramBot__http_session, first._TelegramBot__polling_session,
+                        second._TelegramBot__http_session, second._TelegramBot__polling_session]
+            await registry.aclose()
+            return sessions
+
+        shared, first_polling, second_shared, second_polling = asyncio.run(main())
+        # Replies share a pool, but a hanging long poll can't take the connections of the replies or other bots
+        assert shared is second_shared
+        assert len({id(shared), id(first_polling), id(second_polling)}) == 3
+
+    @pytest.mark.timeout(3)
+    def test_webhook_listener(self):
+        config = WebhookConfig(url='https://example.com/telegram/hook', host='127.0.0.1', port=0, secret_token='s3cret')
+        bot = TelegramBot(token='token', greeting_enabled=False, webhook=config)
+        requests = []
+        registered = asyncio.Event()
+
+        async def fetch_async(method: str, data: dict, **kwargs) -> dict:
+            requests.append((method, data))
+            # The server is already listening when the webhook is registered
+            registered.set()
+            return {'ok': True, 'result': True}
+
+        bot.fetch_async = fetch_async
+
+        async def main():
+            listener = bot.listener_func()
+            first_update = asyncio.ensure_future(listener.__anext__())
+            await registered.wait()
+            assert bot.webhook_server is not None
+            url = f'http://127.0.0.1:{bot.webhook_server.port}/telegram/hook'
+            async with httpx.AsyncClient() as client:
+                refused = await client.post(url, json=make_update(1, 'forged'))
+                accepted = await client.post(url, json=make_update(2, 'hello'),
+                                             headers={'X-Telegram-Bot-Api-Secret-Token': 's3cret'})
+            data = await first_update
+            await listener.aclose()
+            return refused.status_code, accepted.status_code, data['message']
+
+        assert asyncio.run(main()) == (401, 200, 'hello')
+        assert requests[0][0] == 'setWebhook'
+        assert requests[0][1]['secret_token'] == 's3cret'
+
+    @pytest.mark.timeout(3)
+    def test_webhook_server_closes_open_connections(self):
+        config = WebhookConfig(url='https://example.com/hook', host='127.0.0.1', port=0, secret_token='s3cret')
+        updates = []
+
+        async def on_update(update: dict) -> None:
+            updates.append(update)
+
+        async def main():
+            server = WebhookServer(config, on_update)
+            await server.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            body = b'{"update_id": 1}'
+            writer.write(b'POST /hook HTTP/1.1\r\nX-Telegram-Bot-Api-Secret-Token: s3cret\r\n'
+                         b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+            response = await reader.readuntil(b'\r\n\r\n')
+            # The connection is kept alive and idle, like Telegram does, but it doesn't hold the server
+            await asyncio.wait_for(server.close(), 1)
+            closed = await reader.read() == b''
+            writer.close()
+            return response.split(b'\r\n', 1)[0], closed
+
+        assert asyncio.run(main()) == (b'HTTP/1.1 200 OK', True)
+        assert updates == [{'update_id': 1}]
+
+    @pytest.mark.timeout(3)
+    def test_webhook_server_drops_idle_connections(self):
+        config = WebhookConfig(url='https://example.com/hook', host='127.0.0.1', port=0, idle_timeout=0.1)
+
+        async def on_update(update: dict) -> None:
+            pass
+
+        async def main():
+            server = WebhookServer(config, on_update)
+            await server.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            data = await asyncio.wait_for(reader.read(), 1)
+            writer.close()
+            await server.close()
+            return data
+
+        assert asyncio.run(main()) == b''
+
+    @pytest.mark.timeout(3)
+    def test_flood_error_respects_retry_after(self):
+        bot = TelegramBot(token='token')
+        answers = [
+            {'ok': False, 'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 0.2}},
+            {'ok': True, 'result': {'message_id': 1}},
+        ]
+
+        class Response:
+            def __init__(self, answer: dict):
+                self.answer = answer
+
+            def json(self) -> dict:
+                return self.answer
+
+        class Session:
+            async def post(self, **kwargs):
+                return Response(answers.pop(0))
+
+        bot._TelegramBot__http_session = Session()
+        bot._TelegramBot__polling_session = Session()
+
+        async def fetch(method: str, data: dict) -> tuple[dict, float]:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            answer = await bot.fetch_async(method, data)
+            return answer, loop.time() - started
+
+        answer, elapsed = asyncio.run(fetch('sendMessage', {'chat_id': 5, 'text': 'hi'}))
+        assert answer['ok']
+        assert 0.2 <= elapsed < 1
+
+        # Long polling skips the limiter, but still waits as long as Telegram asks
+        answers.extend([
+            {'ok': False, 'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 0.2}},
+            {'ok': True, 'result': []},
+        ])
+        answer, elapsed = asyncio.run(fetch('getUpdates', {'offset': -1}))
+        assert answer == {'ok': True, 'result': []}
+        assert 0.2 <= elapsed < 1